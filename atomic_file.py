@@ -0,0 +1,60 @@
+"""
+Atomic writes of the small files next to the application, and the versioned JSON
+format of the caches.
+
+A file is written to a temporary file in the same folder, then replaces the file,
+so it is never left half written, even if the windows shuts down during the write.
+
+The caches (device_info, volume_snapshot) are JSON objects with a version:
+
+    {"version": N, ...}
+
+A file of another version, or which cannot be read, is treated as missing, so a
+cache of an older or newer application is ignored rather than misread.
+"""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+
+
+def write_atomic(path: Path, data: bytes):
+    """
+    Write data to the file in one step. Raise OSError if it cannot be written;
+    the file is left as it was in that case.
+    """
+    path = Path(path)
+    fd, temp_name = tempfile.mkstemp(prefix=path.name, suffix='.tmp', dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_name, path)
+    except BaseException:
+        try:
+            os.remove(temp_name)
+        except OSError:
+            pass
+        raise
+
+
+def load_versioned(path: Path, version: int) -> dict | None:
+    """
+    Return the JSON object of the file, or None if the file does not exist, cannot
+    be read, or is not of the version.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get('version') != version:
+        return None
+    return data
+
+
+def dump_versioned(version: int, **values) -> bytes:
+    """
+    Return the compact UTF-8 JSON of {"version": version, **values}.
+    """
+    return json.dumps({'version': version, **values}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
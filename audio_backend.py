@@ -0,0 +1,210 @@
+"""
+Audio backend selection.
+
+The mute logic talks to an audio backend through the AudioBackend protocol.
+core_audio.CoreAudio is the backend for Windows. The 'simulated' backend runs the
+same CoreAudio over the simulated COM objects of simulated_audio, anywhere.
+
+The backend is selected by set_backend() (e.g. from the 'backend' setting), or else
+by the WIN_AUTO_MUTE_BACKEND environment variable, or else 'core_audio'.
+The backend modules are imported only when they are selected.
+
+Instead of a name, set_backend() also takes a provider: an object with
+backend(registry) returning a new backend session, notification_source()
+returning a device_registry.NotificationSource of its devices, and
+session_source(flows) returning a session_registry.SessionSource
+(e.g. simulated_audio.SimulatedAudioSystem).
+"""
+
+import importlib
+import os
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Protocol
+
+from core_audio_constants import EDataFlow
+
+ENV_BACKEND = 'WIN_AUTO_MUTE_BACKEND'
+
+BACKEND_CORE_AUDIO = 'core_audio'
+BACKEND_SIMULATED  = 'simulated'
+
+# Volumes closer than this are the same, so the volume is not set again.
+VOLUME_EPSILON = 1e-4
+
+
+@dataclass
+class DeviceResult:
+    """
+    Result of AudioBackend.apply() for one device.
+
+    mute and volume are the values which the device has now, or None if not requested.
+    applied is the number of set calls which were made, and skipped the number of
+    set calls which were not made because the device already had the value.
+    previous_mute and previous_volume are the values which the device had before,
+    or None if not read (see volume_snapshot).
+    error is the message of the error which stopped the device, or None.
+    duration is the time (sec) spent on the device.
+    """
+    device_id: str
+    name: str = ''
+    mute: bool | None = None
+    volume: float | None = None
+    error: str | None = None
+    duration: float | None = None
+    applied: int = 0
+    skipped: int = 0
+    previous_mute: bool | None = None
+    previous_volume: float | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class AudioBackend(Protocol):
+    """
+    Operations the mute logic needs from an audio backend.
+    See core_audio.CoreAudio for the meaning of each method.
+    """
+
+    def __enter__(self) -> 'AudioBackend': ...
+    def __exit__(self, exc_type, exc_value, traceback): ...
+    def open(self): ...
+    def close(self): ...
+    def forget_device(self, device_id=None): ...
+    def device_states(self) -> dict: ...
+    def get_default_audio_device_id(self, role: int, flow: int = 0) -> str: ...
+    def audio_device_id_list(self, flows=EDataFlow.SPEAKERS) -> list: ...
+    def get_device_info(self, device_id): ...
+    def get_friendly_name(self, device_id) -> str: ...
+    def get_device_properties(self, device_id) -> tuple: ...
+    def get_volume(self, device_id) -> float: ...
+    def get_mute(self, device_id) -> bool: ...
+    def get_states(self, device_ids, mute: bool = True, volume: bool = True) -> dict: ...
+    def set_volume(self, device_id, volume: float): ...
+    def set_mute(self, device_id, mute: bool): ...
+    def prepare(self, device_ids=None, flows=EDataFlow.SPEAKERS) -> dict: ...
+    def apply(self, device_ids=None, mute: bool | None = None, volume: float | None = None, flows=EDataFlow.SPEAKERS) -> list: ...
+    def apply_sessions(self, sessions, mute: bool | None = None, volume: float | None = None) -> list: ...
+
+
+def needs_mute(current: bool | None, mute: bool) -> bool:
+    """
+    Return True if the mute state must be set. An unknown state (None) is set.
+    """
+    return current is None or bool(current) != mute
+
+
+def needs_volume(current: float | None, volume: float) -> bool:
+    """
+    Return True if the volume must be set. An unknown volume (None) is set.
+    """
+    return current is None or abs(current - volume) > VOLUME_EPSILON
+
+
+# Backend name or provider
+_backend = None
+
+
+def set_backend(backend):
+    """
+    Select the backend by name ('core_audio' or 'simulated'), or by a provider.
+    None resets the selection to the environment variable or the default.
+    """
+    global _backend
+
+    if isinstance(backend, str) and backend not in (BACKEND_CORE_AUDIO, BACKEND_SIMULATED):
+        raise ValueError(f'Unknown audio backend: {backend}')
+    _backend = backend
+
+
+def _selected():
+    return _backend or os.environ.get(ENV_BACKEND) or BACKEND_CORE_AUDIO
+
+
+def backend_name() -> str:
+    """
+    Return the name of the selected backend, or the class name of the provider.
+    """
+    backend = _selected()
+    if isinstance(backend, str):
+        return backend
+    return type(backend).__name__
+
+
+def preload():
+    """
+    Import the modules of the selected backend (e.g. comtypes and pycaw) without
+    opening a session, so that the first mute does not wait for the import.
+
+    Importing comtypes enters a COM apartment on the importing thread, which only
+    the main thread leaves at exit. On another thread (the pre-warm), the apartment
+    is left here, so the thread ends with COM balanced.
+    """
+    backend = _selected()
+    if backend == BACKEND_CORE_AUDIO:
+        imported = 'comtypes' in sys.modules
+        importlib.import_module('core_audio')
+        com = importlib.import_module('core_audio_com')
+        if not imported and threading.current_thread() is not threading.main_thread():
+            com.CoUninitialize()
+    elif backend == BACKEND_SIMULATED:
+        importlib.import_module('simulated_audio')
+
+
+def create_backend(registry=None) -> AudioBackend:
+    """
+    Return a backend session of the selected backend.
+    The device registry is used by the backends which support it.
+    """
+    backend = _selected()
+    if not isinstance(backend, str):
+        return backend.backend(registry)
+
+    if backend == BACKEND_CORE_AUDIO:
+        from core_audio import CoreAudio
+        return CoreAudio(registry)
+    if backend == BACKEND_SIMULATED:
+        from simulated_audio import default_system
+        return default_system().backend(registry)
+
+    raise ValueError(f'Unknown audio backend: {backend}')
+
+
+def create_notification_source():
+    """
+    Return a device_registry.NotificationSource for the selected backend.
+    """
+    backend = _selected()
+    if not isinstance(backend, str):
+        return backend.notification_source()
+
+    if backend == BACKEND_CORE_AUDIO:
+        from core_audio import EndpointNotificationSource
+        return EndpointNotificationSource()
+    if backend == BACKEND_SIMULATED:
+        from simulated_audio import default_system
+        return default_system().notification_source()
+
+    raise ValueError(f'Unknown audio backend: {backend}')
+
+
+def create_session_source(flows=EDataFlow.SPEAKERS):
+    """
+    Return a session_registry.SessionSource for the selected backend, which tracks
+    the application sessions on the active devices of the data flows.
+    """
+    backend = _selected()
+    if not isinstance(backend, str):
+        return backend.session_source(flows)
+
+    if backend == BACKEND_CORE_AUDIO:
+        from core_audio import SessionNotificationSource
+        return SessionNotificationSource(flows)
+    if backend == BACKEND_SIMULATED:
+        from simulated_audio import default_system
+        return default_system().session_source(flows)
+
+    raise ValueError(f'Unknown audio backend: {backend}')
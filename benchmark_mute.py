@@ -0,0 +1,243 @@
+"""
+Benchmark of the mute latency versus the number of devices.
+
+Drives mute_all_speakers() and mute_current_speaker() for each device count and
+per-call latency, and reports the p50/p95/p99 wall time and the number of COM
+calls per pass. The passes run the real core_audio.CoreAudio over the simulated
+COM objects of simulated_audio, which count every call by method.
+
+The calls of the first pass and the most of the later passes are checked, method
+by method, against an itemized budget of
+    fixed + per_device * devices
+calls, so a change which adds a COM call fails the benchmark and names the method.
+Each item of the budget says why the call is needed; raise one only with a reason.
+
+Usage:
+    python benchmark_mute.py [--devices 1,2,4,...] [--latency 0,0.0002]
+                             [--repeat 10] [--output result.json]
+                             [--compare previous.json]
+
+Exit code is 1 if any call budget is exceeded, or if --compare finds more calls
+of any method than the previous result.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+from collections import Counter
+
+import audio_backend
+from mute_speakers import mute_all_speakers, mute_current_speaker
+from simulated_audio import SimulatedAudioSystem
+
+# Workers of the parallel scenario
+PARALLEL_WORKERS = 4
+
+# Budgets: method name -> (fixed calls, calls per device)
+
+# One backend session per pass.
+SESSION = {'CoInitialize': (1, 0), 'CoCreateInstance': (1, 0), 'CoUninitialize': (1, 0)}
+# The parallel pass enumerates in one session, and opens one more session per
+# worker, at most PARALLEL_WORKERS. The workers open the devices by their ID.
+PARALLEL_SESSION = {
+    'CoInitialize': (1 + PARALLEL_WORKERS, 0),
+    'CoCreateInstance': (1 + PARALLEL_WORKERS, 0),
+    'CoUninitialize': (1 + PARALLEL_WORKERS, 0),
+    'GetDevice': (0, 1),
+}
+# One enumeration of the active render devices, and the ID of each.
+ENUMERATION = {'EnumAudioEndpoints': (1, 0), 'GetCount': (1, 0), 'Item': (0, 1), 'GetId': (0, 1)}
+# The default device, opened again by its ID for the name and the endpoint volume.
+DEFAULT_DEVICE = {'GetDefaultAudioEndpoint': (1, 0), 'GetId': (1, 0), 'GetDevice': (1, 0)}
+# The IAudioEndpointVolume of each device, cast from Activate() without QueryInterface.
+# The interfaces are cached per backend session, and every pass opens a new session.
+ACTIVATE = {'Activate': (0, 1)}
+# The properties of each device (name, description, form factor) from one property
+# store. Cached after the first pass.
+NAME = {'OpenPropertyStore': (0, 1), 'GetValue': (0, 3)}
+# The mute state and the volume are read before they are set, so a silent device is skipped.
+READ = {'GetMute': (0, 1), 'GetMasterVolumeLevelScalar': (0, 1)}
+# The first pass mutes the devices; the later passes find them silent.
+SET = {'SetMute': (0, 1), 'SetMasterVolumeLevelScalar': (0, 1)}
+
+
+def budget(*items, devices: bool = True) -> dict:
+    """
+    Return the sum of the budget items. If devices is False, the pass handles one
+    device whatever the device count, so the per-device calls are fixed.
+    """
+    total = {}
+    for item in items:
+        for method, (fixed, per_device) in item.items():
+            if not devices:
+                fixed, per_device = fixed + per_device, 0
+            old_fixed, old_per_device = total.get(method, (0, 0))
+            total[method] = (old_fixed + fixed, old_per_device + per_device)
+    return total
+
+
+# scenario name -> (function, budget of the first pass, budget of the later passes)
+SCENARIOS = {
+    'mute_all_speakers': (
+        lambda: mute_all_speakers(True, True, False),
+        budget(SESSION, ENUMERATION, ACTIVATE, NAME, READ, SET),
+        budget(SESSION, ENUMERATION, ACTIVATE, READ),
+    ),
+    'mute_all_speakers_parallel': (
+        lambda: mute_all_speakers(True, True, False, PARALLEL_WORKERS),
+        budget(PARALLEL_SESSION, ENUMERATION, ACTIVATE, NAME, READ, SET),
+        budget(PARALLEL_SESSION, ENUMERATION, ACTIVATE, READ),
+    ),
+    'mute_current_speaker': (
+        lambda: mute_current_speaker(True, True, False),
+        budget(SESSION, DEFAULT_DEVICE, ACTIVATE, NAME, READ, SET, devices=False),
+        budget(SESSION, DEFAULT_DEVICE, ACTIVATE, READ, devices=False),
+    ),
+}
+
+
+def percentile(values: list, p: float) -> float:
+    """
+    Return the p-th percentile (0-100) of the values by the nearest-rank method.
+    """
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def over_budget(calls: dict, items: dict, devices: int) -> list:
+    """
+    Return the messages of the methods which are called more than their budget.
+    """
+    messages = []
+    for method, count in sorted(calls.items()):
+        fixed, per_device = items.get(method, (0, 0))
+        if count > fixed + per_device * devices:
+            messages.append(f'{method} {count} > {fixed + per_device * devices}')
+    return messages
+
+
+def run_case(scenario: str, devices: int, latency: float, repeat: int) -> dict:
+    function, first_budget, later_budget = SCENARIOS[scenario]
+
+    system = SimulatedAudioSystem(device_count=devices, latency=latency, seed=0)
+    audio_backend.set_backend(system)
+
+    times = []
+    calls = []
+    first = Counter()
+    later = Counter()
+    try:
+        for i in range(repeat):
+            system.reset_calls()
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+            calls.append(system.call_count())
+            if i == 0:
+                first = Counter(system.calls)
+            else:
+                later = later | system.calls
+    finally:
+        audio_backend.set_backend(None)
+
+    over = [f'first pass: {m}' for m in over_budget(first, first_budget, devices)]
+    over += [f'later passes: {m}' for m in over_budget(later, later_budget, devices)]
+    return {
+        'scenario': scenario,
+        'devices': devices,
+        'latency': latency,
+        'repeat': repeat,
+        'p50': percentile(times, 50),
+        'p95': percentile(times, 95),
+        'p99': percentile(times, 99),
+        'calls': max(calls),
+        'calls_budget': sum(f + p * devices for f, p in first_budget.values()),
+        'first_calls': dict(sorted(first.items())),
+        'later_calls': dict(sorted(later.items())),
+        'over_budget': over,
+        'ok': len(over) == 0,
+    }
+
+
+def compare(results: list, previous: dict) -> list:
+    """
+    Return the messages of the cases which call any method more than the previous result.
+    """
+    key = lambda r: (r['scenario'], r['devices'], r['latency'])
+    before = {key(r): r for r in previous.get('results', [])}
+
+    messages = []
+    for result in results:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        case = f"{result['scenario']} devices={result['devices']} latency={result['latency']}"
+        if 'first_calls' not in old:
+            # A result of version 1 has the total only.
+            if result['calls'] > old['calls']:
+                messages.append(f"{case}: calls {old['calls']} -> {result['calls']}")
+            continue
+        for passes in ('first_calls', 'later_calls'):
+            for method, count in result[passes].items():
+                if count > old[passes].get(method, 0):
+                    messages.append(f"{case}: {passes} {method} {old[passes].get(method, 0)} -> {count}")
+    return messages
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark of the mute latency versus the number of devices.')
+    parser.add_argument('--devices', default='1,2,4,8,16,32,64,128')
+    parser.add_argument('--latency', default='0,0.0002', help='per-call latency (sec), comma separated')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS))
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='compare the call counts with this JSON file')
+    args = parser.parse_args(argv)
+
+    device_counts = [int(v) for v in args.devices.split(',')]
+    latencies = [float(v) for v in args.latency.split(',')]
+    scenarios = args.scenario or list(SCENARIOS)
+
+    results = []
+    print(f"{'scenario':<28} {'devices':>7} {'latency':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'calls':>6} {'budget':>6}")
+    for scenario in scenarios:
+        for latency in latencies:
+            for devices in device_counts:
+                result = run_case(scenario, devices, latency, args.repeat)
+                results.append(result)
+                print(
+                    f"{scenario:<28} {devices:>7} {latency:>8} "
+                    f"{result['p50'] * 1000:>9.3f} {result['p95'] * 1000:>9.3f} {result['p99'] * 1000:>9.3f} "
+                    f"{result['calls']:>6} {result['calls_budget']:>6}"
+                    f"{'' if result['ok'] else '  OVER BUDGET'}"
+                )
+                for message in result['over_budget']:
+                    print(f'    {message}')
+
+    failed = [r for r in results if not r['ok']]
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(results, json.load(f))
+        for message in regressions:
+            print(f'More calls than before: {message}')
+        if len(regressions) > 0:
+            failed.append(regressions)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'version': 2,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, f, indent=2)
+
+    return 1 if len(failed) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
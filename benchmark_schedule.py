@@ -0,0 +1,98 @@
+"""
+Benchmark of the mute scheduler versus the number of rules.
+
+Builds random daily rules, runs the scheduler over a simulated week with an
+injected clock, and reports the time to compute the whole schedule, the mean time
+per timer event, and the number of timer wakeups.
+
+Each wakeup must be a due time of some rule, so the wakeups of a week are at most
+the number of distinct (weekday, time) of the rules, and the exit code is 1 if
+the scheduler wakes up more often.
+
+Usage:
+    python benchmark_schedule.py [--rules 10,100,1000,10000] [--days 7]
+"""
+
+import argparse
+import datetime
+import random
+import sys
+import time
+
+from mute_schedule import DAY_SETS, DailyRule, MuteScheduler
+
+
+class SimulatedClock:
+    def __init__(self, now: datetime.datetime):
+        self.now = now
+
+    def __call__(self) -> datetime.datetime:
+        return self.now
+
+
+def run_case(rule_count: int, days: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    rules = [
+        DailyRule(rng.randrange(24), rng.randrange(60), rng.choice(list(DAY_SETS.values())))
+        for _ in range(rule_count)
+    ]
+
+    start_time = datetime.datetime(2026, 1, 5) # Monday
+    clock = SimulatedClock(start_time)
+    timer = [None]
+    fired = []
+    scheduler = MuteScheduler(fired.append, lambda seconds: timer.__setitem__(0, seconds), clock)
+
+    start = time.perf_counter()
+    scheduler.set_rules(rules)
+    reschedule = time.perf_counter() - start
+
+    end_time = start_time + datetime.timedelta(days=days)
+    wakeups = 0
+    start = time.perf_counter()
+    while timer[0] is not None and clock.now + datetime.timedelta(seconds=timer[0]) < end_time:
+        clock.now += datetime.timedelta(seconds=timer[0])
+        scheduler.on_timer()
+        wakeups += 1
+    elapsed = time.perf_counter() - start
+
+    # (day, hour, minute) at which some rule is due
+    due_times = {
+        (day, rule.hour, rule.minute)
+        for rule in rules
+        for day in range(days)
+        if (start_time + datetime.timedelta(days=day)).weekday() in rule.days
+    }
+
+    return {
+        'rules': rule_count,
+        'reschedule_ms': reschedule * 1000,
+        'per_event_us': elapsed / max(1, wakeups) * 1_000_000,
+        'wakeups': wakeups,
+        'fired': len(fired),
+        'ok': wakeups <= len(due_times),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark of the mute scheduler versus the number of rules.')
+    parser.add_argument('--rules', default='10,100,1000,10000')
+    parser.add_argument('--days', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f"{'rules':>7} {'reschedule ms':>14} {'per event us':>13} {'wakeups':>8} {'fired':>6}")
+    for rule_count in (int(v) for v in args.rules.split(',')):
+        result = run_case(rule_count, args.days)
+        failed = failed or not result['ok']
+        print(
+            f"{result['rules']:>7} {result['reschedule_ms']:>14.3f} {result['per_event_us']:>13.1f} "
+            f"{result['wakeups']:>8} {result['fired']:>6}"
+            f"{'' if result['ok'] else '  EXTRA WAKEUPS'}"
+        )
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
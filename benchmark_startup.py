@@ -0,0 +1,152 @@
+"""
+Benchmark of the start-up cost of the command line mode versus the tray application.
+
+Runs each case in a fresh interpreter with `-X importtime`, and reports the median
+wall time, the total import time and the number of imported modules.
+
+| Case          | What runs |
+|---------------|-----------|
+| cli_list      | `python -m win_auto_mute list` against the simulated backend. |
+| cli_import    | `import mute_cli` only. |
+| tray_import   | `import win_auto_mute`, which binds the Win32 functions (win32_stub elsewhere). |
+| tray_setup    | `WinMain()` up to its message loop (the window, the controls, the tray icon, the settings and the threads), then on_destroy(). |
+
+The command line cases must not import any of the Win32 UI modules (UI_MODULES),
+and the tray application must not import the audio stack (AUDIO_MODULES) before
+its icon is shown. The exit code is 1 if they do. Outside Windows, the tray cases
+run with the Win32 functions of win32_stub, so the imports are checked on any OS.
+There, the Win32 calls cost nothing, so tray_setup times the Python side of the
+set-up only.
+--top N also lists the N slowest imports of each case.
+
+Usage:
+    python benchmark_startup.py [--repeat 10] [--top 0] [--output result.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import audio_backend
+
+# Modules which only the tray application needs
+UI_MODULES = {'winapi_constants', 'settings_watcher'}
+# Modules which the tray application loads after its icon is shown
+AUDIO_MODULES = {'comtypes', 'pycaw', 'core_audio', 'core_audio_com'}
+
+# Installs the Win32 stub outside Windows (see win32_stub)
+WIN32 = 'import win32_stub; win32_stub.install(); '
+
+# WM_QUIT is posted first, so the message loop of WinMain ends as soon as it starts.
+# Then the tray icon is removed, as on_close() does, and on_destroy() stops the rest;
+# the window is not destroyed, since its messages are no longer dispatched.
+TRAY_SETUP = (
+    'import win_auto_mute as app; '
+    'app.PostQuitMessage(0); '
+    "app.WinMain(b'win_auto_mute', b'win_auto_mute'); "
+    'app.Shell_NotifyIcon(app.NIM_DELETE, app.pointer(app.nid)); '
+    'app.on_destroy(app.hmain, 0, 0)'
+)
+
+# case name -> (arguments of python, modules it must not import)
+CASES = {
+    'cli_list':    (['-m', 'win_auto_mute', 'list'], UI_MODULES),
+    'cli_import':  (['-c', 'import mute_cli'], UI_MODULES),
+    'tray_import': (['-c', WIN32 + 'import win_auto_mute'], AUDIO_MODULES),
+    'tray_setup':  (['-c', WIN32 + TRAY_SETUP], AUDIO_MODULES),
+}
+
+
+def parse_importtime(stderr: str) -> tuple:
+    """
+    Return (total import time in us, {imported module name: cumulative us}) from
+    the `-X importtime` output.
+    """
+    total = 0
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative)
+        # Top-level imports are not indented.
+        if not name.startswith('  '):
+            total += int(cumulative)
+    return total, modules
+
+
+def run_case(case: str, repeat: int) -> dict:
+    args, forbidden = CASES[case]
+    folder = Path(__file__).resolve().parent
+    env = dict(os.environ, **{audio_backend.ENV_BACKEND: audio_backend.BACKEND_SIMULATED})
+
+    times = []
+    imports = []
+    modules = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', *args],
+            cwd=folder, env=env, capture_output=True, text=True
+        )
+        times.append(time.perf_counter() - start)
+        if completed.returncode != 0:
+            raise RuntimeError(f'{case} failed: {completed.stderr.splitlines()[-1:]}')
+        total, modules = parse_importtime(completed.stderr)
+        imports.append(total)
+
+    return {
+        'case': case,
+        'repeat': repeat,
+        'wall_ms': statistics.median(times) * 1000,
+        'import_ms': statistics.median(imports) / 1000,
+        'modules': len(modules),
+        'slowest': sorted(modules.items(), key=lambda m: m[1], reverse=True),
+        # A package counts with its submodules (e.g. pycaw.api).
+        'forbidden': sorted(m for m in modules if m.split('.')[0] in forbidden or m in forbidden),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark of the start-up cost of the command line mode.')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--top', type=int, default=0, help='list the N slowest imports of each case')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    results = []
+    failed = False
+    print(f"{'case':<12} {'wall ms':>9} {'import ms':>10} {'modules':>8}")
+    for case in CASES:
+        result = run_case(case, args.repeat)
+        bad = len(result['forbidden']) > 0
+        failed = failed or bad
+        print(
+            f"{case:<12} {result['wall_ms']:>9.1f} {result['import_ms']:>10.1f} {result['modules']:>8}"
+            f"{'  IMPORTS: ' + ','.join(result['forbidden']) if bad else ''}"
+        )
+        for name, us in result['slowest'][:args.top]:
+            print(f'    {us / 1000:>8.1f} ms  {name}')
+        result['slowest'] = result['slowest'][:args.top]
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'version': 1,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, f, indent=2)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,89 +1,368 @@
-import comtypes
-from pycaw.api.mmdeviceapi import IMMDeviceEnumerator, PROPERTYKEY
-from pycaw.api.endpointvolume import IAudioEndpointVolume
+import importlib
+import threading
+import time
+
 import core_audio_constants
+from audio_backend import DeviceResult, needs_mute, needs_volume
+from device_info import DeviceInfo, shared_cache
+from mute_profile import phase
+from session_registry import TrackedSession
+
+SPEAKERS = core_audio_constants.EDataFlow.SPEAKERS
+
+
+def default_com():
+    """
+    Return the COM layer of Windows (core_audio_com), imported on the first call,
+    so that this module can be imported without comtypes.
+    """
+    return importlib.import_module('core_audio_com')
+
+
+# (fmtid, pid) of the properties read into DeviceInfo
+PKEY_Device_FriendlyName = ('{A45C254E-DF1C-4EFD-8020-67D146A850E0}', 14)
+PKEY_Device_DeviceDesc = ('{A45C254E-DF1C-4EFD-8020-67D146A850E0}', 2)
+PKEY_AudioEndpoint_FormFactor = ('{1DA5D803-D492-4EDD-8C23-E0C0FFEE7F0E}', 0)
+DEVICE_PROPERTIES = (PKEY_Device_FriendlyName, PKEY_Device_DeviceDesc, PKEY_AudioEndpoint_FormFactor)
 
 
 class CoreAudio:
     """
-    Core Audio API wrap class
+    Core Audio API wrap class, and the audio_backend.AudioBackend for Windows.
+
+    One instance owns one COM apartment and one IMMDeviceEnumerator for its
+    lifetime, and caches the activated IAudioEndpointVolume per device ID.
+    The session is opened lazily by the first method call, or explicitly by
+    using the instance as a context manager.
+
+        with CoreAudio() as ca:
+            ca.set_mute(device_id, True)
+            ca.set_volume(device_id, 0)
+
+    COM apartments belong to a thread, so an instance must be used and closed
+    on the thread that opened it.
+
+    If a device_registry.DeviceRegistry is given, the device lists and the default
+    device are read from it instead of being enumerated on every call.
+    The properties of the devices are cached in a device_info.DeviceInfoCache,
+    by default the one shared by the process, so the names are read only once.
+    com is the COM layer (see core_audio_com), by default the one of Windows.
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, registry=None, info_cache=None, com=None):
+        self._com = default_com() if com is None else com
+        self._thread_id = None
+        self._device_enumerator = None
+        self._endpoint_volumes = {}
+        self._info_cache = shared_cache() if info_cache is None else info_cache
+        self._registry = registry
+        self._registry_generation = None
 
     def __del__(self):
-        pass
+        self.close()
+
+    def __enter__(self):
+        self.open()
+        return self
 
-    def get_default_audio_device_id(self, role: int) -> str:
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
         """
-        Return the default audio device ID with the following process.
+        Open the COM session with the following process.
 
         1. CoInitialize()
         2. IMMDeviceEnumerator = CoCreateInstance(...)
-        3. IMMDevice = IMMDeviceEnumerator::GetDefaultAudioEndpoint(...)
-        4. id = IMMDevice::GetId()
-        5. CoUninitialize()
         """
+        if self._device_enumerator is not None:
+            return
+
+        with phase('CoInitialize'):
+            self._com.CoInitialize()
+        self._thread_id = threading.get_ident()
 
-        comtypes.CoInitialize()
+        with phase('CoCreateInstance'):
+            self._device_enumerator = self._com.create_enumerator()
 
-        device_enumerator = comtypes.CoCreateInstance(
-            core_audio_constants.CLSID_MMDeviceEnumerator,
-            IMMDeviceEnumerator,
-            comtypes.CLSCTX_INPROC_SERVER,
-        )
+    def close(self):
+        """
+        Close the COM session with the following process.
 
-        device = device_enumerator.GetDefaultAudioEndpoint(
-            core_audio_constants.EDataFlow.eRender,
-            role,
-            # core_audio_constants.ERole.eConsole == 0 or
-            # core_audio_constants.ERole.eMultimedia == 1 or
-            # core_audio_constants.ERole.eCommunications == 2
-            # Actually, on the current windows version, the same device is returned regardless of the role.
-        )
+        1. IAudioEndpointVolume::Release() for every cached device
+        2. IMMDeviceEnumerator::Release()
+        3. CoUninitialize()
+        """
+        if self._device_enumerator is None:
+            return
 
-        id = device.GetId()
+        # CoUninitialize() must be called on the thread that called CoInitialize().
+        # If the instance is collected on another thread, leave the apartment alone.
+        if self._thread_id != threading.get_ident():
+            return
 
-        comtypes.CoUninitialize()
+        self._endpoint_volumes.clear()
+        self._device_enumerator = None
 
-        return id
+        with phase('CoUninitialize'):
+            self._com.CoUninitialize()
+        self._thread_id = None
 
-    def audio_device_id_list(self) -> list:
+    def forget_device(self, device_id=None):
         """
-        Enumerate Core Audio devices and return a list of GUIDs with the following process.
+        Drop the cached IAudioEndpointVolume of the device.
+        If device_id is None, drop all cached interfaces.
+        """
+        if device_id is None:
+            self._endpoint_volumes.clear()
+        else:
+            self._endpoint_volumes.pop(device_id, None)
 
-        1. CoInitialize()
-        2. IMMDeviceEnumerator = CoCreateInstance(...)
-        3. IMMDeviceCollection = IMMDeviceEnumerator::EnumAudioEndpoints(...)
-        4. IMMDevice = IMMDeviceCollection::Item(i)
-        5. id = IMMDevice::GetId()
-        6. CoUninitialize()
+    def _enumerator(self):
+        self.open()
+        return self._device_enumerator
+
+    def _sync_registry(self) -> bool:
+        """
+        Re-prime the registry if it is not ready, and drop the cached interfaces of
+        the devices which have gone away since the last call.
+        Return False if there is no registry.
+        """
+        if self._registry is None:
+            return False
+
+        if not self._registry.ready:
+            self._registry.reset(self.device_states())
+
+        if self._registry_generation != self._registry.generation:
+            for device_id in [d for d in self._endpoint_volumes if not self._registry.is_active(d)]:
+                self.forget_device(device_id)
+            self._registry_generation = self._registry.generation
+
+        return True
+
+    def _target_devices(self, device_ids, flows=SPEAKERS) -> list:
+        """
+        Return the device IDs as is, or if device_ids is None, the active devices of
+        the data flows from the registry (IDs) or from an enumeration (IMMDevice).
+        """
+        if device_ids is not None:
+            return list(device_ids)
+
+        if self._sync_registry():
+            return [id for flow in flows for id in self._registry.active_ids(flow)]
+
+        return self._enumerate(flows)
+
+    def _enumerate(self, flows) -> list:
+        """
+        Return the active IMMDevice of the data flows, in the order of the flows.
+
+        1. IMMDeviceCollection = IMMDeviceEnumerator::EnumAudioEndpoints(flow, ACTIVE)
+           for one data flow, or EnumAudioEndpoints(eAll, ACTIVE) for more
+        2. IMMDevice = IMMDeviceCollection::Item(i)
+        3. flow = IMMDevice::QueryInterface(IMMEndpoint)::GetDataFlow() (eAll only)
+
+        More than one data flow is read in one enumeration and split in memory.
+        """
+        single = len(flows) == 1
+        with phase('EnumAudioEndpoints'):
+            collections = self._enumerator().EnumAudioEndpoints( # type: ignore
+                flows[0] if single else core_audio_constants.EDataFlow.eAll,
+                core_audio_constants.DeviceState.ACTIVE,
+            )
+            devices = [collections.Item(i) for i in range(collections.GetCount())]
+
+        if single:
+            return devices
+
+        by_flow = {flow: [] for flow in flows}
+        with phase('GetDataFlow'):
+            for device in devices:
+                flow = device.QueryInterface(self._com.IMMEndpoint).GetDataFlow()
+                if flow in by_flow:
+                    by_flow[flow].append(device)
+        return [device for flow in flows for device in by_flow[flow]]
+
+    def _get_device(self, device_id):
+        """
+        IMMDevice = IMMDeviceEnumerator::GetDevice(ID)
+        """
+        enumerator = self._enumerator()
+        with phase('GetDevice', device_id):
+            return enumerator.GetDevice(device_id) # type: ignore
+
+    def _get_endpoint_volume(self, device_id, device=None):
+        """
+        Return the cached IAudioEndpointVolume of the device, or activate it.
+
+        1. IMMDevice = IMMDeviceEnumerator::GetDevice(ID) (if device is not given)
+        2. IAudioEndpointVolume = IMMDevice::Activate(IAudioEndpointVolume)
+        """
+        endpoint_volume = self._endpoint_volumes.get(device_id)
+        if endpoint_volume is not None:
+            return endpoint_volume
+
+        if device is None:
+            device = self._get_device(device_id)
+        with phase('Activate', device_id):
+            endpoint_volume = self._com.activate(device, self._com.IAudioEndpointVolume)
+        self._endpoint_volumes[device_id] = endpoint_volume
+
+        return endpoint_volume
+
+    def _call_endpoint_volume(self, device_id, method, *args, device=None):
+        """
+        Call the method of the IAudioEndpointVolume of the device.
+
+        If the cached interface fails (e.g. the device has gone away and come back),
+        drop it from the cache and retry once with a freshly activated interface.
+        """
+        cached = device_id in self._endpoint_volumes
+        try:
+            endpoint_volume = self._get_endpoint_volume(device_id, device)
+            with phase(method, device_id):
+                return getattr(endpoint_volume, method)(*args)
+        except self._com.COMError:
+            self.forget_device(device_id)
+            if not cached:
+                raise
+
+        endpoint_volume = self._get_endpoint_volume(device_id, device)
+        with phase(method, device_id):
+            return getattr(endpoint_volume, method)(*args)
+
+    def _read_device_info(self, device, device_id: str) -> DeviceInfo:
+        """
+        Read the properties of the IMMDevice from one property store into the cache.
+
+        1. IPropertyStore = IMMDevice::OpenPropertyStore(STGM_READ)
+        2. name = IPropertyStore::GetValue(PKEY_Device_FriendlyName).GetValue()
+        3. description = IPropertyStore::GetValue(PKEY_Device_DeviceDesc).GetValue()
+        4. form factor = IPropertyStore::GetValue(PKEY_AudioEndpoint_FormFactor).GetValue()
+        5. state, flow = the device registry, if any (no COM call)
+
+        All properties are read in the one pass, so the device rules and a later
+        reader never open the property store again while the record is cached.
+        """
+        with phase('OpenPropertyStore', device_id):
+            property_store = device.OpenPropertyStore(core_audio_constants.STGM.STGM_READ)
+
+            # Refer:
+            #   https://github.com/AndreMiras/pycaw/blob/develop/pycaw/utils.py
+
+            name, description, form_factor = (
+                property_store.GetValue(self._com.property_key(*key)).GetValue() for key in DEVICE_PROPERTIES
+            )
+
+        if form_factor is None:
+            form_factor = core_audio_constants.EndpointFormFactor.UnknownFormFactor
+        state, flow = None, None
+        if self._registry is not None:
+            state, flow = self._registry.device(device_id) or (None, None)
+        info = DeviceInfo(device_id, name or '', description or '', form_factor, state, flow)
+        self._info_cache.put(info)
+        return info
+
+    def _needs_device(self, device_id: str) -> bool:
+        """
+        Return True if the info or the IAudioEndpointVolume of the device is not cached,
+        so the IMMDevice is needed.
+        """
+        return self._info_cache.get(device_id) is None or device_id not in self._endpoint_volumes
+
+    def _device_info(self, device_id: str, device=None) -> DeviceInfo:
+        """
+        Return the cached DeviceInfo of the device, or read it.
+        device is the IMMDevice if it is at hand, to save IMMDeviceEnumerator::GetDevice.
+        """
+        info = self._info_cache.get(device_id)
+        if info is None:
+            if device is None:
+                device = self._get_device(device_id)
+            info = self._read_device_info(device, device_id)
+        return info
+
+    def device_states(self) -> dict:
+        """
+        Enumerate all Core Audio devices in any state, and return a dict of
+        device ID -> (state, data flow) with the following process.
+
+        1. IMMDeviceCollection = IMMDeviceEnumerator::EnumAudioEndpoints(eAll, DEVICE_STATEMASK_ALL)
+        2. IMMDevice = IMMDeviceCollection::Item(i)
+        3. id = IMMDevice::GetId()
+        4. state = IMMDevice::GetState()
+        5. flow = IMMDevice::QueryInterface(IMMEndpoint)::GetDataFlow()
+        """
+
+        with phase('EnumAudioEndpoints'):
+            collections = self._enumerator().EnumAudioEndpoints( # type: ignore
+                core_audio_constants.EDataFlow.eAll,
+                core_audio_constants.DeviceState.ALL,
+            )
+
+            states = {}
+            for i in range(collections.GetCount()):
+                device = collections.Item(i)
+                flow = device.QueryInterface(self._com.IMMEndpoint).GetDataFlow()
+                states[device.GetId()] = (device.GetState(), flow)
+
+        return states
+
+    def get_default_audio_device_id(self, role: int, flow: int = core_audio_constants.EDataFlow.eRender) -> str:
+        """
+        Return the default audio device ID of the data flow with the following process.
+
+        1. IMMDevice = IMMDeviceEnumerator::GetDefaultAudioEndpoint(...)
+        2. id = IMMDevice::GetId()
+
+        If the registry already knows the default device, it is returned without COM calls.
+        """
+
+        if self._sync_registry():
+            id = self._registry.default_id(flow, role)
+            if id is not None:
+                return id
+
+        with phase('GetDefaultAudioEndpoint'):
+            device = self._enumerator().GetDefaultAudioEndpoint(
+                flow,
+                role,
+                # core_audio_constants.ERole.eConsole == 0 or
+                # core_audio_constants.ERole.eMultimedia == 1 or
+                # core_audio_constants.ERole.eCommunications == 2
+                # Actually, on the current windows version, the same device is returned regardless of the role.
+            )
+
+            id = device.GetId()
+
+        if self._registry is not None:
+            self._registry.remember_default(flow, role, id)
+
+        return id
+
+    def audio_device_id_list(self, flows=SPEAKERS) -> list:
         """
+        Enumerate Core Audio devices of the data flows and return a list of GUIDs
+        with the following process.
 
-        comtypes.CoInitialize()
+        1. IMMDevice = each device of _enumerate(flows)
+        2. id = IMMDevice::GetId()
 
-        device_enumerator = comtypes.CoCreateInstance(
-            core_audio_constants.CLSID_MMDeviceEnumerator,
-            IMMDeviceEnumerator,
-            comtypes.CLSCTX_INPROC_SERVER,
-        )
+        Cached interfaces of the devices which are no longer active are dropped.
+        If there is a registry, the list is read from it without COM calls.
+        """
 
-        collections = device_enumerator.EnumAudioEndpoints( # type: ignore
-            core_audio_constants.EDataFlow.eRender,
-            core_audio_constants.DeviceState.ACTIVE,
-            # const.DeviceState.ACTIVE | const.DeviceState.UNPLUGGED,
-        )
+        if self._sync_registry():
+            return [id for flow in flows for id in self._registry.active_ids(flow)]
 
         devices = []
 
-        count = collections.GetCount()
-        for i in range(count):
-            device = collections.Item(i)
+        for device in self._enumerate(flows):
 
             # Refer:
             #   https://github.com/AndreMiras/pycaw/blob/develop/pycaw/utils.py
-            # 
+            #
             # property_store = device.OpenPropertyStore(const.STGM.STGM_READ)
             # property_count = property_store.GetCount()
             # for j in range(property_count):
@@ -95,200 +374,536 @@ class CoreAudio:
             id = device.GetId()
             devices.append(id)
 
-        comtypes.CoUninitialize()
+        for device_id in set(self._endpoint_volumes) - set(devices):
+            self.forget_device(device_id)
 
         return devices
 
+    def get_device_info(self, device_id) -> DeviceInfo:
+        """
+        Return the DeviceInfo of the device from the cache, or with the following process.
+
+        1. IMMDevice = IMMDeviceEnumerator::GetDevice(ID)
+        2. DeviceInfo = _read_device_info(IMMDevice)
+        """
+        return self._device_info(device_id)
+
     def get_friendly_name(self, device_id) -> str:
         """
-        Return the friendly name of the device from the device ID with the following process.
+        Return the friendly name of the device from the device ID.
+        """
+        return self._device_info(device_id).name
 
-        1. CoInitialize()
-        2. IMMDeviceEnumerator = CoCreateInstance(...)
-        3. IMMDevice = IMMDeviceEnumerator::GetDevice(ID)
-        4. IPropertyStore = IMMDevice::OpenPropertyStore(STGM_READ)
-        5. PROPERTYKEY = {A45C254E-DF1C-4EFD-8020-67D146A850E0}, 14
-        6. value = IPropertyStore::GetValue(PROPERTYKEY)
-        7. friendly_name = value.GetValue()
-        8. CoUninitialize()
+    def get_device_properties(self, device_id) -> tuple:
+        """
+        Return (friendly name, form factor) of the device from the device ID.
         """
+        info = self._device_info(device_id)
+        return info.name, info.form_factor
 
-        comtypes.CoInitialize()
+    def get_volume(self, device_id):
+        """
+        Return the master volume of the specified device.
 
-        device_enumerator = comtypes.CoCreateInstance(
-            core_audio_constants.CLSID_MMDeviceEnumerator,
-            IMMDeviceEnumerator,
-            comtypes.CLSCTX_INPROC_SERVER,
-        )
+        1. IAudioEndpointVolume = cached or activated interface of the device
+        2. volume = IAudioEndpointVolume::GetMasterVolumeLevelScalar()
+        """
 
-        device = device_enumerator.GetDevice(device_id) # type: ignore
-        property_store = device.OpenPropertyStore(core_audio_constants.STGM.STGM_READ)
+        volume = self._call_endpoint_volume(device_id, 'GetMasterVolumeLevelScalar')
 
-        # Refer:
-        #   https://github.com/AndreMiras/pycaw/blob/develop/pycaw/utils.py
-    
-        key = PROPERTYKEY()
-        key.fmtid = comtypes.GUID('{A45C254E-DF1C-4EFD-8020-67D146A850E0}')
-        key.pid = 14
+        return volume
 
-        value = property_store.GetValue(comtypes.pointer(key))
-        friendly_name = value.GetValue()
+    def get_mute(self, device_id):
+        """
+        Return the mute state of the specified device.
 
-        comtypes.CoUninitialize()
+        1. IAudioEndpointVolume = cached or activated interface of the device
+        2. mute = IAudioEndpointVolume::GetMute()
+        """
 
-        return friendly_name
+        mute = self._call_endpoint_volume(device_id, 'GetMute')
 
-    def get_volume(self, device_id):
+        return True if mute==1 else False
+
+    def get_states(self, device_ids, mute: bool = True, volume: bool = True) -> dict:
         """
-        Return the master volume of the specified device.
+        Read the master volume and/or the mute state of the devices over their cached
+        interfaces, and return a dict of device ID -> (volume, mute).
+        A value which is not requested, or which fails, is None.
 
-        1. CoInitialize()
-        2. IMMDeviceEnumerator = CoCreateInstance(...)
-        3. IMMDevice = IMMDeviceEnumerator::GetDevice(ID)
-        4. IUnknown = IMMDevice::Activate(...)
-        5. IAudioEndpointVolume = IUnknown::QueryInterface(IAudioEndpointVolume)
-        6. volume = IAudioEndpointVolume::GetMasterVolumeLevelScalar()
-        7. IAudioEndpointVolume::Release()
-        8. CoUninitialize()
+        1. IAudioEndpointVolume = cached or activated interface of the device
+        2. volume = IAudioEndpointVolume::GetMasterVolumeLevelScalar() (volume is True)
+        3. mute = IAudioEndpointVolume::GetMute() (mute is True)
         """
+        states = {}
+        for device_id in device_ids:
+            current_volume, current_mute = None, None
+            try:
+                if volume:
+                    current_volume = self._call_endpoint_volume(device_id, 'GetMasterVolumeLevelScalar')
+                if mute:
+                    current_mute = self._call_endpoint_volume(device_id, 'GetMute') == 1
+            except self._com.COMError:
+                pass
+            states[device_id] = (current_volume, current_mute)
+        return states
 
-        comtypes.CoInitialize()
+    def set_volume(self, device_id, volume: float):
+        """
+        Set the master volume of the specified device.
 
-        device_enumerator = comtypes.CoCreateInstance(
-            core_audio_constants.CLSID_MMDeviceEnumerator,
-            IMMDeviceEnumerator,
-            comtypes.CLSCTX_INPROC_SERVER,
-        )
+        1. IAudioEndpointVolume = cached or activated interface of the device
+        2. IAudioEndpointVolume::SetMasterVolumeLevelScalar(volume)
+        """
 
-        device = device_enumerator.GetDevice(device_id) # type: ignore
-        audio_endpoint_volume = device.Activate(
-            IAudioEndpointVolume._iid_, # type: ignore
-            comtypes.CLSCTX_ALL,
-            None,
-        )
+        self._call_endpoint_volume(device_id, 'SetMasterVolumeLevelScalar', volume, None)
 
-        endpoint_volume = audio_endpoint_volume.QueryInterface(IAudioEndpointVolume)
+    def set_mute(self, device_id, mute: bool):
+        """
+        Set the mute state of the specified device.
 
-        volume = endpoint_volume.GetMasterVolumeLevelScalar()
+        1. IAudioEndpointVolume = cached or activated interface of the device
+        2. IAudioEndpointVolume::SetMute(mute)
+        """
 
-        audio_endpoint_volume.Release()
+        self._call_endpoint_volume(device_id, 'SetMute', mute, None)
 
-        comtypes.CoUninitialize()
+    def prepare(self, device_ids=None, flows=SPEAKERS) -> dict:
+        """
+        Open the devices ahead of time and return a dict of device ID to friendly name.
 
-        return volume
+        If device_ids is None, all active devices of the data flows are prepared.
+        The IAudioEndpointVolume of each device is activated into the cache, so later
+        get/set calls on these devices cost only the call itself.
 
-    def get_mute(self, device_id):
+        1. IMMDevice = each device of _enumerate(flows) (device_ids is None)
+           or the device ID for each ID
+        2. For each device:
+           1. id = IMMDevice::GetId()
+           2. name = cached DeviceInfo, or _read_device_info(IMMDevice)
+           3. IAudioEndpointVolume = IMMDevice::Activate(...) into the cache
+           (IMMDeviceEnumerator::GetDevice(ID) only if 2. or 3. needs the IMMDevice)
+
+        A device which fails to open is returned with an empty name.
         """
-        Return the mute state of the specified device.
+        devices = self._target_devices(device_ids, flows)
+
+        names = {}
+        for device in devices:
+            device_id = device if isinstance(device, str) else device.GetId()
+            names[device_id] = ''
+            if isinstance(device, str):
+                device = None
+            try:
+                if device is None and self._needs_device(device_id):
+                    device = self._get_device(device_id)
+                names[device_id] = self._device_info(device_id, device).name
+                self._get_endpoint_volume(device_id, device)
+            except self._com.COMError:
+                pass
+
+        return names
+
+    def apply(self, device_ids=None, mute: bool | None = None, volume: float | None = None, flows=SPEAKERS) -> list:
+        """
+        Read the friendly name and set the mute state and/or the master volume of
+        the devices in one pass, and return a DeviceResult per device.
+
+        If device_ids is None, all active devices of the data flows are processed.
+        If mute or volume is None, it is left unchanged.
+
+        1. IMMDevice = each device of _enumerate(flows) (device_ids is None)
+           or the device ID for each ID
+        2. For each device:
+           1. id = IMMDevice::GetId()
+           2. name = cached DeviceInfo, or _read_device_info(IMMDevice)
+           3. IAudioEndpointVolume = cached interface or IMMDevice::Activate(...)
+           4. IAudioEndpointVolume::GetMute(), and SetMute(mute) if it differs
+           5. IAudioEndpointVolume::GetMasterVolumeLevelScalar(), and
+              SetMasterVolumeLevelScalar(volume) if it differs
+           (IMMDeviceEnumerator::GetDevice(ID) only if 2. or 3. needs the IMMDevice)
+
+        A set call which would not change the device is skipped, so the listeners of
+        the volume notifications (e.g. the volume mixer) are not woken up for nothing.
+
+        A COM error on one device is recorded in its result and does not stop the others.
+        """
+        devices = self._target_devices(device_ids, flows)
+
+        results = []
+        for device in devices:
+            start = time.perf_counter()
+            if isinstance(device, str):
+                result = DeviceResult(device)
+                device = None
+            else:
+                result = DeviceResult(device.GetId())
+
+            try:
+                if device is None and self._needs_device(result.device_id):
+                    device = self._get_device(result.device_id)
+                result.name = self._device_info(result.device_id, device).name
+
+                if mute is not None:
+                    current = self._call_endpoint_volume(result.device_id, 'GetMute', device=device) == 1
+                    result.previous_mute = current
+                    if needs_mute(current, mute):
+                        self._call_endpoint_volume(result.device_id, 'SetMute', mute, None, device=device)
+                        result.applied += 1
+                    else:
+                        result.skipped += 1
+                    result.mute = mute
+                if volume is not None:
+                    current = self._call_endpoint_volume(result.device_id, 'GetMasterVolumeLevelScalar', device=device)
+                    result.previous_volume = current
+                    if needs_volume(current, volume):
+                        self._call_endpoint_volume(result.device_id, 'SetMasterVolumeLevelScalar', volume, None, device=device)
+                        result.applied += 1
+                    else:
+                        result.skipped += 1
+                    result.volume = volume
+            except self._com.COMError as e:
+                result.error = str(e)
+
+            result.duration = time.perf_counter() - start
+            results.append(result)
+
+        if device_ids is None and self._registry is None:
+            for device_id in set(self._endpoint_volumes) - {r.device_id for r in results}:
+                self.forget_device(device_id)
+
+        return results
+
+    def apply_sessions(self, sessions, mute: bool | None = None, volume: float | None = None) -> list:
+        """
+        Set the mute state and/or the volume of the audio sessions, and return a
+        DeviceResult per session, with the session ID and the process name.
 
-        1. CoInitialize()
-        2. IMMDeviceEnumerator = CoCreateInstance(...)
-        3. IMMDevice = IMMDeviceEnumerator::GetDevice(ID)
-        4. IUnknown = IMMDevice::Activate(...)
-        5. IAudioEndpointVolume = IUnknown::QueryInterface(IAudioEndpointVolume)
-        6. mute = IAudioEndpointVolume::GetMute()
-        7. IAudioEndpointVolume::Release()
-        8. CoUninitialize()
+        sessions is a list of session_registry.TrackedSession, whose handle is the
+        ISimpleAudioVolume of the session, so no lookup is made here.
+
+        1. ISimpleAudioVolume::GetMute(), and SetMute(mute, NULL) if it differs
+        2. ISimpleAudioVolume::GetMasterVolume(), and SetMasterVolume(volume, NULL) if it differs
         """
+        results = []
+        for session in sessions:
+            start = time.perf_counter()
+            result = DeviceResult(session.session_id, session.process_name)
+            try:
+                if mute is not None:
+                    if needs_mute(session.handle.GetMute() == 1, mute):
+                        with phase('SetMute', session.session_id):
+                            session.handle.SetMute(mute, None)
+                        result.applied += 1
+                    else:
+                        result.skipped += 1
+                    result.mute = mute
+                if volume is not None:
+                    if needs_volume(session.handle.GetMasterVolume(), volume):
+                        with phase('SetMasterVolume', session.session_id):
+                            session.handle.SetMasterVolume(volume, None)
+                        result.applied += 1
+                    else:
+                        result.skipped += 1
+                    result.volume = volume
+            except self._com.COMError as e:
+                result.error = str(e)
+            result.duration = time.perf_counter() - start
+            results.append(result)
+        return results
+
+
+class _EndpointHandler:
+    """
+    Handler of the IMMNotificationClient, which forwards the notifications to a
+    DeviceRegistry.
 
-        comtypes.CoInitialize()
+    The notifications arrive on a thread of the audio service, so no COM calls are
+    made here. A newly added device is only known by its ID, so the registry is asked
+    to re-prime itself on the next read.
 
-        device_enumerator = comtypes.CoCreateInstance(
-            core_audio_constants.CLSID_MMDeviceEnumerator,
-            IMMDeviceEnumerator,
-            comtypes.CLSCTX_INPROC_SERVER,
-        )
+    The cached DeviceInfo of a device is forgotten when the device is added (it may
+    come back with another name) or when a property of DEVICE_PROPERTIES changes.
+    """
 
-        device = device_enumerator.GetDevice(device_id) # type: ignore
-        audio_endpoint_volume = device.Activate(
-            IAudioEndpointVolume._iid_, # type: ignore
-            comtypes.CLSCTX_ALL,
-            None,
-        )
+    def __init__(self, registry, info_cache):
+        self._registry = registry
+        self._info_cache = info_cache
 
-        endpoint_volume = audio_endpoint_volume.QueryInterface(IAudioEndpointVolume)
+    def on_device_added(self, device_id: str):
+        self._info_cache.forget(device_id)
+        self._registry.on_device_added(device_id)
 
-        mute = endpoint_volume.GetMute()
+    def on_device_removed(self, device_id: str):
+        self._registry.on_device_removed(device_id)
 
-        audio_endpoint_volume.Release()
+    def on_device_state_changed(self, device_id: str, state: int):
+        info = self._info_cache.get(device_id)
+        if info is not None:
+            info.state = state
+        self._registry.on_device_state_changed(device_id, state)
 
-        comtypes.CoUninitialize()
+    def on_default_device_changed(self, flow: int, role: int, device_id: str | None):
+        self._registry.on_default_device_changed(flow, role, device_id)
 
-        return True if mute==1 else False
+    def on_property_value_changed(self, device_id: str, fmtid: str, pid: int):
+        if (fmtid.upper(), pid) in DEVICE_PROPERTIES:
+            self._info_cache.forget(device_id)
+            self._registry.on_device_properties_changed(device_id)
 
-    def set_volume(self, device_id, volume: float):
-        """
-        Set the master volume of the specified device.
 
-        1. CoInitialize()
-        2. IMMDeviceEnumerator = CoCreateInstance(...)
-        3. IMMDevice = IMMDeviceEnumerator::GetDevice(ID)
-        4. IUnknown = IMMDevice::Activate(...)
-        5. IAudioEndpointVolume = IUnknown::QueryInterface(IAudioEndpointVolume)
-        6. volume = IAudioEndpointVolume::SetMasterVolumeLevelScalar(volume)
-        7. IAudioEndpointVolume::Release()
-        8. CoUninitialize()
-        """
+class EndpointNotificationSource:
+    """
+    device_registry.NotificationSource backed by IMMNotificationClient.
 
-        comtypes.CoInitialize()
+    start() registers the notification client and primes the registry with a full
+    enumeration. stop() must be called on the thread which called start().
+    """
 
-        device_enumerator = comtypes.CoCreateInstance(
-            core_audio_constants.CLSID_MMDeviceEnumerator,
-            IMMDeviceEnumerator,
-            comtypes.CLSCTX_INPROC_SERVER,
-        )
+    def __init__(self, com=None, info_cache=None):
+        self._com = com
+        self._info_cache = info_cache
+        self._ca = None
+        self._client = None
 
-        device = device_enumerator.GetDevice(device_id) # type: ignore
-        audio_endpoint_volume = device.Activate(
-            IAudioEndpointVolume._iid_, # type: ignore
-            comtypes.CLSCTX_ALL,
-            None,
-        )
+    def start(self, registry):
+        self._ca = CoreAudio(info_cache=self._info_cache, com=self._com)
+        self._client = self._ca._com.notification_client(_EndpointHandler(registry, self._ca._info_cache))
+        self._ca._enumerator().RegisterEndpointNotificationCallback(self._client) # type: ignore
 
-        endpoint_volume = audio_endpoint_volume.QueryInterface(IAudioEndpointVolume)
+        # Enumerate after registering, so that no change is missed in between.
+        registry.reset(self._ca.device_states())
 
-        guid = device_id.split('}.')[1]
-        endpoint_volume.SetMasterVolumeLevelScalar(volume, None)
+    def stop(self):
+        if self._ca is None:
+            return
 
-        audio_endpoint_volume.Release()
+        try:
+            self._ca._enumerator().UnregisterEndpointNotificationCallback(self._client) # type: ignore
+        finally:
+            self._client = None
+            self._ca.close()
+            self._ca = None
 
-        comtypes.CoUninitialize()
 
-    def set_mute(self, device_id, mute: bool):
-        """
-        Set the mute state of the specified device.
+class _SessionHandler:
+    """
+    Handler of the IAudioSessionNotification of one device, which adds the new
+    sessions to the source.
+    """
 
-        1. CoInitialize()
-        2. IMMDeviceEnumerator = CoCreateInstance(...)
-        3. IMMDevice = IMMDeviceEnumerator::GetDevice(ID)
-        4. IUnknown = IMMDevice::Activate(...)
-        5. IAudioEndpointVolume = IUnknown::QueryInterface(IAudioEndpointVolume)
-        6. mute = IAudioEndpointVolume::SetMute(mute)
-        7. IAudioEndpointVolume::Release()
-        8. CoUninitialize()
-        """
+    def __init__(self, source, device_id: str):
+        self._source = source
+        self._device_id = device_id
 
-        comtypes.CoInitialize()
+    def on_session_created(self, control):
+        self._source._track(control, self._device_id)
 
-        device_enumerator = comtypes.CoCreateInstance(
-            core_audio_constants.CLSID_MMDeviceEnumerator,
-            IMMDeviceEnumerator,
-            comtypes.CLSCTX_INPROC_SERVER,
-        )
 
-        device = device_enumerator.GetDevice(device_id) # type: ignore
-        audio_endpoint_volume = device.Activate(
-            IAudioEndpointVolume._iid_, # type: ignore
-            comtypes.CLSCTX_ALL,
-            None,
-        )
+class _SessionEventsHandler:
+    """
+    Handler of the IAudioSessionEvents of one session, which removes the session
+    when it expires.
+    """
 
-        endpoint_volume = audio_endpoint_volume.QueryInterface(IAudioEndpointVolume)
+    def __init__(self, source, session_id: str):
+        self._source = source
+        self._session_id = session_id
 
-        guid = device_id.split('}.')[1]
-        endpoint_volume.SetMute(mute, None)
+    def on_state_changed(self, state: int):
+        if state == core_audio_constants.AudioSessionState.Expired:
+            self._source._untrack(self._session_id)
 
-        audio_endpoint_volume.Release()
+    def on_session_disconnected(self):
+        self._source._untrack(self._session_id)
 
-        comtypes.CoUninitialize()
 
+class SessionNotificationSource:
+    """
+    session_registry.SessionSource backed by IAudioSessionNotification.
+
+    start() registers for the new sessions of the active devices of the data flows
+    and primes the registry with the current sessions, with the following process.
+
+    1. IMMDevice = each device of CoreAudio._enumerate(flows)
+    2. _open_device(IMMDevice):
+       1. IAudioSessionManager2 = IMMDevice::Activate(IAudioSessionManager2)
+       2. IAudioSessionManager2::RegisterSessionNotification(...)
+       3. IAudioSessionEnumerator = IAudioSessionManager2::GetSessionEnumerator()
+          (The notifications are not sent until the sessions are enumerated once.)
+       4. For each session:
+          1. IAudioSessionControl2 = IAudioSessionControl::QueryInterface(...)
+          2. id = IAudioSessionControl2::GetSessionInstanceIdentifier()
+          3. process name of IAudioSessionControl2::GetProcessId()
+          4. IAudioSessionControl2::RegisterAudioSessionNotification(...) for the expiry
+          5. ISimpleAudioVolume = IAudioSessionControl2::QueryInterface(ISimpleAudioVolume)
+
+    The new sessions are tracked from the notifications on a thread of the audio
+    service. The session interfaces are free-threaded, so the mute may run on any
+    thread. update() follows the devices which come and go, device by device.
+
+    An expired session is dropped from the registry at once. Its IAudioSessionEvents
+    must not be unregistered within its own callback, so it is unregistered by the
+    next update() or stop(). These must be called on the thread which called start().
+    """
+
+    def __init__(self, flows=SPEAKERS, com=None):
+        self._flows = flows
+        self._com = com
+        self._lock = threading.Lock()
+        self._ca = None
+        self._registry = None
+        self._managers = {} # device ID -> (IAudioSessionManager2, IAudioSessionNotification)
+        self._events = {}   # session ID -> (device ID, IAudioSessionControl2, IAudioSessionEvents)
+        self._expired = []  # (device ID, IAudioSessionControl2, IAudioSessionEvents) to unregister
+
+    def start(self, registry):
+        self._ca = CoreAudio(com=self._com)
+        self._registry = registry
+
+        sessions = []
+        try:
+            for device in self._ca._enumerate(self._flows):
+                sessions.extend(self._open_device(device.GetId(), device))
+        except Exception:
+            self.stop()
+            raise
+
+        registry.reset(sessions)
+
+    def update(self, device_ids):
+        """
+        Track the sessions of the active devices device_ids: stop tracking the devices
+        which are not in the list, and start tracking the new ones. The sessions of the
+        other devices are not enumerated again.
+        """
+        if self._ca is None:
+            return
+
+        self._release_expired()
+
+        device_ids = list(device_ids)
+        for device_id in [d for d in self._managers if d not in device_ids]:
+            self._close_device(device_id)
+
+        for device_id in device_ids:
+            if device_id in self._managers:
+                continue
+            try:
+                sessions = self._open_device(device_id, self._ca._get_device(device_id))
+            except self._ca._com.COMError:
+                # The device has gone away meanwhile.
+                continue
+            registry = self._registry
+            for session in sessions:
+                if registry is not None:
+                    registry.on_session_created(session)
+
+    def _open_device(self, device_id: str, device) -> list:
+        """
+        Register for the new sessions of the IMMDevice, and return the TrackedSession
+        of its current sessions.
+        """
+        com = self._ca._com
+        client = com.session_notification(_SessionHandler(self, device_id))
+        manager = com.activate(device, com.IAudioSessionManager2)
+        manager.RegisterSessionNotification(client)
+        self._managers[device_id] = (manager, client)
+
+        # Enumerate after registering, so that no session is missed in between.
+        sessions = []
+        enumerator = manager.GetSessionEnumerator()
+        for i in range(enumerator.GetCount()):
+            control = enumerator.GetSession(i).QueryInterface(com.IAudioSessionControl2)
+            if control.GetState() == core_audio_constants.AudioSessionState.Expired:
+                continue
+            session = self._open(control, device_id)
+            if session is not None:
+                sessions.append(session)
+        return sessions
+
+    def _close_device(self, device_id: str):
+        """
+        Unregister the notifications of the device and of its sessions, and drop
+        its sessions from the registry.
+        """
+        manager, client = self._managers.pop(device_id)
+        try:
+            manager.UnregisterSessionNotification(client)
+        except Exception:
+            pass
+
+        with self._lock:
+            session_ids = [id for id, (device, _, _) in self._events.items() if device == device_id]
+            entries = [self._events.pop(id) for id in session_ids]
+        self._unregister(entries)
+
+        registry = self._registry
+        for session_id in session_ids:
+            if registry is not None:
+                registry.on_session_expired(session_id)
+
+    def _open(self, control, device_id: str) -> TrackedSession | None:
+        """
+        Return the TrackedSession of an IAudioSessionControl2, and watch for its expiry.
+        """
+        com = self._ca._com
+        try:
+            session_id, process_name = com.session_identity(control)
+            events = com.session_events(_SessionEventsHandler(self, session_id))
+            control.RegisterAudioSessionNotification(events)
+            handle = control.QueryInterface(com.ISimpleAudioVolume)
+        except Exception:
+            # The session or its process has gone away meanwhile.
+            return None
+
+        with self._lock:
+            self._events[session_id] = (device_id, control, events)
+        return TrackedSession(session_id, process_name, handle)
+
+    def _track(self, control, device_id: str):
+        tracked = self._open(control, device_id)
+        registry = self._registry
+        if tracked is not None and registry is not None:
+            registry.on_session_created(tracked)
+
+    def _untrack(self, session_id: str):
+        with self._lock:
+            entry = self._events.pop(session_id, None)
+            if entry is not None:
+                self._expired.append(entry)
+
+        registry = self._registry
+        if registry is not None:
+            registry.on_session_expired(session_id)
+
+    def _release_expired(self):
+        with self._lock:
+            entries, self._expired = self._expired, []
+        self._unregister(entries)
+
+    @staticmethod
+    def _unregister(entries):
+        for _, control, events in entries:
+            try:
+                control.UnregisterAudioSessionNotification(events)
+            except Exception:
+                pass
+
+    def stop(self):
+        if self._ca is None:
+            return
+
+        self._registry = None
+        with self._lock:
+            entries = list(self._events.values()) + self._expired
+            self._events, self._expired = {}, []
+        self._unregister(entries)
+        for manager, client in self._managers.values():
+            try:
+                manager.UnregisterSessionNotification(client)
+            except Exception:
+                pass
+        self._managers = {}
+        self._ca.close()
+        self._ca = None
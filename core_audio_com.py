@@ -0,0 +1,129 @@
+"""
+The COM layer of core_audio: the comtypes and pycaw names which core_audio.CoreAudio
+uses besides the methods of the COM interfaces themselves.
+
+CoreAudio takes this module as its `com` layer by default. simulated_audio.SimulatedCom
+has the same names over simulated COM objects, so the CoreAudio logic runs, and is
+counted, without Windows.
+
+| Name                              | Meaning |
+|-----------------------------------|---------|
+| COMError                          | Error of a failed COM call. |
+| CoInitialize(), CoUninitialize()  | Enter and leave the COM apartment of the thread. |
+| create_enumerator()               | IMMDeviceEnumerator = CoCreateInstance(MMDeviceEnumerator) |
+| activate(device, interface)       | IMMDevice::Activate(interface), cast to the interface. |
+| property_key(fmtid, pid)          | Pointer to the PROPERTYKEY for IPropertyStore::GetValue. |
+| session_identity(control)         | (session instance ID, process file name) of an IAudioSessionControl2. |
+| notification_client(handler)      | IMMNotificationClient which calls handler.on_*() |
+| session_notification(handler)     | IAudioSessionNotification which calls handler.on_session_created(IAudioSessionControl2) |
+| session_events(handler)           | IAudioSessionEvents which calls handler.on_state_changed(state) and on_session_disconnected() |
+| IMMEndpoint, IAudioEndpointVolume, IAudioSessionManager2, IAudioSessionControl2, ISimpleAudioVolume | Interfaces for Activate and QueryInterface. |
+"""
+
+import ctypes
+
+import comtypes
+from comtypes import COMError
+from pycaw.api.audioclient import ISimpleAudioVolume
+from pycaw.api.audiopolicy import IAudioSessionControl2, IAudioSessionManager2
+from pycaw.api.endpointvolume import IAudioEndpointVolume
+from pycaw.api.mmdeviceapi import IMMDeviceEnumerator, IMMEndpoint, PROPERTYKEY
+from pycaw.callbacks import AudioSessionEvents, AudioSessionNotification, MMNotificationClient
+from pycaw.utils import AudioSession
+
+import core_audio_constants
+
+CLSID_MMDeviceEnumerator = comtypes.GUID(core_audio_constants.CLSID_MMDeviceEnumerator)
+
+
+def CoInitialize():
+    comtypes.CoInitialize()
+
+
+def CoUninitialize():
+    comtypes.CoUninitialize()
+
+
+def create_enumerator():
+    return comtypes.CoCreateInstance(
+        CLSID_MMDeviceEnumerator,
+        IMMDeviceEnumerator,
+        comtypes.CLSCTX_INPROC_SERVER,
+    )
+
+
+def activate(device, interface):
+    # Activate() already returns the requested interface, so no QueryInterface is needed.
+    return ctypes.cast(device.Activate(interface._iid_, comtypes.CLSCTX_ALL, None), ctypes.POINTER(interface))
+
+
+def property_key(fmtid: str, pid: int):
+    key = PROPERTYKEY()
+    key.fmtid = comtypes.GUID(fmtid)
+    key.pid = pid
+    return comtypes.pointer(key)
+
+
+def session_identity(control) -> tuple:
+    session = AudioSession(control)
+    process = session.Process
+    # The system sounds session has no process.
+    return session.InstanceIdentifier, '' if process is None else process.name()
+
+
+class _NotificationClient(MMNotificationClient):
+
+    def __init__(self, handler):
+        super().__init__()
+        self._handler = handler
+
+    def on_device_added(self, added_device_id):
+        self._handler.on_device_added(added_device_id)
+
+    def on_device_removed(self, removed_device_id):
+        self._handler.on_device_removed(removed_device_id)
+
+    def on_device_state_changed(self, device_id, new_state, new_state_id):
+        self._handler.on_device_state_changed(device_id, new_state_id)
+
+    def on_default_device_changed(self, flow, flow_id, role, role_id, default_device_id):
+        self._handler.on_default_device_changed(flow_id, role_id, default_device_id)
+
+    def on_property_value_changed(self, device_id, property_struct, fmtid, pid):
+        self._handler.on_property_value_changed(device_id, str(fmtid), pid)
+
+
+class _SessionNotification(AudioSessionNotification):
+
+    def __init__(self, handler):
+        super().__init__()
+        self._handler = handler
+
+    def on_session_created(self, new_session):
+        # pycaw hands the IAudioSessionControl2 wrapped in an AudioSession.
+        self._handler.on_session_created(new_session._ctl)
+
+
+class _SessionEvents(AudioSessionEvents):
+
+    def __init__(self, handler):
+        super().__init__()
+        self._handler = handler
+
+    def on_state_changed(self, new_state, new_state_id):
+        self._handler.on_state_changed(new_state_id)
+
+    def on_session_disconnected(self, disconnect_reason, disconnect_reason_id):
+        self._handler.on_session_disconnected()
+
+
+def notification_client(handler):
+    return _NotificationClient(handler)
+
+
+def session_notification(handler):
+    return _SessionNotification(handler)
+
+
+def session_events(handler):
+    return _SessionEvents(handler)
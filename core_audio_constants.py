@@ -1,16 +1,20 @@
-from comtypes import GUID
-
 # Refer:
 #   https://github.com/AndreMiras/pycaw/blob/develop/pycaw/constants.py
-CLSID_MMDeviceEnumerator = GUID('{BCDE0395-E52F-467C-8E3D-C4579291692E}')
+# Kept as a string so that this module can be imported without comtypes.
+CLSID_MMDeviceEnumerator = '{BCDE0395-E52F-467C-8E3D-C4579291692E}'
 
 class EDataFlow:
     # Refer:
     #   https://learn.microsoft.com/ja-jp/windows/win32/api/mmdeviceapi/ne-mmdeviceapi-edataflow
     eRender = 0
-    eCompute = 1
+    eCapture = 1
     eAll = 2
 
+    # Data flows of the devices to mute
+    SPEAKERS = (eRender,)
+    MICROPHONES = (eCapture,)
+    BOTH = (eRender, eCapture)
+
 
 class ERole:
     # Refer:
@@ -27,6 +31,7 @@ class DeviceState:
     DISABLED = 0x02
     NOTPRESENT = 0x04
     UNPLUGGED = 0x08
+    ALL = 0x0F
 
 
 class STGM:
@@ -36,3 +41,26 @@ class STGM:
     STGM_WRITE = 1
     STGM_READWRITE = 2
 
+
+class AudioSessionState:
+    # Refer:
+    #   https://learn.microsoft.com/ja-jp/windows/win32/api/audiosessiontypes/ne-audiosessiontypes-audiosessionstate
+    Inactive = 0
+    Active = 1
+    Expired = 2
+
+
+class EndpointFormFactor:
+    # Refer:
+    #   https://learn.microsoft.com/ja-jp/windows/win32/api/mmdeviceapi/ne-mmdeviceapi-endpointformfactor
+    RemoteNetworkDevice = 0
+    Speakers = 1
+    LineLevel = 2
+    Headphones = 3
+    Microphone = 4
+    Headset = 5
+    Handset = 6
+    UnknownDigitalPassthrough = 7
+    SPDIF = 8
+    DigitalAudioDisplayDevice = 9 # HDMI or DisplayPort monitor
+    UnknownFormFactor = 10
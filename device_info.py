@@ -0,0 +1,155 @@
+"""
+Properties of the audio devices, cached by device ID in memory and on disk.
+
+A DeviceInfo is read from one IPropertyStore of the device (see
+core_audio.CoreAudio._read_device_info): the friendly name, the description and
+the form factor. The state and the data flow come from the device registry, so
+they cost no COM call. The records are kept in a DeviceInfoCache, a bounded LRU
+shared by all backend sessions of the process. The cache is saved to
+`<name>.devices.json` next to the application, so the properties are known at the
+next start and at shutdown without opening the property stores again.
+
+An entry is forgotten when its device is added again or one of its properties
+changes (see core_audio._EndpointHandler), so a renamed device is read again.
+
+The file is small and versioned. It holds the properties, which do not change
+while the device is installed, but not the state, which is known again from the
+device registry of the next process.
+
+    {"version": 3, "devices": [[id, name, description, form_factor, flow], ...]}
+
+A file of another version, or which cannot be read, is ignored.
+"""
+
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from atomic_file import dump_versioned, load_versioned, write_atomic
+from get_path import get_script_basename, get_script_folder_path
+
+CACHE_VERSION = 3
+
+
+class DeviceInfo:
+    """
+    Properties of one audio endpoint device.
+    form_factor is an EndpointFormFactor, state a DeviceState and flow an EDataFlow.
+    state and flow are None if they are not known (e.g. without a device registry).
+    """
+    __slots__ = ('id', 'name', 'description', 'form_factor', 'state', 'flow')
+
+    def __init__(self, id: str, name: str = '', description: str = '', form_factor: int | None = None,
+                 state: int | None = None, flow: int | None = None):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.form_factor = form_factor
+        self.state = state
+        self.flow = flow
+
+    def to_list(self) -> list:
+        return [self.id, self.name, self.description, self.form_factor, self.flow]
+
+    @classmethod
+    def from_list(cls, values: list) -> 'DeviceInfo':
+        id, name, description, form_factor, flow = values
+        if not all(isinstance(v, str) for v in (id, name, description)) \
+                or not all(v is None or type(v) is int for v in (form_factor, flow)):
+            raise TypeError(f'Invalid device info: {values!r}')
+        return cls(id, name, description, form_factor, flow=flow)
+
+    def __repr__(self):
+        return f'DeviceInfo({self.id!r}, {self.name!r})'
+
+
+def default_cache_path() -> Path:
+    return get_script_folder_path() / (get_script_basename() + '.devices.json')
+
+
+class DeviceInfoCache:
+    """
+    Device ID -> DeviceInfo, least recently used first, up to max_entries.
+    """
+
+    def __init__(self, max_entries: int = 64, path: Path | None = None):
+        self.max_entries = max_entries
+        self.path = default_cache_path() if path is None else Path(path)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def get(self, device_id: str) -> DeviceInfo | None:
+        with self._lock:
+            info = self._entries.get(device_id)
+            if info is not None:
+                self._entries.move_to_end(device_id)
+            return info
+
+    def put(self, info: DeviceInfo):
+        with self._lock:
+            self._entries[info.id] = info
+            self._entries.move_to_end(info.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def forget(self, device_id: str | None = None):
+        with self._lock:
+            if device_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(device_id, None)
+            self._dirty = True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self) -> 'DeviceInfoCache':
+        """
+        Read the cache file, if it exists and is of this version.
+        """
+        data = load_versioned(self.path, CACHE_VERSION)
+        if data is None:
+            return self
+        try:
+            entries = [DeviceInfo.from_list(values) for values in data['devices']]
+        except (ValueError, TypeError, KeyError):
+            return self
+
+        with self._lock:
+            for info in entries[-self.max_entries:]:
+                self._entries[info.id] = info
+            self._dirty = False
+        return self
+
+    def save(self):
+        """
+        Write the cache file in one write, if anything has changed since it was read
+        or written. Raise OSError if it cannot be written.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            data = dump_versioned(CACHE_VERSION, devices=[info.to_list() for info in self._entries.values()])
+            self._dirty = False
+
+        try:
+            write_atomic(self.path, data)
+        except OSError:
+            self._dirty = True
+            raise
+
+
+_shared_cache = None
+
+
+def shared_cache() -> DeviceInfoCache:
+    """
+    Return the process-wide cache, which core_audio uses by default.
+    """
+    global _shared_cache
+
+    if _shared_cache is None:
+        _shared_cache = DeviceInfoCache()
+    return _shared_cache
@@ -0,0 +1,179 @@
+"""
+Registry of the audio endpoint devices, kept up to date by device notifications.
+
+The registry does not talk to Core Audio by itself. It is primed by reset() with a
+full enumeration, and then updated incrementally by a notification source calling
+the on_*() methods. core_audio.EndpointNotificationSource is the source backed by
+IMMNotificationClient; any object with start(registry) and stop() can be a source,
+so the update logic can be driven by synthetic notifications as well.
+
+When a notification cannot be applied incrementally (e.g. a device which was never
+enumerated changes state), the registry marks itself as not ready, and the next
+reader re-primes it with a fresh enumeration.
+"""
+
+import threading
+from typing import Protocol
+
+from core_audio_constants import DeviceState
+
+
+class NotificationSource(Protocol):
+    def start(self, registry: 'DeviceRegistry'): ...
+    def stop(self): ...
+
+
+class DeviceRegistry:
+    """
+    Device ID -> (state, data flow) map with O(1) lookups of the active devices
+    and the default devices.
+
+    generation is incremented on every change, so the readers can tell if something
+    they derived from the registry is stale. on_change(), if given, is called after
+    every change, on the thread of the change (e.g. a COM notification thread).
+    """
+
+    def __init__(self, on_change=None):
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._devices = {}  # device ID -> (state, data flow)
+        self._defaults = {} # (data flow, role) -> device ID
+        self._active = {}   # data flow -> tuple of active device IDs
+        self._source = None
+        self.generation = 0
+        self.ready = False
+
+    def start(self, source: NotificationSource):
+        """
+        Start receiving notifications from the source.
+        """
+        self.stop()
+        self._source = source
+        source.start(self)
+
+    def stop(self):
+        if self._source is not None:
+            self._source.stop()
+            self._source = None
+
+    def reset(self, devices: dict, defaults: dict | None = None):
+        """
+        Replace the whole registry with an enumeration.
+
+        devices is a dict of device ID -> (state, data flow).
+        defaults is a dict of (data flow, role) -> device ID.
+        """
+        with self._lock:
+            self._devices = dict(devices)
+            self._defaults = dict(defaults or {})
+            for flow in {flow for _, flow in self._devices.values()} | set(self._active):
+                self._rebuild_active(flow)
+            self.generation += 1
+            self.ready = True
+        self._changed()
+
+    def invalidate(self):
+        """
+        Mark the registry as out of date, so the next reader re-primes it.
+        """
+        with self._lock:
+            self.generation += 1
+            self.ready = False
+        self._changed()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def _rebuild_active(self, flow: int):
+        self._active[flow] = tuple(
+            device_id for device_id, (state, device_flow) in self._devices.items()
+            if device_flow == flow and state == DeviceState.ACTIVE
+        )
+
+    def on_device_added(self, device_id: str, state: int | None = None, flow: int | None = None):
+        """
+        A device was added. If its state or data flow is unknown, re-prime on the next read.
+        """
+        if state is None or flow is None:
+            self.invalidate()
+            return
+
+        with self._lock:
+            self._devices[device_id] = (state, flow)
+            self._rebuild_active(flow)
+            self.generation += 1
+        self._changed()
+
+    def on_device_removed(self, device_id: str):
+        with self._lock:
+            device = self._devices.pop(device_id, None)
+            if device is not None:
+                self._rebuild_active(device[1])
+            for key in [key for key, value in self._defaults.items() if value == device_id]:
+                del self._defaults[key]
+            self.generation += 1
+        self._changed()
+
+    def on_device_state_changed(self, device_id: str, state: int):
+        with self._lock:
+            device = self._devices.get(device_id)
+            if device is not None:
+                self._devices[device_id] = (state, device[1])
+                self._rebuild_active(device[1])
+                self.generation += 1
+        if device is not None:
+            self._changed()
+            return
+
+        # Unknown device: its data flow is unknown too.
+        self.invalidate()
+
+    def on_device_properties_changed(self, device_id: str):
+        """
+        A property of the device (e.g. its name) changed. Nothing in the registry
+        changes, but what the readers derived from the device (e.g. the device
+        rules) is stale.
+        """
+        with self._lock:
+            self.generation += 1
+        self._changed()
+
+    def on_default_device_changed(self, flow: int, role: int, device_id: str | None):
+        with self._lock:
+            if device_id:
+                self._defaults[(flow, role)] = device_id
+            else:
+                self._defaults.pop((flow, role), None)
+            self.generation += 1
+        self._changed()
+
+    def remember_default(self, flow: int, role: int, device_id: str):
+        """
+        Record a default device which a reader has looked up by itself.
+        This does not change the generation, because nothing has changed.
+        """
+        with self._lock:
+            self._defaults[(flow, role)] = device_id
+
+    def active_ids(self, flow: int) -> tuple:
+        """
+        Return the IDs of the active devices of the data flow.
+        """
+        return self._active.get(flow, ())
+
+    def device(self, device_id: str) -> tuple | None:
+        """
+        Return (state, data flow) of the device, or None if it is unknown.
+        """
+        return self._devices.get(device_id)
+
+    def is_active(self, device_id: str) -> bool:
+        device = self._devices.get(device_id)
+        return device is not None and device[0] == DeviceState.ACTIVE
+
+    def default_id(self, flow: int, role: int) -> str | None:
+        """
+        Return the default device ID of the data flow and role, or None if it is unknown.
+        """
+        return self._defaults.get((flow, role))
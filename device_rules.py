@@ -0,0 +1,167 @@
+"""
+Rules which select the devices to mute when all devices are targeted.
+
+The rules are read from the 'device_rules' setting.
+
+    {"include": [{"name": "Headset"}], "exclude": [{"form_factor": "hdmi"}]}
+
+| Rule                        | Matches |
+|-----------------------------|---------|
+| {"name": "<regex>"}         | Friendly names which contain the regular expression, in any case. |
+| {"id": "<device ID>"}       | The device of the ID, in any case. |
+| {"form_factor": "<name>"}   | Devices of the form factor, one of FORM_FACTORS (e.g. "hdmi", "headphones"). |
+
+A device is muted if it matches an include rule (or there are no include rules)
+and matches no exclude rule.
+
+The rules are compiled once when the settings are loaded: the name rules of each
+list into one combined regex, and the IDs and the form factors into sets.
+Names which cannot be combined (e.g. with an inline flag such as "(?i)") are
+compiled one by one instead.
+The decision of each device is memoized by device ID until the device registry
+changes, so the properties of a device are read only once.
+"""
+
+import re
+
+from core_audio_constants import EndpointFormFactor
+
+# Value of a form_factor rule -> EndpointFormFactor
+FORM_FACTORS = {
+    'remote':        EndpointFormFactor.RemoteNetworkDevice,
+    'speakers':      EndpointFormFactor.Speakers,
+    'line_level':    EndpointFormFactor.LineLevel,
+    'headphones':    EndpointFormFactor.Headphones,
+    'microphone':    EndpointFormFactor.Microphone,
+    'headset':       EndpointFormFactor.Headset,
+    'handset':       EndpointFormFactor.Handset,
+    'passthrough':   EndpointFormFactor.UnknownDigitalPassthrough,
+    'spdif':         EndpointFormFactor.SPDIF,
+    'hdmi':          EndpointFormFactor.DigitalAudioDisplayDevice,
+    'unknown':       EndpointFormFactor.UnknownFormFactor,
+}
+
+
+class _RuleList:
+    """
+    One compiled list of rules: a combined regex of the names, and sets of the
+    IDs and the form factors.
+    """
+
+    def __init__(self, rules, key: str):
+        names = []
+        self.ids = set()
+        self.form_factors = set()
+
+        if not isinstance(rules, (list, tuple)):
+            raise ValueError(f'Invalid device rules {key}: {rules!r}')
+        for rule in rules:
+            if not isinstance(rule, dict) or len(rule) != 1:
+                raise ValueError(f'Invalid device rule: {rule!r}')
+            (kind, value), = rule.items()
+            if not isinstance(value, str):
+                raise ValueError(f'Invalid device rule: {rule!r}')
+            if kind == 'name':
+                try:
+                    re.compile(value)
+                except re.error as e:
+                    raise ValueError(f'Invalid device rule name {value!r}: {e}') from None
+                names.append(value)
+            elif kind == 'id':
+                self.ids.add(value.lower())
+            elif kind == 'form_factor' and value in FORM_FACTORS:
+                self.form_factors.add(FORM_FACTORS[value])
+            else:
+                raise ValueError(f'Invalid device rule: {rule!r}')
+
+        self.names = []
+        if len(names) > 0:
+            try:
+                self.names = [re.compile('|'.join(f'(?:{name})' for name in names), re.IGNORECASE)]
+            except re.error:
+                # A global inline flag is only allowed at the start of a pattern.
+                self.names = [re.compile(name, re.IGNORECASE) for name in names]
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self.form_factors) + len(self.names)
+
+    @property
+    def needs_properties(self) -> bool:
+        return len(self.names) > 0 or len(self.form_factors) > 0
+
+    def matches(self, device_id: str, name: str, form_factor) -> bool:
+        return (
+            device_id.lower() in self.ids
+            or form_factor in self.form_factors
+            or any(pattern.search(name) is not None for pattern in self.names)
+        )
+
+
+class DeviceRules:
+    """
+    Compiled include and exclude rules, with the memoized decisions.
+    """
+
+    def __init__(self, include=(), exclude=()):
+        self.include = _RuleList(include, 'include')
+        self.exclude = _RuleList(exclude, 'exclude')
+        self._needs_properties = self.include.needs_properties or self.exclude.needs_properties
+        self._decisions = {} # device ID -> bool
+        self._generation = None
+
+    @classmethod
+    def from_setting(cls, value) -> 'DeviceRules':
+        """
+        Return the rules of the 'device_rules' setting. Raise ValueError if invalid.
+        """
+        if value is None:
+            return cls()
+        if not isinstance(value, dict) or not set(value) <= {'include', 'exclude'}:
+            raise ValueError(f'Invalid device rules: {value!r}')
+        return cls(value.get('include', []), value.get('exclude', []))
+
+    def __bool__(self) -> bool:
+        return len(self.include) > 0 or len(self.exclude) > 0
+
+    def select(self, device_ids, read_properties, generation=None) -> list:
+        """
+        Return the device IDs which the rules select, in the given order.
+
+        read_properties(device_id) returns (friendly name, form factor), and is
+        called only for the devices which are not decided yet and only if a rule
+        needs them. generation is the device registry generation, which drops
+        the memoized decisions when it changes.
+        """
+        if generation != self._generation:
+            self._decisions = {}
+            self._generation = generation
+
+        selected = []
+        for device_id in device_ids:
+            decision = self._decisions.get(device_id)
+            if decision is None:
+                decision = self._decide(device_id, read_properties)
+                if decision is None:
+                    # The properties could not be read. Decide by the include
+                    # rules alone, and try again next time.
+                    decision = len(self.include) == 0
+                else:
+                    self._decisions[device_id] = decision
+            if decision:
+                selected.append(device_id)
+        return selected
+
+    def _decide(self, device_id: str, read_properties) -> bool | None:
+        if device_id.lower() in self.exclude.ids:
+            return False
+
+        name, form_factor = '', None
+        if self._needs_properties:
+            try:
+                name, form_factor = read_properties(device_id)
+            except Exception:
+                return None
+
+        if len(self.include) > 0 and not self.include.matches(device_id, name, form_factor):
+            return False
+        return not self.exclude.matches(device_id, name, form_factor)
@@ -0,0 +1,72 @@
+"""
+Table-driven dispatch of window messages.
+
+WindowProc hands each message to MessageDispatcher.dispatch(), which looks up the
+handler in one of the following dicts.
+
+| Table    | Key                                              | Handler |
+|----------|--------------------------------------------------|---------|
+| messages | Message ID (uMsg)                                | handler(hwnd, wParam, lParam) |
+| commands | Command ID (LOWORD of wParam) of a menu command  | handler(hwnd, wParam, lParam) |
+| controls | Control handle (lParam) of a control's command   | handler(hwnd, wParam, lParam) |
+
+Handlers are added with on_message(), on_command() and on_control(), which is the
+way to add new triggers. They can be used as decorators.
+lParam is passed as an int. The return value of a message handler is the result
+of the message, and None means 0. WM_COMMAND always results in 0.
+
+This module does not use windll, so the dispatch can be tested on any OS with
+synthetic (uMsg, wParam, lParam) messages.
+"""
+
+from winapi_constants import WM_COMMAND
+
+
+class MessageDispatcher:
+
+    def __init__(self):
+        self.messages = {}
+        self.commands = {}
+        self.controls = {}
+        self.messages[WM_COMMAND] = self._dispatch_command
+
+    def on_message(self, message: int, handler=None):
+        return self._register(self.messages, message, handler)
+
+    def on_command(self, command_id: int, handler=None):
+        return self._register(self.commands, command_id, handler)
+
+    def on_control(self, hwnd_control: int, handler=None):
+        return self._register(self.controls, hwnd_control, handler)
+
+    def dispatch(self, hwnd, message: int, wParam: int, lParam: int):
+        """
+        Call the handler of the message and return its result.
+        Return None if the message has no handler, e.g. to call DefWindowProc.
+        """
+        handler = self.messages.get(message)
+        if handler is None:
+            return None
+        result = handler(hwnd, wParam, lParam)
+        return 0 if result is None else result
+
+    def _dispatch_command(self, hwnd, wParam: int, lParam: int):
+        # lParam is the handle of the control, or 0 for a menu.
+        if lParam:
+            handler = self.controls.get(lParam)
+        else:
+            handler = self.commands.get(wParam & 0xFFFF)
+        if handler is not None:
+            handler(hwnd, wParam, lParam)
+        return 0
+
+    @staticmethod
+    def _register(table: dict, key: int, handler):
+        if handler is None:
+            def decorator(function):
+                table[key] = function
+                return function
+            return decorator
+
+        table[key] = handler
+        return handler
@@ -0,0 +1,212 @@
+"""
+Command line mode of win_auto_mute, which runs without the tray icon and the Win32 UI.
+
+    python -m win_auto_mute [--devices speakers|microphones|both] mute [--all | --current] [--mute | --no-mute] [--volume | --no-volume]
+    python -m win_auto_mute [--devices speakers|microphones|both] status
+    python -m win_auto_mute [--devices speakers|microphones|both] list
+    python -m win_auto_mute restore
+
+Only the settings and the audio backend are imported.
+The options which are not given are taken from the settings file.
+The result is written to stdout as one JSON object.
+
+Exit code is 0 on success, 1 if a device failed or an error occurred, and 2 if the
+arguments are wrong.
+"""
+
+import argparse
+import json
+import sys
+
+import audio_backend
+import core_audio_constants
+import device_info
+import mute_log
+import mute_speakers
+from device_rules import DeviceRules
+from session_registry import SessionRegistry, SessionRules
+from settings import Settings
+from volume_snapshot import VolumeSnapshot, is_recorded
+
+
+def _default_ids(ca, flows) -> set:
+    ids = set()
+    for flow in flows:
+        try:
+            ids.add(ca.get_default_audio_device_id(core_audio_constants.ERole.eConsole, flow))
+        except Exception:
+            # No default device of this data flow
+            pass
+    return ids
+
+
+def _flows(args, settings: Settings) -> tuple:
+    return mute_speakers.device_flows(args.devices or settings.get('devices', 'speakers'))
+
+
+def command_mute(args, settings: Settings) -> dict:
+    mute   = settings['mute']   if args.mute   is None else args.mute
+    volume = settings['volume'] if args.volume is None else args.volume
+    target = settings['target'] if args.target is None else args.target
+
+    flows = _flows(args, settings)
+    rules = SessionRules.from_setting(settings.get('apps'))
+    sessions = None
+    if rules:
+        # One enumeration of the sessions, without waiting for the notifications.
+        sessions = SessionRegistry(rules)
+        sessions.start(audio_backend.create_session_source(flows))
+    try:
+        report = mute_speakers.process(mute, volume, target, settings['logging'], trigger='cli',
+                                       flows=flows, sessions=sessions,
+                                       device_rules=DeviceRules.from_setting(settings.get('device_rules')),
+                                       snapshot=VolumeSnapshot().load() if is_recorded(settings.get('restore', False)) else None)
+    finally:
+        if sessions is not None:
+            sessions.stop()
+
+    return {
+        'ok': all(r.ok for r in report.done) and not report.timed_out,
+        'applied': report.applied,
+        'skipped': report.skipped,
+        'mute': mute,
+        'volume': volume,
+        'target': 'apps' if rules else 'all' if target else 'current',
+        'devices': [
+            {
+                'id': r.device_id,
+                'name': r.name,
+                'mute': r.mute,
+                'volume': r.volume,
+                'error': r.error,
+                'duration': r.duration,
+                'applied': r.applied,
+                'skipped': r.skipped,
+            }
+            for r in report.done
+        ],
+        'pending': report.pending,
+    }
+
+
+def command_status(args, settings: Settings) -> dict:
+    flows = _flows(args, settings)
+    devices = []
+    with audio_backend.create_backend() as ca:
+        default_ids = _default_ids(ca, flows)
+        device_ids = ca.audio_device_id_list(flows)
+        states = ca.get_states(device_ids)
+        for device_id in device_ids:
+            device = {'id': device_id, 'default': device_id in default_ids}
+            try:
+                device['name'] = ca.get_friendly_name(device_id)
+            except Exception as e:
+                device['error'] = str(e)
+            device['volume'], device['mute'] = states[device_id]
+            if device['mute'] is None and 'error' not in device:
+                device['error'] = 'The state cannot be read'
+            devices.append(device)
+
+    return {'ok': all('error' not in d for d in devices), 'devices': devices}
+
+
+def command_list(args, settings: Settings) -> dict:
+    flows = _flows(args, settings)
+    with audio_backend.create_backend() as ca:
+        default_ids = _default_ids(ca, flows)
+        names = ca.prepare(None, flows)
+
+    return {
+        'ok': True,
+        'devices': [
+            {'id': device_id, 'name': name, 'default': device_id in default_ids}
+            for device_id, name in names.items()
+        ],
+    }
+
+
+def command_restore(args, settings: Settings) -> dict:
+    snapshot = VolumeSnapshot().load()
+    report = mute_speakers.restore_snapshot(snapshot, settings['logging'], trigger='cli')
+
+    return {
+        'ok': all(r.ok for r in report.done),
+        'applied': report.applied,
+        'skipped': report.skipped,
+        'devices': [
+            {
+                'id': r.device_id,
+                'mute': r.mute,
+                'volume': r.volume,
+                'error': r.error,
+                'applied': r.applied,
+                'skipped': r.skipped,
+            }
+            for r in report.done
+        ],
+        'remaining': len(snapshot),
+    }
+
+
+COMMANDS = {
+    'mute': command_mute,
+    'status': command_status,
+    'list': command_list,
+    'restore': command_restore,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='win_auto_mute', description='Mute speakers without the tray icon.')
+    parser.add_argument('--settings', help='settings file (default: win_auto_mute.json next to the application)')
+    parser.add_argument('--backend', choices=[audio_backend.BACKEND_CORE_AUDIO, audio_backend.BACKEND_SIMULATED])
+    parser.add_argument('--devices', choices=list(mute_speakers.DEVICE_FLOWS), help='devices to process (default: from the settings)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    mute = commands.add_parser('mute', help='mute and/or set volume to zero')
+    target = mute.add_mutually_exclusive_group()
+    target.add_argument('--all', dest='target', action='store_const', const=True, help='all speakers')
+    target.add_argument('--current', dest='target', action='store_const', const=False, help='the current default speaker')
+    mute.add_argument('--mute', action=argparse.BooleanOptionalAction, help='mute the speakers')
+    mute.add_argument('--volume', action=argparse.BooleanOptionalAction, help='set the volume to zero')
+
+    commands.add_parser('status', help='show mute and volume of the speakers')
+    commands.add_parser('list', help='list the active speakers')
+    commands.add_parser('restore', help='set the volumes back to before the last mute')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    try:
+        settings = Settings(args.settings).load()
+        backend = args.backend or settings.get('backend')
+        if backend:
+            audio_backend.set_backend(backend)
+        device_info.shared_cache().load()
+        if settings['logging']:
+            mute_log.configure(
+                settings.get('log_format', mute_log.FORMAT_TEXT),
+                settings.get('log_max_bytes', 1024 * 1024),
+                settings.get('log_backups', 3),
+            )
+
+        result = {'command': args.command, 'backend': audio_backend.backend_name()}
+        result.update(COMMANDS[args.command](args, settings))
+    except Exception as e:
+        result = {'command': args.command, 'ok': False, 'error': str(e)}
+
+    try:
+        device_info.shared_cache().save()
+    except OSError:
+        pass
+
+    json.dump(result, sys.stdout, ensure_ascii=False)
+    sys.stdout.write('\n')
+    return 0 if result['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,24 +1,191 @@
+"""
+Log of the mute operations.
+
+mute_log() and mute_event() only take the time and queue the record. A background
+thread formats the queued records and writes them in batches, with one file open
+per batch, so logging adds no file I/O to the mute path.
+Call flush() to wait until the queued records are written, e.g. before the
+process ends.
+
+The log is written in one of the following formats, selected by configure().
+
+| Format | File                | Line |
+|--------|---------------------|------|
+| text   | win_auto_mute.log   | 'yyyy/mm/dd HH:MM:SS : message' |
+| jsonl  | win_auto_mute.jsonl | One JSON object per line, with the fields of mute_event() |
+
+When the file grows over max_bytes, it is rotated to .1, .2, ... and at most
+`backups` old generations are kept.
+"""
+
+import atexit
+import datetime
+import json
 import os
+import queue
 import sys
-import datetime
+import threading
 
+FORMAT_TEXT  = 'text'
+FORMAT_JSONL = 'jsonl'
 
-def mute_log(msg: str):
-    log_file = ''
-    if hasattr(sys, '_MEIPASS'):
-        log_file  = os.path.join(sys._MEIPASS, 'win_auto_mute.log') # type: ignore
-    else:
-        full_path_name = os.path.abspath(sys.argv[0])
-        folder_name = os.path.dirname(full_path_name)
-        log_file  = os.path.join(folder_name, 'win_auto_mute.log')
+_format = FORMAT_TEXT
+_max_bytes = 1024 * 1024
+_backups = 3
+
+_log_folder = None
+_queue = queue.SimpleQueue()
+_writer = None
+_writer_lock = threading.Lock()
+_pending = 0
+_idle = threading.Condition()
+
+
+def configure(format: str = FORMAT_TEXT, max_bytes: int = 1024 * 1024, backups: int = 3):
+    """
+    Set the log format ('text' or 'jsonl') and the rotation.
+    max_bytes 0 disables the rotation.
+    """
+    global _format, _max_bytes, _backups
+
+    if format not in (FORMAT_TEXT, FORMAT_JSONL):
+        raise ValueError(f'Unknown log format: {format}')
+    _format = format
+    _max_bytes = max_bytes
+    _backups = backups
+
+
+def log_file_path() -> str:
+    """
+    Return the log file path of the current format.
+    The folder is resolved on the first call.
+    """
+    global _log_folder
+
+    if _log_folder is None:
+        if hasattr(sys, '_MEIPASS'):
+            _log_folder = sys._MEIPASS # type: ignore
+        else:
+            full_path_name = os.path.abspath(sys.argv[0])
+            _log_folder = os.path.dirname(full_path_name)
+
+    extension = '.jsonl' if _format == FORMAT_JSONL else '.log'
+    return os.path.join(_log_folder, 'win_auto_mute' + extension)
+
+
+def _format_record(record: tuple) -> str:
+    now, msg, event = record
+
+    if _format == FORMAT_JSONL:
+        fields = {'timestamp': now.isoformat(timespec='milliseconds')}
+        if event is None:
+            fields['message'] = msg
+        else:
+            fields.update(event)
+        return json.dumps(fields, ensure_ascii=False)
 
-    # Time
-    now = datetime.datetime.now()
     logtime = now.strftime('%Y/%m/%d %H:%M:%S')
+    return f'{logtime} : {msg}'
+
+
+def _rotate(log_file: str):
+    """
+    log_file -> log_file.1 -> log_file.2 ... and drop the oldest generation.
+    """
+    for i in range(_backups - 1, 0, -1):
+        older = f'{log_file}.{i}'
+        if os.path.exists(older):
+            os.replace(older, f'{log_file}.{i + 1}')
+
+    if _backups > 0:
+        os.replace(log_file, f'{log_file}.1')
+    else:
+        os.remove(log_file)
+
+
+def _write_loop():
+    global _pending
+
+    while True:
+        batch = [_queue.get()]
+        while True:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            log_file = log_file_path()
+            lines = ''.join(_format_record(record) + '\n' for record in batch)
+
+            if _max_bytes > 0 and os.path.exists(log_file):
+                if os.path.getsize(log_file) + len(lines.encode()) > _max_bytes:
+                    _rotate(log_file)
+
+            with open(log_file, 'a', encoding='utf-8') as f:
+                f.write(lines)
+        except OSError:
+            # Nobody to report to. Drop the batch rather than stop logging.
+            pass
+
+        with _idle:
+            _pending -= len(batch)
+            _idle.notify_all()
+
+
+def _start_writer():
+    global _writer
+
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name='mute_log', daemon=True)
+            _writer.start()
+
+
+def _put(msg: str, event: dict | None):
+    global _pending
+
+    with _idle:
+        _pending += 1
+    _queue.put((datetime.datetime.now(), msg, event))
+
+    if _writer is None:
+        _start_writer()
+
+
+def mute_log(msg: str):
+    _put(msg, None)
+
+
+def mute_event(trigger: str, device_id: str, name: str, action: str,
+               duration: float | None, result: str, msg: str):
+    """
+    Log an operation on a device.
+
+    trigger  : What started the operation (e.g. 'shutdown', 'mute_now').
+    action   : What was done (e.g. 'mute', 'volume', 'mute,volume', 'restore').
+    duration : Time (sec) spent on the device, or None.
+    result   : 'ok', 'skipped' (the device already had the values), 'pending'
+               or 'error: <message>'.
+    msg      : The line written in the text format.
+    """
+    _put(msg, {
+        'trigger': trigger,
+        'device_id': device_id,
+        'name': name,
+        'action': action,
+        'duration': duration,
+        'result': result,
+    })
+
+
+def flush(timeout: float | None = None) -> bool:
+    """
+    Wait until all queued records are written, or until the timeout (sec).
+    Return True if all records are written.
+    """
+    with _idle:
+        return _idle.wait_for(lambda: _pending == 0, timeout)
 
-    try:
-        with open(log_file, 'a') as f:
-            print(f'{logtime} : {msg}', file=f)
-    except Exception as e:
-        raise e
 
+atexit.register(flush, 1.0)
@@ -0,0 +1,131 @@
+"""
+Opt-in timing of the phases of the mute pipeline.
+
+    with mute_profile.phase('SetMute', device_id):
+        endpoint_volume.SetMute(True, None)
+
+While profiling is disabled, phase() returns a shared no-op context manager, so the
+cost is one function call and one global lookup.
+While it is enabled, each phase is recorded as
+    (phase name, device ID or None, start ns, duration ns, thread ID)
+in a fixed-size ring buffer, and the oldest records are dropped when it is full.
+
+Profiling is enabled by enable(), by the 'profile' setting, or by setting the
+WIN_AUTO_MUTE_PROFILE environment variable to 1 or to the path of a JSON file
+to dump to.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from mute_log import mute_log
+
+ENV_PROFILE = 'WIN_AUTO_MUTE_PROFILE'
+
+enabled = False
+_records = deque(maxlen=1024)
+_json_file = None
+
+_NULL_PHASE = contextlib.nullcontext()
+
+
+class _Phase:
+    __slots__ = ('name', 'device_id', 'start')
+
+    def __init__(self, name: str, device_id: str | None):
+        self.name = name
+        self.device_id = device_id
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter_ns() - self.start
+        _records.append((self.name, self.device_id, self.start, duration, threading.get_ident()))
+
+
+def phase(name: str, device_id: str | None = None):
+    """
+    Return a context manager which records the time spent in the phase.
+    """
+    if not enabled:
+        return _NULL_PHASE
+    return _Phase(name, device_id)
+
+
+def enable(capacity: int = 1024, json_file: str | None = None):
+    """
+    Enable profiling with a ring buffer of `capacity` records.
+    If json_file is given, dump() writes the records and the summary to it.
+    """
+    global enabled, _records, _json_file
+
+    if _records.maxlen != capacity:
+        _records = deque(_records, maxlen=capacity)
+    _json_file = json_file
+    enabled = True
+
+
+def disable():
+    global enabled
+
+    enabled = False
+
+
+def clear():
+    _records.clear()
+
+
+def records() -> list:
+    return list(_records)
+
+
+def summary() -> dict:
+    """
+    Return the count, total and max (ms) per phase, and the total (ms) per device.
+    """
+    phases = {}
+    devices = {}
+    for name, device_id, _, duration, _ in list(_records):
+        ms = duration / 1_000_000
+        entry = phases.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        entry['count'] += 1
+        entry['total_ms'] += ms
+        entry['max_ms'] = max(entry['max_ms'], ms)
+        if device_id is not None:
+            devices[device_id] = devices.get(device_id, 0.0) + ms
+
+    return {'phases': phases, 'devices': devices}
+
+
+def dump():
+    """
+    Write the summary to the log, and the records and the summary to the JSON file
+    if it is configured. The records are cleared afterwards.
+    """
+    result = summary()
+
+    for name, entry in result['phases'].items():
+        mute_log(f"profile: {name} count={entry['count']} total={entry['total_ms']:.3f}ms max={entry['max_ms']:.3f}ms")
+    for device_id, total in result['devices'].items():
+        mute_log(f'profile: {device_id} total={total:.3f}ms')
+
+    if _json_file:
+        result['records'] = [
+            {'phase': name, 'device_id': device_id, 'start_ns': start, 'duration_ns': duration, 'thread': thread}
+            for name, device_id, start, duration, thread in list(_records)
+        ]
+        with open(_json_file, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    clear()
+
+
+_env = os.environ.get(ENV_PROFILE)
+if _env:
+    enable(json_file=None if _env == '1' else _env)
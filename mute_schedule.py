@@ -0,0 +1,221 @@
+"""
+Scheduled mute, e.g. "mute at 18:00 on weekdays" or "mute after 30 minutes idle".
+
+The rules are read from the 'schedule' setting, a list of objects.
+
+| Rule                                  | Meaning |
+|---------------------------------------|---------|
+| {"at": "18:00"}                       | Every day at 18:00. |
+| {"at": "18:00", "days": "weekdays"}   | Monday to Friday. "daily", "weekdays", "weekends" or a list such as ["mon", "wed"]. |
+| {"idle_minutes": 30}                  | When the user has not used the keyboard or mouse for 30 minutes. |
+
+MuteScheduler keeps the next due time of each rule in a min-heap, and arms one
+timer for the earliest of them through set_timer(seconds or None), so nothing
+runs until a rule is due. on_timer() fires the due rules as one mute and arms the
+timer for the next one.
+
+The clock and the idle time are injected, so the schedule can be tested on any OS.
+"""
+
+import datetime
+import heapq
+
+TRIGGER_SCHEDULE = 'schedule'
+TRIGGER_IDLE     = 'idle'
+
+WEEKDAY_NAMES = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+DAY_SETS = {
+    'daily':    frozenset(range(7)),
+    'weekdays': frozenset(range(5)),
+    'weekends': frozenset((5, 6)),
+}
+
+
+class DailyRule:
+    """
+    Mute at a time of the day, on some days of the week.
+    """
+    trigger = TRIGGER_SCHEDULE
+
+    def __init__(self, hour: int, minute: int, days=DAY_SETS['daily']):
+        if not (0 <= hour < 24 and 0 <= minute < 60) or len(days) == 0:
+            raise ValueError(f'Invalid schedule: {hour:02}:{minute:02} {sorted(days)}')
+        self.hour = hour
+        self.minute = minute
+        self.days = frozenset(days)
+
+    def next_due(self, now: datetime.datetime, idle_seconds=None) -> datetime.datetime:
+        due = now.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if due <= now:
+            due += datetime.timedelta(days=1)
+        while due.weekday() not in self.days:
+            due += datetime.timedelta(days=1)
+        return due
+
+    def is_due(self, now: datetime.datetime, idle_seconds=None) -> bool:
+        return True
+
+    def __repr__(self):
+        days = ','.join(WEEKDAY_NAMES[d] for d in sorted(self.days))
+        return f'DailyRule({self.hour:02}:{self.minute:02} {days})'
+
+
+class IdleRule:
+    """
+    Mute when the user has been idle for `minutes`, once per idle period.
+    """
+    trigger = TRIGGER_IDLE
+
+    # The last input time is computed from two clocks, so it moves a little between calls.
+    SAME_INPUT = datetime.timedelta(seconds=1)
+
+    def __init__(self, minutes: float):
+        if minutes <= 0:
+            raise ValueError(f'Invalid idle minutes: {minutes}')
+        self.seconds = minutes * 60
+        self._fired_input = None # Time of the last input when the rule fired
+
+    def _last_input(self, now: datetime.datetime, idle_seconds) -> datetime.datetime:
+        return now - datetime.timedelta(seconds=idle_seconds())
+
+    def _fired_for(self, last_input: datetime.datetime) -> bool:
+        return self._fired_input is not None and abs(last_input - self._fired_input) < self.SAME_INPUT
+
+    def next_due(self, now: datetime.datetime, idle_seconds=None) -> datetime.datetime | None:
+        if idle_seconds is None:
+            return None
+        last_input = self._last_input(now, idle_seconds)
+        if self._fired_for(last_input):
+            # Fired for this idle period. There is no notification of the next
+            # input, so look again after the idle time.
+            return now + datetime.timedelta(seconds=self.seconds)
+        return last_input + datetime.timedelta(seconds=self.seconds)
+
+    def is_due(self, now: datetime.datetime, idle_seconds=None) -> bool:
+        if idle_seconds is None:
+            return False
+        last_input = self._last_input(now, idle_seconds)
+        if self._fired_for(last_input) or now - last_input < datetime.timedelta(seconds=self.seconds):
+            # The user came back before the rule was due.
+            return False
+        self._fired_input = last_input
+        return True
+
+    def __repr__(self):
+        return f'IdleRule({self.seconds / 60:g} min)'
+
+
+def parse_rule(value: dict):
+    """
+    Return the rule of one item of the 'schedule' setting. Raise ValueError if invalid.
+    """
+    if not isinstance(value, dict):
+        raise ValueError(f'Invalid schedule: {value!r}')
+
+    if 'idle_minutes' in value:
+        minutes = value['idle_minutes']
+        if isinstance(minutes, bool) or not isinstance(minutes, (int, float)):
+            raise ValueError(f'Invalid idle minutes: {minutes!r}')
+        return IdleRule(minutes)
+
+    if 'at' in value:
+        try:
+            hour, minute = (int(v) for v in str(value['at']).split(':'))
+        except ValueError:
+            raise ValueError(f"Invalid schedule time: {value['at']!r}") from None
+
+        days = value.get('days', 'daily')
+        if isinstance(days, str):
+            if days not in DAY_SETS:
+                raise ValueError(f'Invalid schedule days: {days!r}')
+            days = DAY_SETS[days]
+        else:
+            try:
+                days = frozenset(WEEKDAY_NAMES.index(str(d).lower()[:3]) for d in days)
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid schedule days: {days!r}') from None
+        return DailyRule(hour, minute, days)
+
+    raise ValueError(f'Invalid schedule: {value!r}')
+
+
+def parse_rules(values: list) -> list:
+    return [parse_rule(value) for value in values]
+
+
+class MuteScheduler:
+    """
+    Fire the rules when they are due, with one timer for the earliest rule.
+
+    fire(trigger)         : Mute. Called once for the rules due at the same time.
+    set_timer(seconds)    : Arm the timer to call on_timer() after `seconds`,
+                            or cancel it if None.
+    clock()               : Current local time (datetime).
+    idle_seconds()        : Seconds since the last user input, or None if unknown.
+    """
+
+    def __init__(self, fire, set_timer, clock=datetime.datetime.now, idle_seconds=None):
+        self.fire = fire
+        self.set_timer = set_timer
+        self.clock = clock
+        self.idle_seconds = idle_seconds
+        self.rules = []
+        self._heap = [] # (due timestamp, rule index)
+
+    def set_rules(self, rules: list):
+        self.rules = list(rules)
+        self.reschedule()
+
+    def reschedule(self):
+        """
+        Compute the next due time of all rules, e.g. after the rules or the clock changed.
+        """
+        now = self.clock()
+        self._heap = []
+        for index, rule in enumerate(self.rules):
+            self._push(index, rule.next_due(now, self.idle_seconds))
+        heapq.heapify(self._heap)
+        self._arm(now)
+
+    def next_due(self) -> datetime.datetime | None:
+        if len(self._heap) == 0:
+            return None
+        return datetime.datetime.fromtimestamp(self._heap[0][0])
+
+    def on_timer(self):
+        """
+        Fire the rules which are due, and arm the timer for the next rule.
+        The timer may fire early or late (e.g. after sleep); only the clock counts.
+        """
+        now = self.clock()
+        timestamp = now.timestamp()
+
+        trigger = None
+        while len(self._heap) > 0 and self._heap[0][0] <= timestamp:
+            _, index = heapq.heappop(self._heap)
+            rule = self.rules[index]
+            if rule.is_due(now, self.idle_seconds) and trigger is None:
+                trigger = rule.trigger
+            due = rule.next_due(now, self.idle_seconds)
+            if due is not None and due <= now:
+                # Do not come back before the clock moves on.
+                due = now + datetime.timedelta(seconds=1)
+            self._push(index, due, heap=True)
+
+        self._arm(now)
+        if trigger is not None:
+            self.fire(trigger)
+
+    def _push(self, index: int, due: datetime.datetime | None, heap: bool = False):
+        if due is None:
+            return
+        if heap:
+            heapq.heappush(self._heap, (due.timestamp(), index))
+        else:
+            self._heap.append((due.timestamp(), index))
+
+    def _arm(self, now: datetime.datetime):
+        if len(self._heap) == 0:
+            self.set_timer(None)
+        else:
+            self.set_timer(max(0.0, self._heap[0][0] - now.timestamp()))
@@ -1,33 +1,587 @@
-from core_audio import CoreAudio
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+
+from audio_backend import DeviceResult, create_backend, needs_mute, needs_volume
 import core_audio_constants
 
-from mute_log import mute_log
+from mute_log import mute_event, mute_log
+from mute_profile import phase
 
+SPEAKERS = core_audio_constants.EDataFlow.SPEAKERS
 
-def mute_current_speaker(mute: bool, vol: bool, log: bool):
-    ca = CoreAudio()
-    device0 = ca.get_default_audio_device_id(
-        core_audio_constants.ERole.eConsole
+# Value of the 'devices' setting -> data flows of the devices to mute
+DEVICE_FLOWS = {
+    'speakers':    core_audio_constants.EDataFlow.SPEAKERS,
+    'microphones': core_audio_constants.EDataFlow.MICROPHONES,
+    'both':        core_audio_constants.EDataFlow.BOTH,
+}
+
+
+def device_flows(value) -> tuple:
+    """
+    Return the data flows of a value of the 'devices' setting.
+    An unknown value is rejected by the settings, and falls back to the speakers here too.
+    """
+    return DEVICE_FLOWS.get(value, SPEAKERS)
+
+
+@dataclass
+class MuteReport:
+    """
+    Result of a mute pass.
+
+    done is the list of DeviceResult of the devices which were processed.
+    pending is the list of device IDs which were not processed before the deadline.
+    """
+    done: list = field(default_factory=list)
+    pending: list = field(default_factory=list)
+
+    @property
+    def timed_out(self) -> bool:
+        return len(self.pending) > 0
+
+    @property
+    def applied(self) -> int:
+        """
+        Number of set calls which were made.
+        """
+        return sum(result.applied for result in self.done)
+
+    @property
+    def skipped(self) -> int:
+        """
+        Number of set calls which were skipped because the device already had the value.
+        """
+        return sum(result.skipped for result in self.done)
+
+
+def _log_report(report: MuteReport, mute: bool, vol: bool, trigger: str):
+    action = ','.join(a for a, on in (('mute', mute), ('volume', vol)) if on)
+
+    for result in report.done:
+        if result.ok and result.applied == 0 and result.skipped > 0:
+            mute_event(trigger, result.device_id, result.name, action, result.duration, 'skipped',
+                       f'{result.name} - Mute({mute}) Volume({vol}) - Already silent')
+        elif result.ok:
+            mute_event(trigger, result.device_id, result.name, action, result.duration, 'ok',
+                       f'{result.name} - Mute({mute}) Volume({vol})')
+        else:
+            mute_event(trigger, result.device_id, result.name, action, result.duration, f'error: {result.error}',
+                       f'{result.name or result.device_id} - Error({result.error})')
+    for device_id in report.pending:
+        mute_event(trigger, device_id, '', action, None, 'pending',
+                   f'{device_id} - Not processed before the deadline')
+
+
+def _record_snapshot(snapshot, report: MuteReport, log: bool):
+    """
+    Record the previous values of the devices which the pass has changed, and save
+    the snapshot in one write.
+    """
+    if snapshot is None or not snapshot.record(report.done):
+        return
+    try:
+        snapshot.save()
+    except OSError as e:
+        if log: mute_log(f'Volume snapshot cannot be saved: {e}')
+
+
+def _parallel_apply(device_ids: list, mute, volume, workers: int, timeout: float | None) -> MuteReport:
+    """
+    Apply mute and/or volume to the devices on worker threads.
+
+    Each worker opens its own backend session (COM apartment) and takes device IDs
+    from a shared queue, so one slow driver holds up only the worker which called it.
+    Wait for all devices or until the timeout, whichever comes first.
+    The workers are daemon threads, so a worker stuck in a driver does not keep the
+    process alive.
+    """
+    tasks = queue.SimpleQueue()
+    for device_id in device_ids:
+        tasks.put(device_id)
+
+    results = {}
+    lock = threading.Lock()
+    finished = threading.Event()
+
+    def worker():
+        ca = create_backend()
+        error = None
+        try:
+            ca.open()
+        except Exception as e:
+            error = str(e)
+
+        try:
+            while True:
+                try:
+                    device_id = tasks.get_nowait()
+                except queue.Empty:
+                    return
+
+                if error is None:
+                    try:
+                        result = ca.apply([device_id], mute=mute, volume=volume)[0]
+                    except Exception as e:
+                        result = DeviceResult(device_id, error=str(e))
+                else:
+                    result = DeviceResult(device_id, error=error)
+
+                with lock:
+                    results[device_id] = result
+                    if len(results) == len(device_ids):
+                        finished.set()
+        finally:
+            ca.close()
+
+    for _ in range(min(workers, len(device_ids))):
+        threading.Thread(target=worker, name='mute_worker', daemon=True).start()
+
+    if len(device_ids) > 0:
+        finished.wait(timeout)
+
+    with lock:
+        done = [results[device_id] for device_id in device_ids if device_id in results]
+        pending = [device_id for device_id in device_ids if device_id not in results]
+
+    return MuteReport(done, pending)
+
+
+def _default_device_ids(ca, flows) -> list:
+    """
+    Return the default console device of each data flow.
+    A data flow without a device (e.g. no microphone) is skipped, unless no data
+    flow has one.
+    """
+    device_ids = []
+    error = None
+    for flow in flows:
+        try:
+            device_ids.append(ca.get_default_audio_device_id(core_audio_constants.ERole.eConsole, flow))
+        except Exception as e:
+            error = e
+    if len(device_ids) == 0 and error is not None:
+        raise error
+    return device_ids
+
+
+def _selected_device_ids(ca, device_rules, flows, registry) -> list | None:
+    """
+    Return the IDs of the active devices which the device rules select, or None
+    if there are no rules (all devices).
+    """
+    if not device_rules:
+        return None
+    return device_rules.select(
+        ca.audio_device_id_list(flows),
+        ca.get_device_properties,
+        None if registry is None else registry.generation,
     )
-    device_name = ca.get_friendly_name(device0)
 
-    if mute: ca.set_mute(device0, True)
-    if vol: ca.set_volume(device0, 0)
-    if log: mute_log(f'{device_name} - Mute({mute}) Volume({vol})')
 
+class _PlanWorker:
+    """
+    Thread of a MutePlan with its own backend session (COM apartment), which runs
+    the tasks of the plan one after another. The session is opened, used and closed
+    on the thread only. The thread is a daemon, so a worker stuck in a driver does
+    not keep the process alive.
 
-def mute_all_speakers(mute: bool, vol: bool, log: bool):
-    ca = CoreAudio()
-    devices = ca.audio_device_id_list()
-    for device in devices:
-        device_name = ca.get_friendly_name(device)
+    If the session cannot be opened, the thread keeps taking tasks, and every
+    call() raises the error instead.
+    """
+
+    def __init__(self, registry=None):
+        self._tasks = queue.SimpleQueue()
+        self.error = None
+        threading.Thread(target=self._loop, args=(registry,), name='mute_plan', daemon=True).start()
+
+    def _loop(self, registry):
+        ca = None
+        try:
+            ca = create_backend(registry)
+        except Exception as e:
+            self.error = e
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    return
+                task(ca)
+        finally:
+            if ca is not None:
+                ca.close()
+
+    def submit(self, task):
+        """
+        Queue task(backend) to the thread.
+        """
+        self._tasks.put(task)
+
+    def call(self, function, timeout: float | None = None):
+        """
+        Run function(backend) on the thread, and return its value or raise its error.
+        Raise TimeoutError if it has not returned within timeout (sec).
+        """
+        done = threading.Event()
+        outcome = []
+
+        def task(ca):
+            try:
+                if ca is None:
+                    raise self.error
+                outcome.append((function(ca), None))
+            except Exception as e:
+                outcome.append((None, e))
+            done.set()
 
-        if mute: ca.set_mute(device, True)
-        if vol: ca.set_volume(device, 0)
-        if log: mute_log(f'{device_name} - Mute({mute}) Volume({vol})')
+        self.submit(task)
+        if not done.wait(timeout):
+            raise TimeoutError(f'Mute plan worker did not answer within {timeout} sec')
+        value, error = outcome[0]
+        if error is not None:
+            raise error
+        return value
+
+    def close(self):
+        self._tasks.put(None)
+
+
+class MutePlan:
+    """
+    Ready-to-run mute pass, built ahead of the moment it is needed.
+
+    The plan runs on up to `workers` threads of its own (see _PlanWorker), so the
+    calling (UI) thread never makes a COM call. Building the plan enumerates the
+    target devices, reads their names, and shares the devices out among the workers,
+    each of which activates the IAudioEndpointVolume of its devices in a backend
+    session which stays open until close(). run() then only issues the get and set
+    calls on the prepared interfaces, in parallel.
+
+    Building the plan raises TimeoutError if it takes longer than build_deadline
+    (sec), e.g. when a driver hangs in Activate, so that the caller can fall back
+    to the plain mute in time.
+    The plan may be used from any thread, but from one thread at a time.
+    If a device registry is given, the plan is stale as soon as the registry changes,
+    and has no max age unless one is given. Without a registry, the plan is stale
+    after max_age (sec), since it cannot tell if the devices have changed.
+    """
+
+    # Default max age (sec) of a plan without a device registry.
+    MAX_AGE = 60.0
+    # Default time (sec) to build a plan. Windows waits about 5 sec for the reply to
+    # WM_QUERYENDSESSION.
+    BUILD_DEADLINE = 2.0
+
+    def __init__(self, mute: bool, vol: bool, target: bool, log: bool, registry=None, max_age: float | None = None, flows=SPEAKERS, device_rules=None, workers: int = 1, build_deadline: float = BUILD_DEADLINE):
+        self.settings = (mute, vol, target, log)
+        self.flows = tuple(flows)
+        self.device_rules = device_rules
+        self.created = time.monotonic()
+        if max_age is None and registry is None:
+            max_age = self.MAX_AGE
+        self.max_age = max_age
+        self._registry = registry
+        self._workers = [_PlanWorker(registry)]
+        end = time.monotonic() + build_deadline
+        remaining = lambda: max(0.0, end - time.monotonic())
+        try:
+            if target:
+                self.names = self._workers[0].call(lambda ca: ca.prepare(
+                    _selected_device_ids(ca, device_rules, self.flows, registry), self.flows
+                ), remaining())
+            else:
+                self.names = self._workers[0].call(lambda ca: ca.prepare(_default_device_ids(ca, self.flows)), remaining())
+
+            # The first worker has prepared all devices, and keeps the first share.
+            # The others prepare their own share; the names are cached by then.
+            device_ids = list(self.names)
+            count = max(1, min(workers, len(device_ids)))
+            self._shares = [device_ids[k::count] for k in range(count)]
+            for share in self._shares[1:]:
+                worker = _PlanWorker(registry)
+                self._workers.append(worker)
+                worker.call(lambda ca, share=share: ca.prepare(share), remaining())
+        except Exception:
+            self.close()
+            raise
+        self.generation = None if registry is None else registry.generation
+
+    def is_valid(self, mute: bool, vol: bool, target: bool, log: bool, flows=SPEAKERS, device_rules=None) -> bool:
+        """
+        Return True if the plan is still open, fresh, and built for the given settings,
+        data flows and device rules.
+        """
+        if len(self._workers) == 0:
+            return False
+        if self.max_age is not None and time.monotonic() - self.created > self.max_age:
+            return False
+        if self._registry is not None and self._registry.generation != self.generation:
+            return False
+        return (
+            self.settings == (mute, vol, target, log)
+            and self.flows == tuple(flows)
+            and self.device_rules is device_rules
+        )
+
+    def run(self, deadline: float | None = None, trigger: str = '', snapshot=None) -> MuteReport:
+        """
+        Mute and/or set volume to zero to the planned devices.
+
+        The calling thread waits for the workers until the deadline (sec) at most,
+        and no COM call is started after it. The devices which were not done in time
+        are reported as pending, and the plan is closed, since a worker may be stuck.
+        The values which were changed are recorded to the volume snapshot, if given.
+        """
+        with phase('MutePlan.run'):
+            report = self._run(deadline)
+        if report.timed_out:
+            self.close()
+
+        mute, vol, target, log = self.settings
+        _record_snapshot(snapshot, report, log)
+        if log: _log_report(report, mute, vol, trigger)
+        return report
+
+    def _run(self, deadline: float | None) -> MuteReport:
+        end = None if deadline is None else time.monotonic() + deadline
+        results = {}
+        lock = threading.Lock()
+        finished = threading.Event()
+
+        def apply(ca, share):
+            for device_id in share:
+                result = self._apply(ca, device_id, end)
+                if result is None:
+                    # Past the deadline. The rest of the share is pending.
+                    return
+                with lock:
+                    results[device_id] = result
+                    if len(results) == len(self.names):
+                        finished.set()
+
+        for worker, share in zip(self._workers, self._shares):
+            worker.submit(lambda ca, share=share: apply(ca, share))
+
+        if len(self.names) > 0:
+            finished.wait(None if end is None else max(0.0, end - time.monotonic()))
+
+        with lock:
+            done = [results[device_id] for device_id in self.names if device_id in results]
+            pending = [device_id for device_id in self.names if device_id not in results]
+        return MuteReport(done, pending)
+
+    def _apply(self, ca, device_id: str, end: float | None) -> DeviceResult | None:
+        """
+        Read the state of one device over its prepared interface, and set only what
+        differs. Return None if the deadline passes before a call.
+        """
+        mute, vol, target, log = self.settings
+        late = lambda: end is not None and time.monotonic() > end
+
+        if late():
+            return None
+        start = time.perf_counter()
+        result = DeviceResult(device_id, self.names[device_id])
+        try:
+            current_volume, current_mute = ca.get_states([device_id], mute, vol).get(device_id, (None, None))
+            result.previous_volume, result.previous_mute = current_volume, current_mute
+            if mute:
+                if needs_mute(current_mute, True):
+                    if late():
+                        return None
+                    ca.set_mute(device_id, True)
+                    result.applied += 1
+                else:
+                    result.skipped += 1
+                result.mute = True
+            if vol:
+                if needs_volume(current_volume, 0.0):
+                    if late():
+                        return None
+                    ca.set_volume(device_id, 0.0)
+                    result.applied += 1
+                else:
+                    result.skipped += 1
+                result.volume = 0.0
+        except Exception as e:
+            result.error = str(e)
+        result.duration = time.perf_counter() - start
+        return result
+
+    def close(self):
+        for worker in self._workers:
+            worker.close()
+        self._workers = []
+
+
+def mute_current_speaker(mute: bool, vol: bool, log: bool, registry=None, trigger: str = '', flows=SPEAKERS) -> MuteReport:
+    with create_backend(registry) as ca:
+        results = ca.apply(
+            _default_device_ids(ca, flows),
+            mute=True if mute else None,
+            volume=0.0 if vol else None,
+        )
+
+    report = MuteReport(results)
+    if log: _log_report(report, mute, vol, trigger)
+    return report
+
+
+def mute_all_speakers(mute: bool, vol: bool, log: bool, workers: int = 0, deadline: float | None = None, registry=None, trigger: str = '', flows=SPEAKERS, device_rules=None) -> MuteReport:
+    """
+    Mute and/or set volume to zero to all active devices of the data flows
+    (speakers by default), or the devices which the device rules select.
+    The devices are read from the device registry if it is given, or else from one
+    enumeration, also for more than one data flow.
+
+    If workers is 0, all devices are processed one after another in one backend session.
+    Otherwise, the devices are processed by up to `workers` threads in parallel, and
+    the pass gives up waiting after `deadline` seconds (None means no deadline).
+    The devices which were not processed in time are reported as pending.
+    """
+    if workers <= 0:
+        with create_backend(registry) as ca:
+            results = ca.apply(
+                _selected_device_ids(ca, device_rules, flows, registry),
+                mute=True if mute else None,
+                volume=0.0 if vol else None,
+                flows=flows,
+            )
+        report = MuteReport(results)
+    else:
+        end = None if deadline is None else time.monotonic() + deadline
+        with create_backend(registry) as ca:
+            devices = _selected_device_ids(ca, device_rules, flows, registry)
+            if devices is None:
+                devices = ca.audio_device_id_list(flows)
+        timeout = None if end is None else max(0.0, end - time.monotonic())
+        report = _parallel_apply(
+            devices,
+            True if mute else None,
+            0.0 if vol else None,
+            workers,
+            timeout,
+        )
+
+    if log: _log_report(report, mute, vol, trigger)
+    return report
+
+
+def mute_sessions(mute: bool, vol: bool, log: bool, sessions, trigger: str = '') -> MuteReport:
+    """
+    Mute and/or set volume to zero to the application sessions which match the
+    rules of the session registry. The devices are left as they are.
+    The sessions are tracked by the registry, so nothing is enumerated here.
+    """
+    with create_backend() as ca:
+        results = ca.apply_sessions(
+            sessions.matching(),
+            mute=True if mute else None,
+            volume=0.0 if vol else None,
+        )
+
+    report = MuteReport(results)
+    if log: _log_report(report, mute, vol, trigger)
+    return report
+
+
+def process(mute: bool, vol: bool, target: bool, log: bool, workers: int = 0, deadline: float | None = None, registry=None, trigger: str = '', flows=SPEAKERS, sessions=None, device_rules=None, snapshot=None) -> MuteReport:
+    """
+    Mute and/or set volume to zero to all devices (target is True) or the current
+    default devices (target is False) of the data flows (speakers by default).
+    If a session registry with rules is given, the matching application sessions
+    are muted instead of the devices. The device rules narrow all devices.
+    trigger tells what started the process (e.g. 'shutdown'), for the log.
+    If a volume_snapshot.VolumeSnapshot is given, the values of the devices before
+    the pass are recorded to it and saved.
+    """
+    with phase('process'):
+        if sessions is not None and sessions.rules:
+            return mute_sessions(mute, vol, log, sessions, trigger)
+        if target:
+            report = mute_all_speakers(mute, vol, log, workers, deadline, registry, trigger, flows, device_rules)
+        else:
+            report = mute_current_speaker(mute, vol, log, registry, trigger, flows)
+        _record_snapshot(snapshot, report, log)
+        return report
+
+
+def restore_snapshot(snapshot, log: bool, registry=None, trigger: str = 'restore') -> MuteReport:
+    """
+    Set the devices back to the volume and the mute state of the volume snapshot,
+    in one backend session: the states of all devices are read in one batch, and
+    only the values which differ are set.
+
+    The restored devices are removed from the snapshot, which is saved.
+    The devices which are not active now are kept for a later restore.
+    """
+    entries = snapshot.entries()
+    report = MuteReport()
+    if len(entries) == 0:
+        return report
+
+    with phase('restore_snapshot'), create_backend(registry) as ca:
+        # With a registry, this re-primes it if devices have arrived since it started
+        # (e.g. after the logon), and makes no COM call otherwise.
+        active = set(ca.audio_device_id_list(core_audio_constants.EDataFlow.BOTH))
+        device_ids = [device_id for device_id in entries if device_id in active]
+        states = ca.get_states(device_ids)
+
+        for device_id in device_ids:
+            start = time.perf_counter()
+            result = DeviceResult(device_id)
+            volume, mute = entries[device_id]
+            result.previous_volume, result.previous_mute = states[device_id]
+            if log:
+                try:
+                    result.name = ca.get_friendly_name(device_id)
+                except Exception:
+                    pass
+            try:
+                if mute is not None:
+                    if needs_mute(result.previous_mute, mute):
+                        ca.set_mute(device_id, mute)
+                        result.applied += 1
+                    else:
+                        result.skipped += 1
+                    result.mute = mute
+                if volume is not None:
+                    if needs_volume(result.previous_volume, volume):
+                        ca.set_volume(device_id, volume)
+                        result.applied += 1
+                    else:
+                        result.skipped += 1
+                    result.volume = volume
+            except Exception as e:
+                result.error = str(e)
+            result.duration = time.perf_counter() - start
+            report.done.append(result)
+
+    for result in report.done:
+        if result.ok:
+            snapshot.forget(result.device_id)
+    try:
+        snapshot.save()
+    except OSError as e:
+        if log: mute_log(f'Volume snapshot cannot be saved: {e}')
+
+    if log:
+        for result in report.done:
+            values = f'Mute({result.mute}) Volume({result.volume})'
+            if result.ok:
+                mute_event(trigger, result.device_id, result.name, 'restore', result.duration,
+                           'ok' if result.applied > 0 else 'skipped', f'{result.name} - Restore {values}')
+            else:
+                mute_event(trigger, result.device_id, result.name, 'restore', result.duration,
+                           f'error: {result.error}', f'{result.name or result.device_id} - Error({result.error})')
+    return report
 
 
 if __name__ == '__main__':
+    from core_audio import CoreAudio
+
     ca = CoreAudio()
 
     # Get default render device
@@ -0,0 +1,109 @@
+"""
+Triggers which mute the speakers on power and session events.
+
+| Trigger     | Message                                                      | Deadline |
+|-------------|--------------------------------------------------------------|----------|
+| suspend     | WM_POWERBROADCAST / PBT_APMSUSPEND                           | 1.0 sec  |
+| lock        | WM_WTSSESSION_CHANGE / WTS_SESSION_LOCK                      | 2.0 sec  |
+| disconnect  | WM_WTSSESSION_CHANGE / WTS_REMOTE_DISCONNECT, WTS_CONSOLE_DISCONNECT | 2.0 sec |
+| display_off | WM_POWERBROADCAST / PBT_POWERSETTINGCHANGE of GUID_CONSOLE_DISPLAY_STATE | 2.0 sec |
+
+Windows gives an application about two seconds to handle PBT_APMSUSPEND, so the
+suspend deadline is the shortest.
+The window must register for the session notifications (WTSRegisterSessionNotification)
+and for the display state (RegisterPowerSettingNotification), otherwise the lock,
+disconnect and display_off messages are not sent.
+
+MuteTriggers only decodes the messages and calls fire(trigger, deadline) for the
+enabled triggers, and on_resume() when the system resumes from sleep, so it can be
+tested with synthetic messages on any OS.
+"""
+
+import ctypes
+import struct
+import uuid
+
+from winapi_constants import *
+
+TRIGGER_SUSPEND     = 'suspend'
+TRIGGER_LOCK        = 'lock'
+TRIGGER_DISCONNECT  = 'disconnect'
+TRIGGER_DISPLAY_OFF = 'display_off'
+
+# Trigger -> deadline (sec) of the mute
+TRIGGER_DEADLINES = {
+    TRIGGER_SUSPEND:     1.0,
+    TRIGGER_LOCK:        2.0,
+    TRIGGER_DISCONNECT:  2.0,
+    TRIGGER_DISPLAY_OFF: 2.0,
+}
+
+GUID_CONSOLE_DISPLAY_STATE = uuid.UUID('6FE69556-704A-47A0-8F24-C28D936FDA47')
+# Data of GUID_CONSOLE_DISPLAY_STATE
+DISPLAY_OFF    = 0
+DISPLAY_ON     = 1
+DISPLAY_DIMMED = 2
+
+
+def parse_power_setting(data: bytes) -> tuple:
+    """
+    Return (GUID, DWORD value) of a POWERBROADCAST_SETTING.
+
+    POWERBROADCAST_SETTING is { GUID PowerSetting; DWORD DataLength; UCHAR Data[]; }
+    """
+    guid = uuid.UUID(bytes_le=bytes(data[:16]))
+    length, = struct.unpack_from('<I', data, 16)
+    value = int.from_bytes(data[20:20 + min(length, 4)], 'little')
+    return guid, value
+
+
+def read_power_setting(address: int) -> tuple:
+    """
+    Read the POWERBROADCAST_SETTING which the lParam of PBT_POWERSETTINGCHANGE points to.
+    """
+    return parse_power_setting(ctypes.string_at(address, 24))
+
+
+class MuteTriggers:
+    """
+    Message handlers of the triggers. Register them with register(dispatcher).
+    """
+
+    def __init__(self, fire, enabled=(), read_setting=read_power_setting, on_resume=None):
+        self.fire = fire
+        self.on_resume = on_resume
+        self.enabled = set(enabled)
+        self._read_setting = read_setting
+        self._display_state = None
+
+    def register(self, dispatcher):
+        dispatcher.on_message(WM_POWERBROADCAST, self.on_power_broadcast)
+        dispatcher.on_message(WM_WTSSESSION_CHANGE, self.on_session_change)
+
+    def _fire(self, trigger: str):
+        if trigger in self.enabled:
+            self.fire(trigger, TRIGGER_DEADLINES[trigger])
+
+    def on_power_broadcast(self, hwnd, wParam, lParam):
+        if wParam == PBT_APMSUSPEND:
+            self._fire(TRIGGER_SUSPEND)
+        elif wParam == PBT_APMRESUMEAUTOMATIC:
+            if self.on_resume is not None:
+                self.on_resume()
+        elif wParam == PBT_POWERSETTINGCHANGE and lParam:
+            guid, value = self._read_setting(lParam)
+            if guid == GUID_CONSOLE_DISPLAY_STATE:
+                # The current state is also sent at the registration. Mute only when
+                # the display goes off.
+                if value == DISPLAY_OFF and self._display_state not in (None, DISPLAY_OFF):
+                    self._fire(TRIGGER_DISPLAY_OFF)
+                self._display_state = value
+        # Grant the request.
+        return 1
+
+    def on_session_change(self, hwnd, wParam, lParam):
+        if wParam == WTS_SESSION_LOCK:
+            self._fire(TRIGGER_LOCK)
+        elif wParam in (WTS_REMOTE_DISCONNECT, WTS_CONSOLE_DISCONNECT):
+            self._fire(TRIGGER_DISCONNECT)
+        return 0
@@ -0,0 +1,116 @@
+"""
+Worker thread which runs the mute requests off the UI thread.
+
+submit() queues a request and returns at once. A request which is equal to one
+still waiting in the queue is merged into it, so clicking "Mute now" several times
+runs one pass. A request which has already started is not merged, and an equal
+request submitted meanwhile runs after it.
+
+on_done(request, report, error) is called on the worker thread after each pass,
+with the MuteReport, or with the exception which stopped the pass.
+"""
+
+import threading
+from dataclasses import dataclass
+
+from core_audio_constants import EDataFlow
+
+
+@dataclass(frozen=True)
+class MuteRequest:
+    """
+    Settings and trigger of one mute pass. Equal requests are merged.
+    """
+    mute: bool
+    vol: bool
+    target: bool
+    log: bool
+    trigger: str = 'mute_now'
+    workers: int = 0
+    deadline: float | None = None
+    flows: tuple = EDataFlow.SPEAKERS # Data flows of the devices
+
+
+class MuteWorker:
+    """
+    Run `run(request)` for the submitted requests, one at a time, on one thread.
+    """
+
+    def __init__(self, run, on_done=None):
+        self._run = run
+        self._on_done = on_done
+        self._pending = []
+        self._running = None
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._loop, name='mute_worker', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = 1.0):
+        """
+        Drop the pending requests and wait for the running pass up to the timeout.
+        """
+        if self._thread is None:
+            return
+        with self._cond:
+            self._pending.clear()
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, request: MuteRequest) -> bool:
+        """
+        Queue the request. Return False if it is merged into a pending one.
+        """
+        with self._cond:
+            if request in self._pending:
+                return False
+            self._pending.append(request)
+            self._cond.notify_all()
+        return True
+
+    def cancel_pending(self) -> int:
+        """
+        Drop the requests which have not started. Return the number of them.
+        """
+        with self._cond:
+            count = len(self._pending)
+            self._pending.clear()
+        return count
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        """
+        Wait until no request is pending or running. Return True if idle.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and self._running is None, timeout)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._stopping)
+                if self._stopping:
+                    return
+                request = self._running = self._pending.pop(0)
+
+            report = None
+            error = None
+            try:
+                report = self._run(request)
+            except Exception as e:
+                error = e
+
+            try:
+                if self._on_done is not None:
+                    self._on_done(request, report, error)
+            finally:
+                with self._cond:
+                    self._running = None
+                    self._cond.notify_all()
@@ -0,0 +1,166 @@
+"""
+Registry of the audio sessions (one per application stream), for muting applications
+instead of whole devices.
+
+The 'apps' setting selects the applications by the file name of their process.
+
+| Setting                                   | Meaning |
+|-------------------------------------------|---------|
+| {"allow": ["chrome.exe", "spotify.exe"]}  | Mute only these applications. |
+| {"deny": ["teams.exe"]}                   | Mute all applications but these. |
+
+A name in both lists is not muted. The names are compared without case.
+
+Like device_registry, the registry does not talk to Core Audio by itself. It is
+primed by reset() with one enumeration, and then updated incrementally by a
+notification source calling on_session_created() and on_session_expired().
+core_audio.SessionNotificationSource is the source backed by
+IAudioSessionNotification and IAudioSessionEvents. update() passes the active
+devices to the source, which tracks the sessions of the new devices and drops
+those of the devices which have gone, without enumerating the others again.
+
+The sessions which match the rules are kept in their own dict, updated as the
+sessions come and go, so a mute costs O(matching sessions) and no enumeration.
+"""
+
+import threading
+from typing import Protocol
+
+
+class SessionSource(Protocol):
+    def start(self, registry: 'SessionRegistry'): ...
+    def update(self, device_ids): ...
+    def stop(self): ...
+
+
+class SessionRules:
+    """
+    Allow and deny lists of process names.
+    """
+
+    def __init__(self, allow=(), deny=()):
+        self.allow = frozenset(name.lower() for name in allow)
+        self.deny = frozenset(name.lower() for name in deny)
+
+    @classmethod
+    def from_setting(cls, value) -> 'SessionRules':
+        """
+        Return the rules of the 'apps' setting. Raise ValueError if invalid.
+        """
+        if value is None:
+            return cls()
+        if not isinstance(value, dict) or not set(value) <= {'allow', 'deny'}:
+            raise ValueError(f'Invalid apps: {value!r}')
+        lists = {}
+        for key in ('allow', 'deny'):
+            names = value.get(key, [])
+            if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+                raise ValueError(f'Invalid apps {key}: {names!r}')
+            lists[key] = names
+        return cls(lists['allow'], lists['deny'])
+
+    def __bool__(self) -> bool:
+        return len(self.allow) > 0 or len(self.deny) > 0
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SessionRules) and (self.allow, self.deny) == (other.allow, other.deny)
+
+    def matches(self, process_name: str) -> bool:
+        name = process_name.lower()
+        if name in self.deny:
+            return False
+        return len(self.allow) == 0 or name in self.allow
+
+    def __repr__(self):
+        return f'SessionRules(allow={sorted(self.allow)}, deny={sorted(self.deny)})'
+
+
+class TrackedSession:
+    """
+    One audio session. handle is the backend's volume control of the session
+    (ISimpleAudioVolume for core_audio).
+    """
+    __slots__ = ('session_id', 'process_name', 'handle')
+
+    def __init__(self, session_id: str, process_name: str, handle):
+        self.session_id = session_id
+        self.process_name = process_name
+        self.handle = handle
+
+
+class SessionRegistry:
+    """
+    Session ID -> TrackedSession map, and the sub-map of the sessions which match
+    the rules.
+    """
+
+    def __init__(self, rules: SessionRules | None = None):
+        self._lock = threading.Lock()
+        self._sessions = {} # session ID -> TrackedSession
+        self._matching = {} # session ID -> TrackedSession, which match the rules
+        self._source = None
+        self.rules = SessionRules() if rules is None else rules
+        self.generation = 0
+
+    def start(self, source: SessionSource):
+        """
+        Start receiving notifications from the source.
+        """
+        self.stop()
+        self._source = source
+        source.start(self)
+
+    def update(self, device_ids):
+        """
+        Let the source follow the active devices, whose sessions are tracked.
+        """
+        if self._source is not None:
+            self._source.update(device_ids)
+
+    def stop(self):
+        if self._source is not None:
+            self._source.stop()
+            self._source = None
+
+    @property
+    def running(self) -> bool:
+        return self._source is not None
+
+    def set_rules(self, rules: SessionRules):
+        with self._lock:
+            self.rules = rules
+            self._matching = {id: s for id, s in self._sessions.items() if rules.matches(s.process_name)}
+            self.generation += 1
+
+    def reset(self, sessions):
+        """
+        Replace the whole registry with an enumeration of TrackedSession.
+        """
+        with self._lock:
+            self._sessions = {session.session_id: session for session in sessions}
+            self._matching = {
+                id: s for id, s in self._sessions.items() if self.rules.matches(s.process_name)
+            }
+            self.generation += 1
+
+    def on_session_created(self, session: TrackedSession):
+        with self._lock:
+            self._sessions[session.session_id] = session
+            if self.rules.matches(session.process_name):
+                self._matching[session.session_id] = session
+            self.generation += 1
+
+    def on_session_expired(self, session_id: str):
+        with self._lock:
+            if self._sessions.pop(session_id, None) is not None:
+                self._matching.pop(session_id, None)
+                self.generation += 1
+
+    def matching(self) -> list:
+        """
+        Return the TrackedSession which match the rules.
+        """
+        return list(self._matching.values())
+
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -0,0 +1,260 @@
+"""
+Settings of win_auto_mute, kept in memory and written through to the JSON file.
+
+The file is read once by load(). Every key is kept, including the keys which are
+not in the setting window and the keys this version does not know, so they are
+written back as they were.
+Readers never touch the disk. update() changes the values in memory and schedules
+a save; saves requested within `debounce` seconds are merged into one write.
+The file is written to a temporary file and then replaced, so it is never left
+half written.
+
+reload() reads the file again only when its mtime has changed, and swaps the
+values only when its content has changed and is valid. settings_watcher calls it
+when the file is changed by hand or by a config push.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+from atomic_file import write_atomic
+from get_path import get_script_basename, get_script_folder_path
+
+# Default settings
+DEFAULT_SETTINGS = {
+    'mute': True,    # Mute audio device(s).
+    'volume': False, # Set the volume to zero.
+    'target': True,  # All speakers are targeted to process.
+    'logging': False # Not in the setting window. Need to set manually if you want.
+}
+
+# key -> allowed types of the value. Keys which are not here are kept as they are.
+SETTING_TYPES = {
+    'mute': (bool,),
+    'volume': (bool,),
+    'target': (bool,),
+    'logging': (bool,),
+    'log_format': (str,),
+    'log_max_bytes': (int,),
+    'log_backups': (int,),
+    'profile': (bool,),
+    'profile_file': (str, type(None)),
+    'backend': (str,),
+    'prewarm': (bool,),
+    'triggers': (list,),
+    'schedule': (list,),
+    'devices': (str,),
+    'apps': (dict,),
+    'device_rules': (dict,),
+    'restore': (bool,),
+}
+
+# key -> allowed values, for the keys which take one of some names
+SETTING_CHOICES = {
+    'log_format': ('text', 'jsonl'),
+    'backend': ('core_audio', 'simulated'),
+    'devices': ('speakers', 'microphones', 'both'),
+}
+
+
+def default_settings_path() -> Path:
+    """
+    Return the json file full path name, next to the script or the exe file.
+    """
+    return get_script_folder_path() / (get_script_basename() + '.json')
+
+
+def validate_value(key: str, value):
+    """
+    Check the value of a known key. Raise ValueError if it is invalid.
+    """
+    types = SETTING_TYPES.get(key)
+    if types is None:
+        return
+    # bool is a subclass of int. Do not take true as a size.
+    if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+        raise ValueError(f'Invalid value of {key}: {value!r}')
+    if isinstance(value, int) and not isinstance(value, bool) and value < 0:
+        raise ValueError(f'Invalid value of {key}: {value!r}')
+    if key in SETTING_CHOICES and value not in SETTING_CHOICES[key]:
+        raise ValueError(f'Invalid value of {key}: {value!r}')
+
+
+def validate(values) -> dict:
+    """
+    Check the types of the known keys. Raise ValueError if they are invalid.
+    """
+    if not isinstance(values, dict):
+        raise ValueError('Settings must be a JSON object')
+
+    for key, value in values.items():
+        validate_value(key, value)
+
+    return values
+
+
+class Settings:
+    """
+    In-memory settings with atomic, debounced write-through.
+
+    The values are replaced as a whole on every change, so a reader always sees
+    a consistent set of values without locking.
+    """
+
+    def __init__(self, path: Path | None = None, debounce: float = 0.5):
+        self.path = default_settings_path() if path is None else Path(path)
+        self.debounce = debounce
+        self._values = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._timer = None
+        self._mtime_ns = None # mtime of the file when it was last read or written
+        self._digest = None   # hash of the file content when it was last read or written
+        self._rejected = {}   # invalid values of the file, written back as they were
+        self.errors = []      # messages of the invalid values found by load()
+
+    def load(self) -> 'Settings':
+        """
+        Read the json file. If it does not exist or is not a JSON object, the default
+        settings are used. A key with an invalid value takes its default setting,
+        and the message is added to `errors`, the same checks as reload().
+        """
+        self.errors = []
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self._values = dict(DEFAULT_SETTINGS)
+            return self
+
+        try:
+            values = json.loads(data)
+            if not isinstance(values, dict):
+                raise ValueError('Settings must be a JSON object')
+        except ValueError as e:
+            self.errors.append(str(e))
+            values = dict(DEFAULT_SETTINGS)
+
+        self._rejected = {}
+        for key, value in list(values.items()):
+            try:
+                validate_value(key, value)
+            except ValueError as e:
+                self.errors.append(str(e))
+                self._rejected[key] = values.pop(key)
+
+        self._values = values
+        self._mtime_ns = mtime_ns
+        self._digest = hashlib.sha1(data).digest()
+        return self
+
+    def reload(self) -> bool:
+        """
+        Read the json file again if it has changed, and swap the values in one step.
+        Return True if the values are replaced.
+
+        Raise OSError or ValueError if the file cannot be read or is invalid.
+        The current values are kept in that case.
+        """
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        if mtime_ns == self._mtime_ns:
+            return False
+
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha1(data).digest()
+        if digest == self._digest:
+            # Touched, or written by save().
+            self._mtime_ns = mtime_ns
+            return False
+
+        # json.JSONDecodeError is a ValueError.
+        values = validate(json.loads(data))
+
+        with self._lock:
+            self._values = values
+            self._rejected = {}
+            self._mtime_ns = mtime_ns
+            self._digest = digest
+        return True
+
+    def get(self, key: str, default=None):
+        """
+        Return the value of the key, or the default setting, or `default`.
+        """
+        values = self._values
+        if key in values:
+            return values[key]
+        return DEFAULT_SETTINGS.get(key, default)
+
+    def __getitem__(self, key: str):
+        return self.get(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._values
+
+    def snapshot(self) -> dict:
+        """
+        Return a copy of all stored values.
+        """
+        return dict(self._values)
+
+    def update(self, values: dict | None = None, **kwargs):
+        """
+        Change the values in memory and schedule a save.
+        """
+        with self._lock:
+            new_values = dict(self._values)
+            new_values.update(values or {}, **kwargs)
+            self._values = new_values
+        self.save()
+
+    def save(self):
+        """
+        Write the settings after `debounce` seconds, merging the saves requested
+        in the meantime. If debounce is 0, write now.
+        """
+        if self.debounce <= 0:
+            self._write()
+            return
+
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self._write)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """
+        Write a scheduled save now, or wait for the save in progress.
+        """
+        with self._lock:
+            timer = self._timer
+            self._timer = None
+        if timer is not None:
+            timer.cancel()
+            self._write()
+        else:
+            with self._write_lock:
+                pass
+
+    def _write(self):
+        with self._lock:
+            if self._timer is threading.current_thread():
+                self._timer = None
+            # The invalid values of the file are kept, unless they have been set since.
+            values = {**self._rejected, **self._values}
+
+        with self._write_lock:
+            data = json.dumps(values).encode()
+            write_atomic(self.path, data)
+
+            # Let reload() skip the file written here.
+            with self._lock:
+                self._mtime_ns = os.stat(self.path).st_mtime_ns
+                self._digest = hashlib.sha1(data).digest()
@@ -0,0 +1,197 @@
+"""
+Watch the settings file and reload it when it is changed.
+
+On Windows, a thread waits on ReadDirectoryChangesW for the folder of the file, so
+nothing runs until a file in the folder is written or renamed.
+Elsewhere, or if the folder cannot be watched, the thread checks the mtime of the
+file every `interval` seconds.
+
+Both call Settings.reload(), which swaps the values only when the content of the
+file has changed and is valid, and then call on_change(settings) on the watcher
+thread.
+"""
+
+import struct
+import sys
+import threading
+
+from mute_log import mute_log
+from winapi_constants import *
+
+# Wait (sec) after a notification, so that the writer can finish the file.
+SETTLE_DELAY = 0.1
+# Size of the buffer of ReadDirectoryChangesW
+NOTIFY_BUFFER_SIZE = 4096
+
+
+def changed_file_names(buffer: bytes, size: int) -> list:
+    """
+    Return the file names in the FILE_NOTIFY_INFORMATION records of the buffer.
+    """
+    names = []
+    offset = 0
+    while offset + 12 <= size:
+        next_offset, _, name_length = struct.unpack_from('<III', buffer, offset)
+        names.append(buffer[offset + 12:offset + 12 + name_length].decode('utf-16-le'))
+        if next_offset == 0:
+            break
+        offset += next_offset
+    return names
+
+
+class SettingsWatcher:
+    """
+    Reload the settings in a background thread when the file is changed.
+    """
+
+    def __init__(self, settings, on_change=None, interval: float = 2.0):
+        self.settings = settings
+        self.on_change = on_change
+        self.interval = interval
+        self._stop = threading.Event()
+        self._stop_handle = None # Win32 event, set by stop()
+        self._stop_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='settings_watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = 1.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        with self._stop_lock:
+            if self._stop_handle is not None:
+                self._kernel32.SetEvent(self._stop_handle)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def check(self) -> bool:
+        """
+        Reload the settings if the file has changed. Return True if they are replaced.
+        """
+        try:
+            changed = self.settings.reload()
+        except FileNotFoundError:
+            # Removed, or being replaced. Keep the current values.
+            return False
+        except (OSError, ValueError) as e:
+            if self.settings['logging']:
+                mute_log(f'Settings are not reloaded: {e}')
+            return False
+
+        if changed and self.on_change is not None:
+            self.on_change(self.settings)
+        return changed
+
+    def _run(self):
+        if sys.platform == 'win32':
+            try:
+                self._watch_directory()
+                return
+            except OSError as e:
+                if self.settings['logging']:
+                    mute_log(f'Settings folder cannot be watched: {e}')
+        self._poll()
+
+    def _poll(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def _watch_directory(self):
+        from ctypes import (POINTER, Structure, WinDLL, byref, c_void_p,
+                            create_string_buffer, get_last_error)
+        from ctypes.wintypes import BOOL, DWORD, HANDLE, LPCWSTR
+
+        class OVERLAPPED(Structure):
+            _fields_ = [
+                ('Internal', c_void_p),
+                ('InternalHigh', c_void_p),
+                ('Offset', DWORD),
+                ('OffsetHigh', DWORD),
+                ('hEvent', HANDLE),
+            ]
+
+        kernel32 = WinDLL('kernel32', use_last_error=True)
+        kernel32.CreateFileW.restype = HANDLE
+        kernel32.CreateFileW.argtypes = [LPCWSTR, DWORD, DWORD, c_void_p, DWORD, DWORD, HANDLE]
+        kernel32.CreateEventW.restype = HANDLE
+        kernel32.CreateEventW.argtypes = [c_void_p, BOOL, BOOL, LPCWSTR]
+        kernel32.ReadDirectoryChangesW.restype = BOOL
+        kernel32.ReadDirectoryChangesW.argtypes = [HANDLE, c_void_p, DWORD, BOOL, DWORD, POINTER(DWORD), POINTER(OVERLAPPED), c_void_p]
+        kernel32.GetOverlappedResult.restype = BOOL
+        kernel32.GetOverlappedResult.argtypes = [HANDLE, POINTER(OVERLAPPED), POINTER(DWORD), BOOL]
+        kernel32.WaitForMultipleObjects.restype = DWORD
+        kernel32.WaitForMultipleObjects.argtypes = [DWORD, POINTER(HANDLE), BOOL, DWORD]
+        kernel32.WaitForSingleObject.restype = DWORD
+        kernel32.WaitForSingleObject.argtypes = [HANDLE, DWORD]
+        kernel32.SetEvent.argtypes = [HANDLE]
+        kernel32.ResetEvent.argtypes = [HANDLE]
+        kernel32.CancelIoEx.argtypes = [HANDLE, POINTER(OVERLAPPED)]
+        kernel32.CloseHandle.argtypes = [HANDLE]
+        self._kernel32 = kernel32
+
+        def check_handle(handle):
+            if handle is None or handle == c_void_p(INVALID_HANDLE_VALUE).value:
+                raise OSError(get_last_error(), 'Cannot open the settings folder')
+            return handle
+
+        folder = check_handle(kernel32.CreateFileW(
+            str(self.settings.path.parent),
+            FILE_LIST_DIRECTORY,
+            FILE_SHARE_READ | FILE_SHARE_WRITE | FILE_SHARE_DELETE,
+            None,
+            OPEN_EXISTING,
+            FILE_FLAG_BACKUP_SEMANTICS | FILE_FLAG_OVERLAPPED,
+            None
+        ))
+        overlapped = OVERLAPPED()
+        stop_handle = None
+        buffer = create_string_buffer(NOTIFY_BUFFER_SIZE)
+        size = DWORD()
+        file_name = self.settings.path.name.lower()
+        pending = False
+        try:
+            overlapped.hEvent = check_handle(kernel32.CreateEventW(None, True, False, None))
+            stop_handle = check_handle(kernel32.CreateEventW(None, True, False, None))
+            with self._stop_lock:
+                self._stop_handle = stop_handle
+            if self._stop.is_set():
+                return
+            handles = (HANDLE * 2)(overlapped.hEvent, stop_handle)
+
+            while True:
+                kernel32.ResetEvent(overlapped.hEvent)
+                if not kernel32.ReadDirectoryChangesW(
+                    folder, buffer, NOTIFY_BUFFER_SIZE, False,
+                    FILE_NOTIFY_CHANGE_FILE_NAME | FILE_NOTIFY_CHANGE_SIZE | FILE_NOTIFY_CHANGE_LAST_WRITE,
+                    None, byref(overlapped), None
+                ):
+                    raise OSError(get_last_error(), 'ReadDirectoryChangesW failed')
+                pending = True
+
+                if kernel32.WaitForMultipleObjects(2, handles, False, INFINITE) != WAIT_OBJECT_0:
+                    break
+                pending = False
+                if not kernel32.GetOverlappedResult(folder, byref(overlapped), byref(size), False):
+                    raise OSError(get_last_error(), 'ReadDirectoryChangesW failed')
+
+                # Size 0 means that the buffer overflowed. Check the file anyway.
+                names = changed_file_names(buffer.raw, size.value)
+                if size.value == 0 or file_name in (name.lower() for name in names):
+                    if kernel32.WaitForSingleObject(stop_handle, int(SETTLE_DELAY * 1000)) == WAIT_OBJECT_0:
+                        break
+                    self.check()
+        finally:
+            if pending:
+                kernel32.CancelIoEx(folder, byref(overlapped))
+                kernel32.GetOverlappedResult(folder, byref(overlapped), byref(size), True)
+            with self._stop_lock:
+                self._stop_handle = None
+            for handle in (overlapped.hEvent, stop_handle, folder):
+                if handle:
+                    kernel32.CloseHandle(handle)
@@ -0,0 +1,532 @@
+"""
+In-memory audio system for running and timing the mute logic without Windows.
+
+SimulatedAudioSystem holds the simulated devices, application sessions and their
+mute/volume state. SimulatedCom is a COM layer of core_audio (see core_audio_com)
+over simulated COM objects of the system, so the real core_audio.CoreAudio and its
+notification sources run on top of it. Each method of the simulated COM interfaces
+counts one call and waits for its latency, so the call counts and the timings are
+the ones of CoreAudio itself.
+
+| Simulated object       | COM interface |
+|------------------------|---------------|
+| _Enumerator            | IMMDeviceEnumerator |
+| _Collection            | IMMDeviceCollection |
+| _Device                | IMMDevice, IMMEndpoint |
+| _PropertyStore         | IPropertyStore |
+| _EndpointVolume        | IAudioEndpointVolume |
+| _SessionManager        | IAudioSessionManager2 |
+| _SessionEnumerator     | IAudioSessionEnumerator |
+| _SessionControl        | IAudioSessionControl2 |
+| _SimpleVolume          | ISimpleAudioVolume |
+
+The system is an audio_backend provider. Adding, removing or changing the state of
+a device fires the registered IMMNotificationClient, as does renaming it, and adding or ending a session
+fires the registered IAudioSessionNotification and IAudioSessionEvents.
+
+default_system() is configured by the following environment variables.
+
+| Variable                       | Meaning |
+|--------------------------------|---------|
+| WIN_AUTO_MUTE_SIM_DEVICES      | Number of render devices (default 4). |
+| WIN_AUTO_MUTE_SIM_MICROPHONES  | Number of capture devices (default 0). |
+| WIN_AUTO_MUTE_SIM_LATENCY      | Latency (sec) of each COM call (default 0). |
+| WIN_AUTO_MUTE_SIM_JITTER       | Random +/- jitter (sec) added to the latency (default 0). |
+| WIN_AUTO_MUTE_SIM_FAILURE_RATE | Probability that a set call fails (default 0). |
+| WIN_AUTO_MUTE_SIM_SEED         | Seed of the random generator. |
+"""
+
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+from core_audio import (
+    PKEY_AudioEndpoint_FormFactor, PKEY_Device_DeviceDesc, PKEY_Device_FriendlyName,
+    CoreAudio, EndpointNotificationSource, SessionNotificationSource,
+)
+from core_audio_constants import AudioSessionState, DeviceState, EDataFlow, EndpointFormFactor
+from device_info import DeviceInfoCache
+from mute_profile import phase
+
+
+class SimulatedAudioError(Exception):
+    pass
+
+
+class SimulatedDevice:
+    __slots__ = ('id', 'name', 'description', 'flow', 'form_factor', 'state', 'volume', 'mute', 'latency', 'fail')
+
+    def __init__(self, id: str, name: str, flow: int, form_factor: int | None = None):
+        self.id = id
+        self.name = name
+        self.description = 'Microphone' if flow == EDataFlow.eCapture else 'Speakers'
+        self.flow = flow
+        if form_factor is None:
+            form_factor = EndpointFormFactor.Microphone if flow == EDataFlow.eCapture else EndpointFormFactor.Speakers
+        self.form_factor = form_factor
+        self.state = DeviceState.ACTIVE
+        self.volume = 0.5
+        self.mute = False
+        self.latency = 0.0 # Extra latency (sec) of the set calls on this device
+        self.fail = False  # Set calls on this device always fail
+
+
+class SimulatedSession:
+    __slots__ = ('id', 'process_name', 'device_id', 'volume', 'mute', 'latency', 'fail')
+
+    def __init__(self, id: str, process_name: str, device_id: str):
+        self.id = id
+        self.process_name = process_name
+        self.device_id = device_id
+        self.volume = 1.0
+        self.mute = False
+        self.latency = 0.0
+        self.fail = False
+
+
+class _Enumerator:
+
+    def __init__(self, system: 'SimulatedAudioSystem'):
+        self._system = system
+
+    def EnumAudioEndpoints(self, flow: int, state_mask: int):
+        self._system.call('EnumAudioEndpoints')
+        return _Collection(self._system, [
+            d for d in self._system.devices.values()
+            if (flow == EDataFlow.eAll or d.flow == flow) and d.state & state_mask
+        ])
+
+    def GetDevice(self, device_id: str):
+        self._system.call('GetDevice')
+        return _Device(self._system, self._system.device(device_id))
+
+    def GetDefaultAudioEndpoint(self, flow: int, role: int):
+        self._system.call('GetDefaultAudioEndpoint')
+        active = self._system.active_ids(flow)
+        if len(active) == 0:
+            raise SimulatedAudioError('Element not found: default audio endpoint')
+        return _Device(self._system, self._system.device(active[0]))
+
+    def RegisterEndpointNotificationCallback(self, client):
+        self._system.call('RegisterEndpointNotificationCallback')
+        with self._system._lock:
+            self._system._clients.append(client)
+
+    def UnregisterEndpointNotificationCallback(self, client):
+        self._system.call('UnregisterEndpointNotificationCallback')
+        with self._system._lock:
+            self._system._clients.remove(client)
+
+
+class _Collection:
+
+    def __init__(self, system: 'SimulatedAudioSystem', devices: list):
+        self._system = system
+        self._devices = devices
+
+    def GetCount(self) -> int:
+        self._system.call('GetCount')
+        return len(self._devices)
+
+    def Item(self, i: int):
+        self._system.call('Item')
+        return _Device(self._system, self._devices[i])
+
+
+class _Device:
+
+    def __init__(self, system: 'SimulatedAudioSystem', device: SimulatedDevice):
+        self._system = system
+        self._device = device
+
+    def GetId(self) -> str:
+        self._system.call('GetId')
+        return self._device.id
+
+    def GetState(self) -> int:
+        self._system.call('GetState')
+        return self._device.state
+
+    def QueryInterface(self, interface):
+        # IMMEndpoint is implemented by the device object itself.
+        self._system.call('QueryInterface')
+        return self
+
+    def GetDataFlow(self) -> int:
+        self._system.call('GetDataFlow')
+        return self._device.flow
+
+    def OpenPropertyStore(self, mode: int):
+        self._system.call('OpenPropertyStore')
+        return _PropertyStore(self._system, self._device)
+
+    def Activate(self, interface, context, params):
+        self._system.call('Activate', self._device)
+        if interface == SimulatedCom.IAudioSessionManager2:
+            return _SessionManager(self._system, self._device)
+        return _EndpointVolume(self._system, self._device)
+
+
+class _PropVariant:
+    __slots__ = ('_value',)
+
+    def __init__(self, value):
+        self._value = value
+
+    def GetValue(self):
+        # Conversion of the PROPVARIANT in memory, not a COM call.
+        return self._value
+
+
+class _PropertyStore:
+
+    def __init__(self, system: 'SimulatedAudioSystem', device: SimulatedDevice):
+        self._system = system
+        self._device = device
+
+    def GetValue(self, key: tuple):
+        self._system.call('GetValue')
+        values = {
+            PKEY_Device_FriendlyName: self._device.name,
+            PKEY_Device_DeviceDesc: self._device.description,
+            PKEY_AudioEndpoint_FormFactor: self._device.form_factor,
+        }
+        return _PropVariant(values.get(key))
+
+
+class _EndpointVolume:
+
+    def __init__(self, system: 'SimulatedAudioSystem', device: SimulatedDevice):
+        self._system = system
+        self._device = device
+
+    def _call(self, name: str) -> SimulatedDevice:
+        self._system.call(name, self._device)
+        if self._system.devices.get(self._device.id) is not self._device:
+            # AUDCLNT_E_DEVICE_INVALIDATED
+            raise SimulatedAudioError(f'Device invalidated: {self._device.id}')
+        return self._device
+
+    def GetMute(self) -> int:
+        return int(self._call('GetMute').mute)
+
+    def SetMute(self, mute: bool, context):
+        self._call('SetMute').mute = bool(mute)
+
+    def GetMasterVolumeLevelScalar(self) -> float:
+        return self._call('GetMasterVolumeLevelScalar').volume
+
+    def SetMasterVolumeLevelScalar(self, volume: float, context):
+        self._call('SetMasterVolumeLevelScalar').volume = volume
+
+
+class _SessionManager:
+
+    def __init__(self, system: 'SimulatedAudioSystem', device: SimulatedDevice):
+        self._system = system
+        self._device = device
+
+    def RegisterSessionNotification(self, client):
+        self._system.call('RegisterSessionNotification')
+        with self._system._lock:
+            self._system._session_clients.append((self._device.id, client))
+
+    def UnregisterSessionNotification(self, client):
+        self._system.call('UnregisterSessionNotification')
+        with self._system._lock:
+            self._system._session_clients.remove((self._device.id, client))
+
+    def GetSessionEnumerator(self):
+        self._system.call('GetSessionEnumerator')
+        return _SessionEnumerator(self._system, [
+            s for s in self._system.sessions.values() if s.device_id == self._device.id
+        ])
+
+
+class _SessionEnumerator:
+
+    def __init__(self, system: 'SimulatedAudioSystem', sessions: list):
+        self._system = system
+        self._sessions = sessions
+
+    def GetCount(self) -> int:
+        self._system.call('GetCount')
+        return len(self._sessions)
+
+    def GetSession(self, i: int):
+        self._system.call('GetSession')
+        return _SessionControl(self._system, self._sessions[i])
+
+
+class _SessionControl:
+
+    def __init__(self, system: 'SimulatedAudioSystem', session: SimulatedSession):
+        self._system = system
+        self._session = session
+
+    def QueryInterface(self, interface):
+        self._system.call('QueryInterface')
+        if interface == SimulatedCom.ISimpleAudioVolume:
+            return _SimpleVolume(self._system, self._session)
+        return self
+
+    def GetState(self) -> int:
+        self._system.call('GetState')
+        if self._system.sessions.get(self._session.id) is not self._session:
+            return AudioSessionState.Expired
+        return AudioSessionState.Active
+
+    def GetSessionInstanceIdentifier(self) -> str:
+        self._system.call('GetSessionInstanceIdentifier')
+        return self._session.id
+
+    def GetProcessId(self) -> int:
+        self._system.call('GetProcessId')
+        return hash(self._session.process_name) & 0xFFFF
+
+    def RegisterAudioSessionNotification(self, events):
+        self._system.call('RegisterAudioSessionNotification')
+        with self._system._lock:
+            self._system._session_events.setdefault(self._session.id, []).append(events)
+
+    def UnregisterAudioSessionNotification(self, events):
+        self._system.call('UnregisterAudioSessionNotification')
+        with self._system._lock:
+            registered = self._system._session_events.get(self._session.id, [])
+            if events in registered:
+                registered.remove(events)
+            if len(registered) == 0:
+                self._system._session_events.pop(self._session.id, None)
+
+
+class _SimpleVolume:
+
+    def __init__(self, system: 'SimulatedAudioSystem', session: SimulatedSession):
+        self._system = system
+        self._session = session
+
+    def GetMute(self) -> int:
+        self._system.call('GetMute', self._session)
+        return int(self._session.mute)
+
+    def SetMute(self, mute: bool, context):
+        self._system.call('SetMute', self._session)
+        self._session.mute = bool(mute)
+
+    def GetMasterVolume(self) -> float:
+        self._system.call('GetMasterVolume', self._session)
+        return self._session.volume
+
+    def SetMasterVolume(self, volume: float, context):
+        self._system.call('SetMasterVolume', self._session)
+        self._session.volume = volume
+
+
+class SimulatedCom:
+    """
+    COM layer of core_audio over the simulated COM objects of a SimulatedAudioSystem,
+    with the same names as core_audio_com. The interfaces are named by strings.
+
+    The notification objects are the handlers themselves, since the simulated
+    objects call them directly.
+    """
+
+    COMError = SimulatedAudioError
+
+    IMMEndpoint = 'IMMEndpoint'
+    IAudioEndpointVolume = 'IAudioEndpointVolume'
+    IAudioSessionManager2 = 'IAudioSessionManager2'
+    IAudioSessionControl2 = 'IAudioSessionControl2'
+    ISimpleAudioVolume = 'ISimpleAudioVolume'
+
+    def __init__(self, system: 'SimulatedAudioSystem'):
+        self._system = system
+
+    def CoInitialize(self):
+        self._system.call('CoInitialize')
+
+    def CoUninitialize(self):
+        self._system.call('CoUninitialize')
+
+    def create_enumerator(self) -> _Enumerator:
+        self._system.call('CoCreateInstance')
+        return _Enumerator(self._system)
+
+    def activate(self, device: _Device, interface):
+        return device.Activate(interface, None, None)
+
+    def property_key(self, fmtid: str, pid: int) -> tuple:
+        return (fmtid, pid)
+
+    def session_identity(self, control: _SessionControl) -> tuple:
+        session_id = control.GetSessionInstanceIdentifier()
+        control.GetProcessId()
+        return session_id, control._session.process_name
+
+    def notification_client(self, handler):
+        return handler
+
+    def session_notification(self, handler):
+        return handler
+
+    def session_events(self, handler):
+        return handler
+
+
+class SimulatedAudioSystem:
+    """
+    Simulated devices and sessions, call counters and latency/failure configuration.
+
+    As an audio_backend provider, backend(), notification_source() and
+    session_source() return the CoreAudio classes over the SimulatedCom of the system.
+    """
+
+    def __init__(self, device_count: int = 4, capture_count: int = 0,
+                 latency: float = 0.0, jitter: float = 0.0,
+                 failure_rate: float = 0.0, seed: int | None = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.calls = Counter()
+        self.devices = {}
+        self.sessions = {}
+        self.com = SimulatedCom(self)
+        self.info_cache = DeviceInfoCache() # Not shared with other systems, nor saved
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._session_count = 0
+        self._clients = []         # IMMNotificationClient
+        self._session_clients = [] # (device ID, IAudioSessionNotification)
+        self._session_events = {}  # session ID -> [IAudioSessionEvents]
+
+        for i in range(device_count):
+            self.add_device(f'Speakers {i + 1}', EDataFlow.eRender)
+        for i in range(capture_count):
+            self.add_device(f'Microphone {i + 1}', EDataFlow.eCapture)
+
+    # audio_backend provider
+
+    def backend(self, registry=None) -> CoreAudio:
+        """
+        Return a new CoreAudio session on this system.
+        """
+        return CoreAudio(registry, self.info_cache, self.com)
+
+    def notification_source(self) -> EndpointNotificationSource:
+        return EndpointNotificationSource(self.com, self.info_cache)
+
+    def session_source(self, flows=EDataFlow.SPEAKERS) -> SessionNotificationSource:
+        return SessionNotificationSource(flows, self.com)
+
+    def call(self, name: str, device: SimulatedDevice | SimulatedSession | None = None):
+        """
+        Count one COM call and wait for its latency.
+        """
+        with self._lock:
+            self.calls[name] += 1
+            delay = self.latency
+            if self.jitter > 0:
+                delay += self._random.uniform(-self.jitter, self.jitter)
+            fail = False
+            if device is not None and name.startswith('Set'):
+                delay += device.latency
+                fail = device.fail or (self.failure_rate > 0 and self._random.random() < self.failure_rate)
+
+        if delay > 0:
+            with phase(name, None if device is None else device.id):
+                time.sleep(delay)
+        if fail:
+            raise SimulatedAudioError(f'{name} failed on {device.id}') # type: ignore
+
+    def call_count(self) -> int:
+        return sum(self.calls.values())
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+    def device(self, device_id: str) -> SimulatedDevice:
+        device = self.devices.get(device_id)
+        if device is None:
+            raise SimulatedAudioError(f'Element not found: {device_id}')
+        return device
+
+    def active_ids(self, flow: int) -> list:
+        return [d.id for d in self.devices.values() if d.flow == flow and d.state == DeviceState.ACTIVE]
+
+    def device_states(self) -> dict:
+        return {d.id: (d.state, d.flow) for d in self.devices.values()}
+
+    # Device changes, which fire the IMMNotificationClient
+
+    def _notify(self, method: str, *args):
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            getattr(client, method)(*args)
+
+    def add_device(self, name: str, flow: int = EDataFlow.eRender, form_factor: int | None = None) -> str:
+        device_id = '{0.0.%d.00000000}.{%08x-0000-0000-0000-000000000000}' % (flow, len(self.devices) + 1)
+        self.devices[device_id] = SimulatedDevice(device_id, name, flow, form_factor)
+        self._notify('on_device_added', device_id)
+        return device_id
+
+    def remove_device(self, device_id: str):
+        del self.devices[device_id]
+        self._notify('on_device_removed', device_id)
+
+    def set_device_state(self, device_id: str, state: int):
+        self.devices[device_id].state = state
+        self._notify('on_device_state_changed', device_id, state)
+
+    def rename_device(self, device_id: str, name: str):
+        self.devices[device_id].name = name
+        self._notify('on_property_value_changed', device_id, *PKEY_Device_FriendlyName)
+
+    # Application sessions, which fire the IAudioSessionNotification and IAudioSessionEvents
+
+    def add_session(self, process_name: str, device_id: str | None = None) -> str:
+        if device_id is None:
+            device_id = self.active_ids(EDataFlow.eRender)[0]
+        self._session_count += 1
+        session_id = f'{device_id}|{process_name}%b{self._session_count}'
+        session = SimulatedSession(session_id, process_name, device_id)
+        self.sessions[session_id] = session
+
+        with self._lock:
+            clients = [client for id, client in self._session_clients if id == device_id]
+        for client in clients:
+            client.on_session_created(_SessionControl(self, session))
+        return session_id
+
+    def end_session(self, session_id: str):
+        del self.sessions[session_id]
+
+        with self._lock:
+            events = list(self._session_events.get(session_id, []))
+        for callback in events:
+            callback.on_state_changed(AudioSessionState.Expired)
+
+
+_default_system = None
+
+
+def default_system() -> SimulatedAudioSystem:
+    """
+    Return the process-wide simulated system configured by the environment variables.
+    """
+    global _default_system
+
+    if _default_system is None:
+        seed = os.environ.get('WIN_AUTO_MUTE_SIM_SEED')
+        _default_system = SimulatedAudioSystem(
+            device_count=int(os.environ.get('WIN_AUTO_MUTE_SIM_DEVICES', '4')),
+            capture_count=int(os.environ.get('WIN_AUTO_MUTE_SIM_MICROPHONES', '0')),
+            latency=float(os.environ.get('WIN_AUTO_MUTE_SIM_LATENCY', '0')),
+            jitter=float(os.environ.get('WIN_AUTO_MUTE_SIM_JITTER', '0')),
+            failure_rate=float(os.environ.get('WIN_AUTO_MUTE_SIM_FAILURE_RATE', '0')),
+            seed=None if seed is None else int(seed),
+        )
+    return _default_system
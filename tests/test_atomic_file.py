@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+from atomic_file import dump_versioned, load_versioned, write_atomic
+
+
+def test_versioned_file_round_trips(tmp_path):
+    path = tmp_path / 'cache.json'
+    write_atomic(path, dump_versioned(3, devices=[['a', 'Speakers']]))
+
+    assert load_versioned(path, 3) == {'version': 3, 'devices': [['a', 'Speakers']]}
+    assert load_versioned(path, 2) is None
+    assert [p.name for p in tmp_path.iterdir()] == ['cache.json']
+
+
+@pytest.mark.parametrize('content', ['', '[1, 2]', '{"devices": []}', '{"version": 1'])
+def test_unreadable_file_is_missing(tmp_path, content):
+    path = tmp_path / 'cache.json'
+    path.write_text(content)
+
+    assert load_versioned(path, 1) is None
+    assert load_versioned(tmp_path / 'missing.json', 1) is None
+
+
+def test_failed_write_keeps_the_file(tmp_path):
+    path = tmp_path / 'settings.json'
+    path.write_text(json.dumps({'mute': True}))
+
+    with pytest.raises(TypeError):
+        write_atomic(path, 'not bytes')
+    assert json.loads(path.read_text()) == {'mute': True}
+    assert [p.name for p in tmp_path.iterdir()] == ['settings.json']
@@ -0,0 +1,26 @@
+import benchmark_mute
+
+
+def test_scenarios_are_within_budget():
+    for scenario in benchmark_mute.SCENARIOS:
+        for devices in (1, 3, 8):
+            result = benchmark_mute.run_case(scenario, devices, 0.0, 3)
+            assert result['over_budget'] == [], (scenario, devices)
+
+
+def test_over_budget_names_the_method():
+    items = benchmark_mute.budget(benchmark_mute.ACTIVATE, benchmark_mute.NAME)
+    calls = {'Activate': 2, 'GetValue': 8, 'QueryInterface': 2}
+
+    assert benchmark_mute.over_budget(calls, items, 2) == ['GetValue 8 > 6', 'QueryInterface 2 > 0']
+
+
+def test_compare_finds_more_calls_of_a_method():
+    old = {'scenario': 's', 'devices': 1, 'latency': 0, 'calls': 5,
+           'first_calls': {'GetValue': 1}, 'later_calls': {}}
+    new = dict(old, first_calls={'GetValue': 3}, later_calls={'GetValue': 1})
+
+    assert benchmark_mute.compare([new], {'results': [old]}) == [
+        's devices=1 latency=0: first_calls GetValue 1 -> 3',
+        's devices=1 latency=0: later_calls GetValue 0 -> 1',
+    ]
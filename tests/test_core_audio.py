@@ -0,0 +1,198 @@
+import json
+
+from core_audio_constants import DeviceState, EDataFlow, EndpointFormFactor, ERole
+from device_info import DeviceInfo, DeviceInfoCache
+from device_registry import DeviceRegistry
+from session_registry import SessionRegistry
+from simulated_audio import SimulatedAudioSystem
+
+
+def test_apply_mutes_and_skips_silent_devices():
+    system = SimulatedAudioSystem(device_count=2)
+    with system.backend() as ca:
+        first = ca.apply(mute=True, volume=0.0)
+        second = ca.apply(mute=True, volume=0.0)
+
+    assert [r.applied for r in first] == [2, 2]
+    assert [r.name for r in first] == ['Speakers 1', 'Speakers 2']
+    assert [r.skipped for r in second] == [2, 2]
+    assert all(d.mute and d.volume == 0.0 for d in system.devices.values())
+
+
+def test_apply_reads_properties_once():
+    system = SimulatedAudioSystem(device_count=3)
+    with system.backend() as ca:
+        ca.apply(mute=True)
+        system.reset_calls()
+        ca.apply(mute=True)
+
+    assert system.calls['OpenPropertyStore'] == 0
+    assert system.calls['Activate'] == 0
+
+
+def test_failed_set_is_recorded_per_device():
+    system = SimulatedAudioSystem(device_count=2)
+    failing = list(system.devices.values())[0]
+    failing.fail = True
+    with system.backend() as ca:
+        results = ca.apply(mute=True)
+
+    assert results[0].error is not None
+    assert results[1].error is None and results[1].applied == 1
+
+
+def test_removed_device_is_dropped_from_the_cache():
+    system = SimulatedAudioSystem(device_count=2)
+    with system.backend() as ca:
+        removed = ca.audio_device_id_list()[0]
+        ca.prepare()
+        system.remove_device(removed)
+        results = ca.apply(mute=True)
+
+    assert [r.device_id for r in results] == list(system.devices)
+
+
+def test_registry_follows_device_notifications():
+    system = SimulatedAudioSystem(device_count=2)
+    registry = DeviceRegistry()
+    registry.start(system.notification_source())
+    try:
+        ca = system.backend(registry)
+        added = system.add_device('USB Speakers')
+        assert added in ca.audio_device_id_list()
+
+        system.set_device_state(added, DeviceState.DISABLED)
+        assert added not in ca.audio_device_id_list()
+
+        default = ca.get_default_audio_device_id(ERole.eMultimedia)
+        system.reset_calls()
+        assert ca.get_default_audio_device_id(ERole.eMultimedia) == default
+        assert system.call_count() == 0
+        ca.close()
+    finally:
+        registry.stop()
+
+    assert system._clients == []
+
+
+def test_session_source_tracks_sessions():
+    system = SimulatedAudioSystem(device_count=1, capture_count=1)
+    microphone = system.active_ids(EDataFlow.eCapture)[0]
+    system.add_session('player.exe')
+    system.add_session('recorder.exe', microphone)
+
+    registry = SessionRegistry()
+    registry.start(system.session_source(EDataFlow.SPEAKERS))
+    try:
+        browser = system.add_session('browser.exe')
+        assert sorted(s.process_name for s in registry.matching()) == ['browser.exe', 'player.exe']
+
+        system.end_session(browser)
+        ca = system.backend()
+        results = ca.apply_sessions(registry.matching(), mute=True)
+        ca.close()
+    finally:
+        registry.stop()
+
+    assert [r.name for r in results] == ['player.exe']
+    assert [s.mute for s in system.sessions.values()] == [True, False]
+    assert system._session_clients == [] and system._session_events == {}
+
+
+def test_properties_are_read_in_one_pass():
+    system = SimulatedAudioSystem(device_count=1)
+    device_id = system.active_ids(EDataFlow.eRender)[0]
+    registry = DeviceRegistry()
+    registry.start(system.notification_source())
+    try:
+        with system.backend(registry) as ca:
+            ca.apply(mute=True)
+            assert (system.calls['OpenPropertyStore'], system.calls['GetValue']) == (1, 3)
+
+            system.reset_calls()
+            assert ca.get_device_properties(device_id) == ('Speakers 1', EndpointFormFactor.Speakers)
+            info = ca.get_device_info(device_id)
+            assert system.call_count() == 0
+    finally:
+        registry.stop()
+
+    assert (info.description, info.state, info.flow) == ('Speakers', DeviceState.ACTIVE, EDataFlow.eRender)
+
+
+def test_renamed_device_is_read_again():
+    system = SimulatedAudioSystem(device_count=1)
+    device_id = system.active_ids(EDataFlow.eRender)[0]
+    registry = DeviceRegistry()
+    registry.start(system.notification_source())
+    try:
+        ca = system.backend(registry)
+        assert ca.get_friendly_name(device_id) == 'Speakers 1'
+        generation = registry.generation
+
+        system.rename_device(device_id, 'Living Room')
+        assert registry.generation != generation
+        assert ca.get_friendly_name(device_id) == 'Living Room'
+        ca.close()
+    finally:
+        registry.stop()
+
+
+def test_info_cache_saves_the_properties_but_not_the_state(tmp_path):
+    path = tmp_path / 'devices.json'
+    cache = DeviceInfoCache(path=path)
+    cache.put(DeviceInfo('a', 'Speakers (USB)', 'Speakers', EndpointFormFactor.Speakers, DeviceState.ACTIVE, EDataFlow.eRender))
+    cache.save()
+
+    assert json.loads(path.read_text()) == {
+        'version': 3, 'devices': [['a', 'Speakers (USB)', 'Speakers', EndpointFormFactor.Speakers, EDataFlow.eRender]],
+    }
+    loaded = DeviceInfoCache(path=path).load().get('a')
+    assert (loaded.name, loaded.form_factor, loaded.state, loaded.flow) == (
+        'Speakers (USB)', EndpointFormFactor.Speakers, None, EDataFlow.eRender,
+    )
+
+
+def test_info_cache_ignores_the_old_version(tmp_path):
+    path = tmp_path / 'devices.json'
+    path.write_text(json.dumps({'version': 2, 'devices': [['a', 'Speakers']]}))
+
+    assert len(DeviceInfoCache(path=path).load()) == 0
+
+
+def test_session_source_follows_devices_one_by_one():
+    system = SimulatedAudioSystem(device_count=2)
+    first, second = system.active_ids(EDataFlow.eRender)
+    system.add_session('player.exe', first)
+    system.add_session('browser.exe', second)
+
+    registry = SessionRegistry()
+    registry.start(system.session_source())
+    try:
+        added = system.add_device('USB Speakers')
+        system.add_session('game.exe', added)
+        system.remove_device(second)
+        system.reset_calls()
+        registry.update([first, added])
+
+        assert sorted(s.process_name for s in registry.matching()) == ['game.exe', 'player.exe']
+        assert system.calls['GetSessionEnumerator'] == 1
+        assert [id for id, _ in system._session_clients] == [first, added]
+    finally:
+        registry.stop()
+
+
+def test_expired_session_is_unregistered_by_update():
+    system = SimulatedAudioSystem(device_count=1)
+    player = system.add_session('player.exe')
+
+    registry = SessionRegistry()
+    registry.start(system.session_source())
+    try:
+        system.end_session(player)
+        assert len(registry) == 0
+
+        registry.update(system.active_ids(EDataFlow.eRender))
+        assert system._session_events == {}
+        assert system.calls['GetSessionEnumerator'] == 1
+    finally:
+        registry.stop()
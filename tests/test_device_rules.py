@@ -0,0 +1,85 @@
+import pytest
+
+from core_audio_constants import EndpointFormFactor
+from device_rules import DeviceRules
+
+PROPERTIES = {
+    'hdmi':    ('LG HDMI', EndpointFormFactor.DigitalAudioDisplayDevice),
+    'headset': ('USB Headset', EndpointFormFactor.Headset),
+    'speaker': ('Realtek Speakers', EndpointFormFactor.Speakers),
+}
+
+
+def read_properties(device_id):
+    return PROPERTIES[device_id]
+
+
+def test_empty_rules_are_false():
+    assert not DeviceRules.from_setting(None)
+    assert not DeviceRules.from_setting({})
+
+
+def test_exclude_form_factor():
+    rules = DeviceRules.from_setting({'exclude': [{'form_factor': 'hdmi'}]})
+    assert rules.select(list(PROPERTIES), read_properties) == ['headset', 'speaker']
+
+
+def test_include_name_any_case():
+    rules = DeviceRules.from_setting({'include': [{'name': 'headset'}, {'name': '^realtek'}]})
+    assert rules.select(list(PROPERTIES), read_properties) == ['headset', 'speaker']
+
+
+def test_exclude_id_needs_no_properties():
+    rules = DeviceRules.from_setting({'exclude': [{'id': 'HDMI'}]})
+    assert rules.select(['hdmi'], lambda device_id: pytest.fail('read')) == []
+
+
+@pytest.mark.parametrize('value', [
+    {'exclude': [{'name': '(?i)hdmi'}]},
+    {'include': [{'name': 'Headset'}, {'name': '(?i)speakers'}]},
+])
+def test_inline_flags(value):
+    rules = DeviceRules.from_setting(value)
+    assert rules.select(list(PROPERTIES), read_properties) == ['headset', 'speaker']
+
+
+@pytest.mark.parametrize('value', [
+    [],
+    {'include': {}},
+    {'include': [{'name': '('}]},
+    {'include': [{'name': 'a', 'id': 'b'}]},
+    {'exclude': [{'form_factor': 'tv'}]},
+    {'exclude': [{'name': 1}]},
+    {'other': []},
+])
+def test_invalid_setting(value):
+    with pytest.raises(ValueError):
+        DeviceRules.from_setting(value)
+
+
+def test_decisions_are_memoized_per_generation():
+    reads = []
+
+    def counting(device_id):
+        reads.append(device_id)
+        return read_properties(device_id)
+
+    rules = DeviceRules.from_setting({'exclude': [{'name': 'hdmi'}]})
+    rules.select(list(PROPERTIES), counting, generation=1)
+    rules.select(list(PROPERTIES), counting, generation=1)
+    assert len(reads) == 3
+    rules.select(list(PROPERTIES), counting, generation=2)
+    assert len(reads) == 6
+
+
+def test_failed_read_is_not_memoized():
+    calls = []
+
+    def failing(device_id):
+        calls.append(device_id)
+        raise OSError('gone')
+
+    rules = DeviceRules.from_setting({'exclude': [{'name': 'hdmi'}]})
+    assert rules.select(['hdmi'], failing) == ['hdmi']
+    assert rules.select(['hdmi'], failing) == ['hdmi']
+    assert len(calls) == 2
@@ -0,0 +1,77 @@
+from ctypes import POINTER, c_int, c_void_p, cast, pointer
+
+import win32_stub
+from message_dispatch import MessageDispatcher
+from winapi_constants import WM_APP, WM_COMMAND, WM_TIMER
+
+win32_stub.install()
+import win_auto_mute
+
+ID_MENU = 1000
+HWND_BUTTON = 0x1234
+BN_CLICKED = 0
+
+
+def recorder(calls, name):
+    return lambda hwnd, wParam, lParam: calls.append((name, wParam, lParam))
+
+
+def test_menu_command_is_routed_by_its_id():
+    calls = []
+    dispatcher = MessageDispatcher()
+    dispatcher.on_command(ID_MENU, recorder(calls, 'menu'))
+
+    # The high word of wParam is 0 for a menu, 1 for an accelerator.
+    assert dispatcher.dispatch(None, WM_COMMAND, ID_MENU, 0) == 0
+    assert dispatcher.dispatch(None, WM_COMMAND, (1 << 16) | ID_MENU, 0) == 0
+    dispatcher.dispatch(None, WM_COMMAND, ID_MENU + 1, 0)
+    assert calls == [('menu', ID_MENU, 0), ('menu', (1 << 16) | ID_MENU, 0)]
+
+
+def test_control_command_is_routed_by_its_handle():
+    calls = []
+    dispatcher = MessageDispatcher()
+    dispatcher.on_command(ID_MENU, recorder(calls, 'menu'))
+
+    @dispatcher.on_control(HWND_BUTTON)
+    def on_button(hwnd, wParam, lParam):
+        calls.append(('button', wParam, lParam))
+
+    # A control's notification carries its own ID, which must not reach the menu table.
+    wParam = (BN_CLICKED << 16) | ID_MENU
+    assert dispatcher.dispatch(None, WM_COMMAND, wParam, HWND_BUTTON) == 0
+    dispatcher.dispatch(None, WM_COMMAND, wParam, HWND_BUTTON + 1)
+    assert calls == [('button', wParam, HWND_BUTTON)]
+    assert dispatcher.controls[HWND_BUTTON] is on_button
+
+
+def test_message_result_is_returned():
+    dispatcher = MessageDispatcher()
+    dispatcher.on_message(WM_APP, lambda hwnd, wParam, lParam: wParam + lParam)
+    dispatcher.on_message(WM_TIMER, lambda hwnd, wParam, lParam: None)
+
+    assert dispatcher.dispatch(None, WM_APP, 1, 2) == 3
+    assert dispatcher.dispatch(None, WM_TIMER, 0, 0) == 0
+    assert dispatcher.dispatch(None, WM_APP + 1, 0, 0) is None
+
+
+def test_unhandled_message_falls_through_to_def_window_proc(monkeypatch):
+    calls = []
+    dispatcher = MessageDispatcher()
+    dispatcher.on_message(WM_APP, recorder(calls, 'app'))
+    monkeypatch.setattr(win_auto_mute, 'dispatcher', dispatcher)
+    monkeypatch.setattr(win_auto_mute, 'DefWindowProc', lambda hwnd, message, wParam, lParam: calls.append(('default', message)) or 7)
+
+    value = c_int(0)
+    lParam = cast(pointer(value), POINTER(c_int))
+    assert win_auto_mute.WindowProc(None, WM_APP + 1, 0, lParam) == 7
+    assert win_auto_mute.WindowProc(None, WM_APP, 5, lParam) == 0
+    assert calls == [('default', WM_APP + 1), ('app', 5, cast(lParam, c_void_p).value)]
+
+
+def test_tray_exit_command_closes_the_window(monkeypatch):
+    posted = []
+    monkeypatch.setattr(win_auto_mute, 'PostMessage', lambda hwnd, message, wParam, lParam: posted.append((hwnd, message)))
+
+    win_auto_mute.dispatcher.dispatch(42, WM_COMMAND, win_auto_mute.ID_TRAY_EXIT, 0)
+    assert posted == [(42, win_auto_mute.WM_CLOSE)]
@@ -0,0 +1,71 @@
+import builtins
+import json
+import threading
+
+import pytest
+
+import mute_log
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(mute_log, '_log_folder', str(tmp_path))
+    yield tmp_path
+    assert mute_log.flush(5)
+    mute_log.configure()
+
+
+def test_records_are_written_in_batches(folder, monkeypatch):
+    opened = []
+    release = threading.Event()
+
+    def blocking_open(*args, **kwargs):
+        opened.append(args[0])
+        release.wait(5)
+        return builtins.open(*args, **kwargs)
+
+    monkeypatch.setattr(mute_log, 'open', blocking_open, raising=False)
+    mute_log.mute_log('first')
+    for i in range(50):
+        mute_log.mute_log(f'line {i}')
+
+    # The writer is held in the first open, so flush() times out.
+    assert not mute_log.flush(0.05)
+    release.set()
+    assert mute_log.flush(5)
+
+    lines = (folder / 'win_auto_mute.log').read_text(encoding='utf-8').splitlines()
+    assert [line.split(' : ', 1)[1] for line in lines] == ['first'] + [f'line {i}' for i in range(50)]
+    assert len(opened) <= 2
+
+
+def test_jsonl_has_the_event_fields(folder):
+    mute_log.configure(mute_log.FORMAT_JSONL)
+    mute_log.mute_event('shutdown', 'id-1', 'Speakers', 'mute', 0.002, 'ok', 'Speakers - Mute(True)')
+    mute_log.mute_log('note')
+    assert mute_log.flush(5)
+
+    event, note = [json.loads(line) for line in (folder / 'win_auto_mute.jsonl').read_text(encoding='utf-8').splitlines()]
+    assert {k: v for k, v in event.items() if k != 'timestamp'} == {
+        'trigger': 'shutdown', 'device_id': 'id-1', 'name': 'Speakers', 'action': 'mute',
+        'duration': 0.002, 'result': 'ok',
+    }
+    assert note['message'] == 'note' and 'timestamp' in note
+    assert not (folder / 'win_auto_mute.log').exists()
+
+
+def test_log_is_rotated_by_size_with_the_backup_count(folder):
+    mute_log.configure(mute_log.FORMAT_TEXT, max_bytes=100, backups=2)
+    for i in range(6):
+        mute_log.mute_log(f'{i}' * 60)
+        assert mute_log.flush(5)
+
+    names = sorted(p.name for p in folder.iterdir())
+    assert names == ['win_auto_mute.log', 'win_auto_mute.log.1', 'win_auto_mute.log.2']
+    newest = [(folder / name).read_text().split(' : ')[1].strip() for name in names]
+    assert newest == ['5' * 60, '4' * 60, '3' * 60]
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        mute_log.configure('xml')
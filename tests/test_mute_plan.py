@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+
+import audio_backend
+from core_audio_constants import EDataFlow
+from device_registry import DeviceRegistry
+from mute_speakers import SPEAKERS, MutePlan, device_flows
+from simulated_audio import SimulatedAudioSystem
+
+
+@pytest.fixture
+def system():
+    system = SimulatedAudioSystem(device_count=4)
+    audio_backend.set_backend(system)
+    yield system
+    audio_backend.set_backend(None)
+
+
+def test_plan_mutes_all_devices_on_its_workers(system):
+    plan = MutePlan(True, True, True, False, workers=2)
+    try:
+        callers = set()
+        call = system.call
+
+        def counted(name, device=None):
+            callers.add(threading.current_thread().name)
+            return call(name, device)
+
+        system.call = counted
+        report = plan.run()
+    finally:
+        plan.close()
+
+    assert [r.device_id for r in report.done] == system.active_ids(EDataFlow.eRender)
+    assert report.applied == 8 and report.pending == []
+    assert all(d.mute and d.volume == 0.0 for d in system.devices.values())
+    assert callers == {'mute_plan'}
+
+
+def test_slow_device_is_pending_after_the_deadline(system):
+    slow = system.active_ids(EDataFlow.eRender)[0]
+    system.devices[slow].latency = 1.0
+    plan = MutePlan(True, False, True, False, workers=4)
+    report = plan.run(deadline=0.2)
+
+    assert report.pending == [slow]
+    assert len(report.done) == 3 and all(r.ok for r in report.done)
+    # A worker may still be stuck in the slow call, so the plan is not run again.
+    assert not plan.is_valid(True, False, True, False)
+
+
+def test_plan_with_registry_is_stale_only_on_device_changes(system):
+    changes = []
+    registry = DeviceRegistry(on_change=lambda: changes.append(registry.generation))
+    registry.start(system.notification_source())
+    plan = MutePlan(True, False, True, False, registry=registry)
+    try:
+        assert plan.max_age is None
+        plan.created -= MutePlan.MAX_AGE * 2
+        assert plan.is_valid(True, False, True, False)
+
+        system.add_device('USB Speakers')
+        assert not plan.is_valid(True, False, True, False)
+        assert changes[-1] == registry.generation
+    finally:
+        plan.close()
+        registry.stop()
+
+
+def test_plan_without_registry_ages(system):
+    plan = MutePlan(True, False, True, False)
+    try:
+        assert plan.is_valid(True, False, True, False)
+        assert not plan.is_valid(False, False, True, False)
+        plan.created -= MutePlan.MAX_AGE * 2
+        assert not plan.is_valid(True, False, True, False)
+    finally:
+        plan.close()
+
+
+def test_failed_backend_fails_the_build():
+    class Broken:
+        def backend(self, registry=None):
+            raise OSError('no audio service')
+
+    audio_backend.set_backend(Broken())
+    try:
+        with pytest.raises(OSError):
+            MutePlan(True, False, True, False, workers=2)
+    finally:
+        audio_backend.set_backend(None)
+
+
+def test_hung_driver_times_the_build_out(system):
+    system.latency = 0.5
+    with pytest.raises(TimeoutError):
+        MutePlan(True, False, True, False, build_deadline=0.1)
+
+
+def test_device_flows_fall_back_to_the_speakers():
+    assert device_flows('both') == EDataFlow.BOTH
+    assert device_flows('all') == device_flows(None) == SPEAKERS
@@ -0,0 +1,102 @@
+import datetime
+
+import pytest
+
+from mute_schedule import DailyRule, IdleRule, MuteScheduler, parse_rule
+
+# A Monday
+MONDAY = datetime.datetime(2024, 1, 1, 12, 0)
+
+
+class Clock:
+
+    def __init__(self, now: datetime.datetime):
+        self.now = now
+
+    def __call__(self) -> datetime.datetime:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += datetime.timedelta(seconds=seconds)
+
+
+def scheduler(rules, clock, idle_seconds=None):
+    fired, timers = [], []
+    mute = MuteScheduler(fired.append, timers.append, clock=clock, idle_seconds=idle_seconds)
+    mute.set_rules(rules)
+    return mute, fired, timers
+
+
+@pytest.mark.parametrize('value, days', [
+    ({'at': '18:00'}, set(range(7))),
+    ({'at': '18:00', 'days': 'weekdays'}, set(range(5))),
+    ({'at': '18:00', 'days': ['Sat', 'sun']}, {5, 6}),
+])
+def test_parse_daily_rule(value, days):
+    rule = parse_rule(value)
+    assert (rule.hour, rule.minute, rule.days) == (18, 0, days)
+
+
+@pytest.mark.parametrize('value', [
+    [], {}, {'at': '25:00'}, {'at': 'noon'}, {'at': '18:00', 'days': 'someday'},
+    {'at': '18:00', 'days': ['funday']}, {'at': '18:00', 'days': []}, {'idle_minutes': 0}, {'idle_minutes': True},
+])
+def test_parse_invalid_rule(value):
+    with pytest.raises(ValueError):
+        parse_rule(value)
+
+
+def test_daily_rule_skips_to_the_next_day_of_the_rule():
+    rule = DailyRule(9, 30, {0, 4})
+    assert rule.next_due(MONDAY) == datetime.datetime(2024, 1, 5, 9, 30)
+    assert rule.next_due(MONDAY.replace(hour=9)) == datetime.datetime(2024, 1, 1, 9, 30)
+
+
+def test_timer_is_armed_for_the_earliest_rule_and_fires_once():
+    clock = Clock(MONDAY)
+    mute, fired, timers = scheduler([DailyRule(18, 0), DailyRule(13, 0), DailyRule(13, 0)], clock)
+    assert timers[-1] == 3600
+
+    # A timer which fires early does not mute.
+    clock.advance(1800)
+    mute.on_timer()
+    assert fired == [] and timers[-1] == 1800
+
+    clock.advance(1800)
+    mute.on_timer()
+    assert fired == ['schedule']
+    assert timers[-1] == 5 * 3600
+
+
+def test_no_rules_cancel_the_timer():
+    mute, fired, timers = scheduler([], Clock(MONDAY))
+    assert timers == [None] and mute.next_due() is None
+
+
+def test_idle_rule_fires_once_per_idle_period():
+    clock = Clock(MONDAY)
+    idle = {'seconds': 0.0}
+    mute, fired, timers = scheduler([IdleRule(10)], clock, idle_seconds=lambda: idle['seconds'])
+    assert timers[-1] == 600
+
+    clock.advance(600)
+    idle['seconds'] = 600
+    mute.on_timer()
+    assert fired == ['idle']
+
+    # Still idle: not again until the user comes back and goes idle again.
+    clock.advance(600)
+    idle['seconds'] = 1200
+    mute.on_timer()
+    assert fired == ['idle']
+
+    # The user came back 5 minutes ago.
+    clock.advance(600)
+    idle['seconds'] = 300
+    mute.on_timer()
+    assert fired == ['idle'] and timers[-1] == 300
+
+    clock.advance(300)
+    idle['seconds'] = 600
+    mute.on_timer()
+    assert fired == ['idle', 'idle']
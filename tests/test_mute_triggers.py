@@ -0,0 +1,79 @@
+import struct
+import uuid
+
+import pytest
+
+from message_dispatch import MessageDispatcher
+from mute_triggers import (
+    DISPLAY_DIMMED, DISPLAY_OFF, DISPLAY_ON, GUID_CONSOLE_DISPLAY_STATE, TRIGGER_DEADLINES,
+    MuteTriggers, parse_power_setting,
+)
+from winapi_constants import *
+
+
+def power_setting(guid: uuid.UUID, value: int) -> bytes:
+    return guid.bytes_le + struct.pack('<II', 4, value)
+
+
+@pytest.fixture
+def fired():
+    return []
+
+
+def triggers(fired, enabled, settings=None, resumed=None):
+    dispatcher = MessageDispatcher()
+    MuteTriggers(
+        lambda trigger, deadline: fired.append((trigger, deadline)),
+        enabled,
+        read_setting=lambda address: parse_power_setting(settings[address]),
+        on_resume=None if resumed is None else lambda: resumed.append(True),
+    ).register(dispatcher)
+    return dispatcher
+
+
+def test_parse_power_setting():
+    assert parse_power_setting(power_setting(GUID_CONSOLE_DISPLAY_STATE, DISPLAY_DIMMED)) == (
+        GUID_CONSOLE_DISPLAY_STATE, DISPLAY_DIMMED,
+    )
+
+
+@pytest.mark.parametrize('message, wParam, trigger', [
+    (WM_POWERBROADCAST, PBT_APMSUSPEND, 'suspend'),
+    (WM_WTSSESSION_CHANGE, WTS_SESSION_LOCK, 'lock'),
+    (WM_WTSSESSION_CHANGE, WTS_REMOTE_DISCONNECT, 'disconnect'),
+    (WM_WTSSESSION_CHANGE, WTS_CONSOLE_DISCONNECT, 'disconnect'),
+])
+def test_enabled_trigger_fires_with_its_deadline(fired, message, wParam, trigger):
+    triggers(fired, [trigger]).dispatch(None, message, wParam, 0)
+    assert fired == [(trigger, TRIGGER_DEADLINES[trigger])]
+
+
+def test_disabled_trigger_does_not_fire(fired):
+    dispatcher = triggers(fired, ['lock'])
+    assert dispatcher.dispatch(None, WM_POWERBROADCAST, PBT_APMSUSPEND, 0) == 1
+    dispatcher.dispatch(None, WM_WTSSESSION_CHANGE, WTS_REMOTE_DISCONNECT, 0)
+    assert fired == []
+
+
+def test_display_off_fires_only_when_the_display_goes_off(fired):
+    settings = {
+        1: power_setting(GUID_CONSOLE_DISPLAY_STATE, DISPLAY_OFF),
+        2: power_setting(GUID_CONSOLE_DISPLAY_STATE, DISPLAY_ON),
+        3: power_setting(uuid.uuid4(), DISPLAY_OFF),
+    }
+    dispatcher = triggers(fired, ['display_off'], settings)
+
+    # The state sent at the registration, and another power setting, do not fire.
+    for address in (1, 3, 2, 3):
+        dispatcher.dispatch(None, WM_POWERBROADCAST, PBT_POWERSETTINGCHANGE, address)
+    assert fired == []
+
+    dispatcher.dispatch(None, WM_POWERBROADCAST, PBT_POWERSETTINGCHANGE, 1)
+    dispatcher.dispatch(None, WM_POWERBROADCAST, PBT_POWERSETTINGCHANGE, 1)
+    assert fired == [('display_off', TRIGGER_DEADLINES['display_off'])]
+
+
+def test_resume_calls_on_resume(fired):
+    resumed = []
+    triggers(fired, ['suspend'], resumed=resumed).dispatch(None, WM_POWERBROADCAST, PBT_APMRESUMEAUTOMATIC, 0)
+    assert resumed == [True] and fired == []
@@ -0,0 +1,117 @@
+import threading
+
+import pytest
+
+import audio_backend
+import mute_speakers
+import win32_stub
+from mute_worker import MuteRequest, MuteWorker
+from simulated_audio import SimulatedAudioSystem
+
+win32_stub.install()
+import win_auto_mute
+
+
+@pytest.fixture
+def system():
+    system = SimulatedAudioSystem(device_count=2)
+    audio_backend.set_backend(system)
+    yield system
+    audio_backend.set_backend(None)
+
+
+class Gate:
+    """
+    run() of a MuteWorker which mutes with the simulated backend, after the test
+    opens the gate.
+    """
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.opened = threading.Event()
+        self.runs = []
+
+    def __call__(self, request: MuteRequest):
+        self.started.set()
+        self.opened.wait(5)
+        self.runs.append(request)
+        return mute_speakers.process(request.mute, request.vol, request.target, request.log, trigger=request.trigger)
+
+
+@pytest.fixture
+def gate():
+    gate = Gate()
+    worker = MuteWorker(gate)
+    worker.start()
+    yield gate, worker
+    gate.opened.set()
+    worker.stop()
+
+
+def test_equal_pending_requests_merge(system, gate):
+    gate, worker = gate
+    first = MuteRequest(True, False, True, False, trigger='schedule')
+    assert worker.submit(first)
+    gate.started.wait(5)
+
+    request = MuteRequest(True, False, True, False)
+    assert worker.submit(request)
+    assert not worker.submit(MuteRequest(True, False, True, False))
+    assert worker.submit(MuteRequest(False, True, True, False))
+
+    gate.opened.set()
+    assert worker.wait_idle(5)
+    assert gate.runs == [first, request, MuteRequest(False, True, True, False)]
+    assert all(d.mute and d.volume == 0.0 for d in system.devices.values())
+
+
+def test_running_request_is_not_merged_into(system, gate):
+    gate, worker = gate
+    request = MuteRequest(True, False, True, False)
+    worker.submit(request)
+    gate.started.wait(5)
+
+    # Equal to the running request, which may have read the devices already.
+    assert worker.submit(request)
+    gate.opened.set()
+    assert worker.wait_idle(5)
+    assert gate.runs == [request, request]
+
+
+def test_cancel_drops_pending_work(system, gate):
+    gate, worker = gate
+    worker.submit(MuteRequest(True, False, True, False, trigger='schedule'))
+    gate.started.wait(5)
+    worker.submit(MuteRequest(True, False, True, False))
+    worker.submit(MuteRequest(False, True, True, False))
+
+    assert worker.cancel_pending() == 2
+    gate.opened.set()
+    assert worker.wait_idle(5)
+    assert [r.trigger for r in gate.runs] == ['schedule']
+    assert not any(d.volume == 0.0 for d in system.devices.values())
+
+
+def test_result_is_handed_to_the_ui_thread(system, monkeypatch):
+    posted = []
+    monkeypatch.setattr(win_auto_mute, 'PostMessage', lambda hwnd, message, wParam, lParam: posted.append(message))
+    monkeypatch.setattr(win_auto_mute, 'mute_results', [])
+    logged = []
+    monkeypatch.setattr(win_auto_mute.mute_log, 'mute_log', logged.append)
+
+    def fail(request):
+        raise OSError('no audio service')
+
+    worker = MuteWorker(fail, win_auto_mute.on_mute_done)
+    worker.start()
+    try:
+        worker.submit(MuteRequest(True, False, True, True))
+        assert worker.wait_idle(5)
+    finally:
+        worker.stop()
+
+    # The worker only posts WM_MUTE_DONE; the UI thread takes the result.
+    assert posted == [win_auto_mute.WM_MUTE_DONE] and logged == []
+    win_auto_mute.mute_done()
+    assert logged == ['mute_now - Error(no audio service)']
+    assert win_auto_mute.mute_results == []
@@ -0,0 +1,81 @@
+import json
+import os
+
+import pytest
+
+from settings import Settings, validate
+
+
+@pytest.mark.parametrize('values', [
+    {'log_format': 'json'},
+    {'log_format': 1},
+    {'devices': 'all'},
+    {'backend': 'wasapi'},
+    {'mute': 1},
+    {'log_max_bytes': -1},
+    {'log_backups': True},
+])
+def test_validate_rejects(values):
+    with pytest.raises(ValueError):
+        validate(values)
+
+
+def test_validate_accepts_known_and_unknown_keys():
+    values = {'log_format': 'jsonl', 'devices': 'both', 'mute': False, 'future_key': [1]}
+    assert validate(values) is values
+
+
+@pytest.fixture
+def settings_file(tmp_path):
+    return tmp_path / 'win_auto_mute.json'
+
+
+def test_load_missing_file_uses_defaults(settings_file):
+    settings = Settings(settings_file).load()
+    assert settings['mute'] is True
+    assert settings.errors == []
+
+
+def test_load_falls_back_per_invalid_key(settings_file):
+    settings_file.write_text(json.dumps({
+        'mute': False, 'backend': 'wasapi', 'devices': 'all', 'volume': 'yes', 'custom': 1,
+    }))
+    settings = Settings(settings_file).load()
+
+    assert settings['mute'] is False
+    assert settings['volume'] is False
+    assert 'backend' not in settings
+    assert settings.get('devices', 'speakers') == 'speakers'
+    assert settings['custom'] == 1
+    assert len(settings.errors) == 3
+
+
+def test_load_invalid_json_uses_defaults(settings_file):
+    settings_file.write_text('{"mute": ')
+    settings = Settings(settings_file).load()
+    assert settings['mute'] is True
+    assert len(settings.errors) == 1
+
+
+def test_invalid_values_are_written_back(settings_file):
+    settings_file.write_text(json.dumps({'devices': 'all', 'mute': True}))
+    settings = Settings(settings_file, debounce=0).load()
+    settings.update(mute=False)
+    assert json.loads(settings_file.read_text()) == {'devices': 'all', 'mute': False}
+
+
+def test_reload_rejects_what_load_rejects(settings_file):
+    settings_file.write_text(json.dumps({'mute': True}))
+    settings = Settings(settings_file).load()
+
+    settings_file.write_text(json.dumps({'mute': False, 'backend': 'wasapi'}))
+    os.utime(settings_file, ns=(0, 1))
+    with pytest.raises(ValueError):
+        settings.reload()
+    assert settings['mute'] is True
+
+    settings_file.write_text(json.dumps({'mute': False, 'backend': 'simulated'}))
+    os.utime(settings_file, ns=(0, 2))
+    assert settings.reload()
+    assert settings['mute'] is False
+    assert settings['backend'] == 'simulated'
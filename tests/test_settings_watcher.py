@@ -0,0 +1,89 @@
+import json
+import os
+import struct
+import threading
+
+import pytest
+
+from settings import Settings
+from settings_watcher import SettingsWatcher, changed_file_names
+
+
+@pytest.fixture
+def watched(tmp_path):
+    path = tmp_path / 'win_auto_mute.json'
+    path.write_text(json.dumps({'mute': True}))
+    settings = Settings(path).load()
+    changes = []
+    return path, settings, SettingsWatcher(settings, changes.append, interval=0.01), changes
+
+
+def write(path, values, mtime_ns: int):
+    path.write_text(json.dumps(values))
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_unchanged_mtime_or_content_is_skipped(watched):
+    path, settings, watcher, changes = watched
+    assert not watcher.check()
+
+    # Touched: the mtime changes, the content does not.
+    os.utime(path, ns=(1, 1))
+    assert not watcher.check()
+    assert changes == []
+
+
+def test_invalid_content_keeps_the_settings(watched):
+    path, settings, watcher, changes = watched
+    write(path, {'mute': 'no'}, 1)
+    assert not watcher.check()
+    write(path, ['not', 'an', 'object'], 2)
+    assert not watcher.check()
+    path.write_text('{"mute": ')
+    os.utime(path, ns=(3, 3))
+    assert not watcher.check()
+
+    assert settings['mute'] is True and changes == []
+
+
+def test_valid_edit_is_applied(watched):
+    path, settings, watcher, changes = watched
+    write(path, {'mute': False, 'volume': True}, 1)
+    assert watcher.check()
+
+    assert (settings['mute'], settings['volume']) == (False, True)
+    assert changes == [settings]
+
+
+def test_removed_file_keeps_the_settings(watched):
+    path, settings, watcher, changes = watched
+    path.unlink()
+    assert not watcher.check()
+    assert settings['mute'] is True
+
+
+def test_polling_applies_an_edit(watched):
+    path, settings, watcher, changes = watched
+    changed = threading.Event()
+    watcher.on_change = lambda _: changed.set()
+    # The portable poller, which the watcher falls back to outside Windows.
+    watcher._thread = threading.Thread(target=watcher._poll, daemon=True)
+    watcher._thread.start()
+    try:
+        write(path, {'mute': False}, 1)
+        assert changed.wait(5)
+    finally:
+        watcher.stop()
+
+    assert settings['mute'] is False
+    assert watcher._thread is None
+
+
+def test_changed_file_names():
+    def record(name: str, last: bool) -> bytes:
+        data = name.encode('utf-16-le')
+        size = 12 + len(data)
+        return struct.pack('<III', 0 if last else size, 3, len(data)) + data
+
+    buffer = record('other.txt', False) + record('win_auto_mute.json', True)
+    assert changed_file_names(buffer, len(buffer)) == ['other.txt', 'win_auto_mute.json']
@@ -0,0 +1,80 @@
+import pytest
+
+import audio_backend
+import win32_stub
+from device_registry import DeviceRegistry
+from simulated_audio import SimulatedAudioSystem
+
+win32_stub.install()
+import win_auto_mute
+
+
+@pytest.fixture
+def app(monkeypatch):
+    system = SimulatedAudioSystem(device_count=2)
+    audio_backend.set_backend(system)
+    posted, timers = [], {}
+    monkeypatch.setattr(win_auto_mute, 'PostMessage', lambda hwnd, message, wParam, lParam: posted.append(message))
+    monkeypatch.setattr(win_auto_mute, 'SetTimer', lambda hwnd, id, ms, proc: timers.__setitem__(id, ms))
+    monkeypatch.setattr(win_auto_mute, 'KillTimer', lambda hwnd, id: timers.pop(id, None))
+    monkeypatch.setattr(win_auto_mute.mute_triggers, 'enabled', {'lock'})
+    monkeypatch.setattr(win_auto_mute, 'mute_plan', None)
+    monkeypatch.setattr(win_auto_mute, 'arm_plan_posted', False)
+
+    registry = DeviceRegistry(on_change=win_auto_mute.on_registry_changed)
+    registry.start(system.notification_source())
+    monkeypatch.setattr(win_auto_mute, 'registry', registry)
+    yield system, posted, timers
+    win_auto_mute.disarm_mute_plan()
+    registry.stop()
+    audio_backend.set_backend(None)
+
+
+def deliver(posted):
+    """
+    Handle the WM_ARM_PLAN messages in the queue, as the message loop would.
+    """
+    while win_auto_mute.WM_ARM_PLAN in posted:
+        posted.remove(win_auto_mute.WM_ARM_PLAN)
+        win_auto_mute.on_arm_plan(None, 0, 0)
+
+
+def test_device_change_re_arms_the_plan(app):
+    system, posted, timers = app
+    win_auto_mute.arm_standby_plan()
+    deliver(posted)
+    plan = win_auto_mute.mute_plan
+    assert len(plan.names) == 2
+    assert timers == {win_auto_mute.ID_TIMER_PLAN: int(win_auto_mute.STANDBY_PLAN_REFRESH * 1000)}
+
+    # A burst of changes posts one message.
+    added = system.add_device('USB Speakers')
+    system.rename_device(added, 'Headset')
+    assert posted == [win_auto_mute.WM_ARM_PLAN]
+    deliver(posted)
+
+    assert win_auto_mute.mute_plan is not plan
+    assert len(win_auto_mute.mute_plan.names) == 3
+    assert posted == []
+
+
+def test_timer_rebuilds_the_plan(app):
+    system, posted, timers = app
+    win_auto_mute.arm_standby_plan()
+    plan = win_auto_mute.mute_plan
+
+    win_auto_mute.on_timer(None, win_auto_mute.ID_TIMER_PLAN, 0)
+    assert win_auto_mute.mute_plan is not plan
+    assert win_auto_mute.mute_plan.is_valid(*win_auto_mute.mute_settings(), win_auto_mute.mute_flows(), win_auto_mute.device_rules)
+
+
+def test_no_trigger_stops_the_timer(app, monkeypatch):
+    system, posted, timers = app
+    win_auto_mute.arm_standby_plan()
+    deliver(posted)
+    monkeypatch.setattr(win_auto_mute.mute_triggers, 'enabled', set())
+
+    system.add_device('USB Speakers')
+    assert posted == []
+    win_auto_mute.on_timer(None, win_auto_mute.ID_TIMER_PLAN, 0)
+    assert timers == {}
@@ -0,0 +1,22 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import benchmark_startup
+
+
+@pytest.mark.parametrize('case', list(benchmark_startup.CASES))
+def test_case_does_not_import_forbidden_modules(case):
+    result = benchmark_startup.run_case(case, 1)
+    assert result['forbidden'] == []
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='counts the calls of the Win32 stub')
+def test_tray_setup_removes_its_icon():
+    code = benchmark_startup.WIN32 + benchmark_startup.TRAY_SETUP + '; print(win32_stub.calls["Shell32.Shell_NotifyIconA"])'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=Path(benchmark_startup.__file__).parent)
+    # NIM_ADD by WinMain, NIM_DELETE by the benchmark
+    assert result.stdout.split() == ['2']
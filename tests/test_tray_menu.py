@@ -0,0 +1,15 @@
+import win32_stub
+
+win32_stub.install()
+import win_auto_mute
+
+
+def test_tray_menu_is_built_once(monkeypatch):
+    built = []
+    monkeypatch.setattr(win_auto_mute, 'tray_menu', None)
+    monkeypatch.setattr(win_auto_mute, 'build_tray_menu', lambda: built.append(len(built) + 1) or len(built))
+    monkeypatch.setattr(win_auto_mute, 'DestroyMenu', lambda menu: None)
+
+    assert win_auto_mute.get_tray_menu() == win_auto_mute.get_tray_menu() == 1
+    win_auto_mute.destroy_tray_menu()
+    assert win_auto_mute.get_tray_menu() == 2
@@ -0,0 +1,63 @@
+import json
+
+import audio_backend
+import mute_cli
+import volume_snapshot
+from audio_backend import DeviceResult
+from device_registry import DeviceRegistry
+from mute_speakers import restore_snapshot
+from simulated_audio import SimulatedAudioSystem
+from volume_snapshot import VolumeSnapshot, is_recorded
+
+
+def test_device_added_after_the_registry_started_is_restored(tmp_path):
+    system = SimulatedAudioSystem(device_count=1)
+    audio_backend.set_backend(system)
+    registry = DeviceRegistry()
+    registry.start(system.notification_source())
+    try:
+        with system.backend(registry) as ca:
+            registry_ids = ca.audio_device_id_list()
+        # The device arrives after the logon, as a USB or Bluetooth device does.
+        added = system.add_device('USB Speakers')
+        system.devices[added].mute = True
+        system.devices[added].volume = 0.0
+
+        snapshot = VolumeSnapshot(path=tmp_path / 'volumes.json')
+        snapshot.record([DeviceResult(added, mute=True, volume=0.0, previous_mute=False, previous_volume=0.5)])
+        report = restore_snapshot(snapshot, False, registry)
+    finally:
+        registry.stop()
+        audio_backend.set_backend(None)
+
+    assert added not in registry_ids
+    assert [r.device_id for r in report.done] == [added]
+    assert (system.devices[added].mute, system.devices[added].volume) == (False, 0.5)
+    assert len(snapshot) == 0
+
+
+def test_snapshot_is_recorded_only_for_restore_and_a_real_backend():
+    audio_backend.set_backend(audio_backend.BACKEND_SIMULATED)
+    try:
+        assert not is_recorded(True)
+    finally:
+        audio_backend.set_backend(audio_backend.BACKEND_CORE_AUDIO)
+    try:
+        assert is_recorded(True)
+        assert not is_recorded(False)
+    finally:
+        audio_backend.set_backend(None)
+
+
+def test_cli_mute_does_not_write_the_snapshot(tmp_path, monkeypatch):
+    path = tmp_path / 'volumes.json'
+    monkeypatch.setattr(volume_snapshot, 'default_snapshot_path', lambda: path)
+    settings = tmp_path / 'settings.json'
+    settings.write_text(json.dumps({'restore': True}))
+    monkeypatch.setattr(mute_cli.device_info.shared_cache(), 'path', tmp_path / 'devices.json')
+
+    try:
+        assert mute_cli.main(['--settings', str(settings), '--backend', 'simulated', 'mute', '--all']) == 0
+    finally:
+        audio_backend.set_backend(None)
+    assert not path.exists()
@@ -0,0 +1,138 @@
+"""
+Volume and mute state of the devices before they were muted, so they can be set
+back at the next start (the 'restore' setting).
+
+A mute pass reads the state of each device before it sets it (see
+audio_backend.DeviceResult.previous_mute), so the snapshot costs no more calls
+to the devices. Only the values which the pass has changed are recorded: a value
+which was already muted or zero is either the user's own, or was recorded by an
+earlier pass, and is kept as it is.
+
+The snapshot is saved to `<name>.volumes.json` next to the application in one
+write, so it is small enough to be written within the shutdown window.
+
+    {"version": 1, "devices": [[id, volume, mute], ...]}
+
+volume is a scalar (0.0 - 1.0) and mute a bool, or null if the pass did not change
+it. A file of another version, or which cannot be read, is ignored.
+The snapshot is recorded only while the 'restore' setting is on, and never for the
+devices of the simulated backend (see is_recorded), so the entries which a later
+restore applies are those of the last real mute.
+The application sessions are not recorded, since they do not outlive the logon.
+"""
+
+import threading
+from pathlib import Path
+
+from atomic_file import dump_versioned, load_versioned, write_atomic
+import audio_backend
+from audio_backend import needs_mute, needs_volume
+from get_path import get_script_basename, get_script_folder_path
+
+SNAPSHOT_VERSION = 1
+
+
+def default_snapshot_path() -> Path:
+    return get_script_folder_path() / (get_script_basename() + '.volumes.json')
+
+
+def is_recorded(restore: bool) -> bool:
+    """
+    Return True if a mute should record the snapshot, for the 'restore' setting and
+    the selected audio backend.
+    """
+    return restore and audio_backend.backend_name() != audio_backend.BACKEND_SIMULATED
+
+
+class VolumeSnapshot:
+    """
+    Device ID -> (volume, mute) which the device had before it was muted, up to
+    max_entries devices, oldest first.
+    """
+
+    def __init__(self, max_entries: int = 64, path: Path | None = None):
+        self.max_entries = max_entries
+        self.path = default_snapshot_path() if path is None else Path(path)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def record(self, results) -> bool:
+        """
+        Record the previous values of the DeviceResult of a mute pass, for the
+        values which the pass has changed. Return True if anything was recorded.
+        """
+        changed = False
+        with self._lock:
+            for result in results:
+                volume, mute = self._entries.get(result.device_id, (None, None))
+                if result.previous_volume is not None and result.volume is not None \
+                        and needs_volume(result.previous_volume, result.volume):
+                    volume = round(result.previous_volume, 4)
+                if result.previous_mute is not None and result.mute is not None \
+                        and needs_mute(result.previous_mute, result.mute):
+                    mute = result.previous_mute
+                if (volume, mute) != self._entries.get(result.device_id, (None, None)):
+                    self._entries.pop(result.device_id, None)
+                    self._entries[result.device_id] = (volume, mute)
+                    changed = True
+
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+            self._dirty = self._dirty or changed
+        return changed
+
+    def entries(self) -> dict:
+        """
+        Return a copy of the device ID -> (volume, mute) map.
+        """
+        with self._lock:
+            return dict(self._entries)
+
+    def forget(self, device_id: str | None = None):
+        with self._lock:
+            if device_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(device_id, None)
+            self._dirty = True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self) -> 'VolumeSnapshot':
+        """
+        Read the snapshot file, if it exists and is of this version.
+        """
+        data = load_versioned(self.path, SNAPSHOT_VERSION)
+        if data is None:
+            return self
+        try:
+            entries = {device_id: (volume, mute) for device_id, volume, mute in data['devices']}
+        except (ValueError, TypeError, KeyError):
+            return self
+
+        with self._lock:
+            self._entries = entries
+            self._dirty = False
+        return self
+
+    def save(self):
+        """
+        Write the snapshot file in one write, if anything has changed since it was
+        read or written. Raise OSError if it cannot be written.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            data = dump_versioned(
+                SNAPSHOT_VERSION,
+                devices=[[device_id, volume, mute] for device_id, (volume, mute) in self._entries.items()],
+            )
+            self._dirty = False
+
+        try:
+            write_atomic(self.path, data)
+        except OSError:
+            self._dirty = True
+            raise
@@ -0,0 +1,65 @@
+"""
+Stand-in of the Win32 parts of ctypes (windll, WINFUNCTYPE), so that the tray
+application can be imported and set up on any OS, without a window.
+
+install() puts them into ctypes where they are missing, before win_auto_mute is
+imported. On Windows it does nothing. Every function of the stub DLLs returns 0
+and counts its calls in `calls`, so WinMain creates no window, and its message
+loop ends at once (GetMessage returns 0).
+
+benchmark_startup uses it to check the imports and time the start-up of the tray
+application on any OS.
+"""
+
+import ctypes
+from collections import Counter
+
+# 'dll.function' -> number of calls
+calls = Counter()
+
+
+class _Function:
+
+    def __init__(self, name: str):
+        self.__name__ = name
+        self.restype = None
+        self.argtypes = None
+
+    def __call__(self, *args):
+        calls[self.__name__] += 1
+        return 0
+
+
+class _Library:
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, name: str) -> _Function:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        function = _Function(f'{self._name}.{name}')
+        setattr(self, name, function)
+        return function
+
+
+class _LibraryLoader:
+
+    def __getattr__(self, name: str) -> _Library:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        library = _Library(name)
+        setattr(self, name, library)
+        return library
+
+
+def install() -> bool:
+    """
+    Add the stub windll and WINFUNCTYPE to ctypes if it has no windll.
+    Return True if the stub is installed.
+    """
+    if hasattr(ctypes, 'windll'):
+        return False
+    ctypes.windll = _LibraryLoader() # type: ignore
+    ctypes.WINFUNCTYPE = ctypes.CFUNCTYPE # type: ignore
+    return True
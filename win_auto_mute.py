@@ -1,13 +1,35 @@
-import json
+import sys
+import threading
+import time
+
+if __name__ == '__main__' and len(sys.argv) > 1:
+    # Command line mode. Run without the tray icon and the Win32 UI.
+    import mute_cli
+    sys.exit(mute_cli.main())
+
 from ctypes import (POINTER, WINFUNCTYPE, Structure, byref, c_char, c_int,
                     c_uint, c_ulong, c_void_p, create_string_buffer, pointer,
                     sizeof, windll)
 from ctypes.wintypes import MSG
 from pathlib import Path
 
-from get_path import (get_runtime_folder_path, get_script_basename,
-                      get_script_folder_path)
-from mute_speakers import mute_all_speakers, mute_current_speaker
+import audio_backend
+from device_registry import DeviceRegistry
+from get_path import get_runtime_folder_path
+import device_info
+from device_rules import DeviceRules
+from message_dispatch import MessageDispatcher
+import mute_log
+import mute_profile
+import mute_speakers
+from mute_schedule import MuteScheduler, parse_rule
+from mute_speakers import MutePlan
+from mute_triggers import GUID_CONSOLE_DISPLAY_STATE, MuteTriggers
+from mute_worker import MuteRequest, MuteWorker
+from session_registry import SessionRegistry, SessionRules
+from settings import Settings
+from settings_watcher import SettingsWatcher
+from volume_snapshot import VolumeSnapshot, is_recorded
 from winapi_constants import *
 
 GetDesktopWindow    = windll.user32.GetDesktopWindow
@@ -34,9 +56,28 @@ SendMessage         = windll.user32.SendMessageA
 PostMessage         = windll.user32.PostMessageA
 DestroyWindow       = windll.user32.DestroyWindow
 IsWindowVisible     = windll.user32.IsWindowVisible
+RegisterPowerSettingNotification   = windll.user32.RegisterPowerSettingNotification
+UnregisterPowerSettingNotification = windll.user32.UnregisterPowerSettingNotification
+WTSRegisterSessionNotification     = windll.Wtsapi32.WTSRegisterSessionNotification
+WTSUnRegisterSessionNotification   = windll.Wtsapi32.WTSUnRegisterSessionNotification
+SetTimer            = windll.user32.SetTimer
+KillTimer           = windll.user32.KillTimer
+GetLastInputInfo    = windll.user32.GetLastInputInfo
+GetTickCount        = windll.kernel32.GetTickCount
+RegisterPowerSettingNotification.restype = c_void_p
+GetTickCount.restype = c_uint
+UnregisterPowerSettingNotification.argtypes = [c_void_p]
 
 # Task tray icon message
 WM_TRAYICON    = (WM_APP + 1)
+# Settings file is reloaded
+WM_SETTINGS_CHANGED = (WM_APP + 2)
+# Audio backend is imported by the pre-warm
+WM_AUDIO_READY = (WM_APP + 3)
+# Mute worker finished a pass
+WM_MUTE_DONE = (WM_APP + 4)
+# Arm the mute plan for the event triggers
+WM_ARM_PLAN = (WM_APP + 5)
 
 # Menu ID
 ID_TRAY_SETTINGS = 1000
@@ -44,6 +85,29 @@ ID_PROCESS_NOW   = 1001
 ID_LICENSE       = 1002
 ID_TRAY_EXIT     = 1003
 
+# Parallel workers and deadline (sec) of the mute at the windows shutdown
+SHUTDOWN_WORKERS  = 4
+SHUTDOWN_DEADLINE = 4.0
+# Time (sec) to wait for the log to be written at the windows shutdown
+LOG_FLUSH_TIMEOUT = 0.5
+# Delay (sec) of the pre-warm of the audio backend after the tray icon is shown
+PREWARM_DELAY = 1.0
+# Interval (sec) of the rebuild of the mute plan kept armed for the event triggers.
+# The device registry re-arms it on device changes; the rebuild also recovers from
+# what the notifications do not tell, such as a restart of the audio service.
+STANDBY_PLAN_REFRESH = 3600.0
+# Interval (sec) of the checks that the device registry has settled before the
+# volumes are restored at the start, and the longest time (sec) to wait for it
+RESTORE_SETTLE   = 1.0
+RESTORE_MAX_WAIT = 10.0
+
+# Timer ID of the mute schedule
+ID_TIMER_SCHEDULE = 1
+# Timer ID of the restore of the volumes at the start
+ID_TIMER_RESTORE  = 2
+# Timer ID of the rebuild of the mute plan kept armed for the event triggers
+ID_TIMER_PLAN     = 3
+
 # Button ID
 ID_MUTE           = 100
 ID_SET_VOLUME     = 200
@@ -88,6 +152,10 @@ class NOTIFYICONDATA(Structure):
         ('hBalloonIcon',     c_void_p)
     ]
 
+class LASTINPUTINFO(Structure):
+    _fields_ = [("cbSize", c_uint),
+                ("dwTime", c_uint)]
+
 class POINT(Structure):
     _fields_ = [("x", c_ulong),
                 ("y", c_ulong)]
@@ -100,11 +168,9 @@ class RECT(Structure):
 
 # Task tray icon data
 nid = NOTIFYICONDATA()
-# Setting values
-val_mute    = True  # Mute audio device(s).
-val_volume  = False # Set the volume to zero.
-val_target  = True  # All speakers are targeted to process.
-val_logging = False # Not in the setting window. Need to set manually if you want.
+# Setting values (loaded in WinMain)
+settings = Settings()
+settings_watcher = None
 # Window handle values
 hmain       = None
 hchk_mute   = None
@@ -112,15 +178,47 @@ hchk_volume = None
 hchk_target = None
 hbtn_ok     = None
 hbtn_cancel = None
+# Mute plan pre-armed at WM_QUERYENDSESSION, or kept armed for the event triggers
+mute_plan = None
+# Audio devices kept up to date by the device notifications
+registry = None
+# True while a WM_ARM_PLAN posted by a device change is in the queue
+arm_plan_posted = False
+# Compiled rules of the 'device_rules' setting, and the value they were compiled from
+device_rules = DeviceRules()
+device_rules_value = None
+# Rules of the 'apps' setting, and the application sessions tracked for them
+session_rules = SessionRules()
+sessions = None
+# Data flows the sessions are tracked for
+sessions_tracked_for = None
+# Volumes and mute states of the devices before they were muted (loaded in WinMain)
+volume_snapshot = VolumeSnapshot()
+# (device registry generation, start time) while the restore waits for the registry
+restore_wait = None
+# Handle of the display state notification
+power_notify = None
+# Runs "Mute now" off the UI thread (started in WinMain)
+mute_worker = None
+# (request, report, error) of the passes finished by the mute worker
+mute_results = []
+# Tray popup menu, built once (see get_tray_menu)
+tray_menu = None
+# Whether the open source license file exists (checked once)
+oss_license_exists = None
 
 
 def resource_path() -> Path:
     return get_runtime_folder_path() / 'resources'
 
 
-def show_open_source_license():
+def open_source_license_file() -> Path:
     FILE_LICENCE = 'oss_license.html'
-    oss_license_file = resource_path() / FILE_LICENCE
+    return resource_path() / FILE_LICENCE
+
+
+def show_open_source_license():
+    oss_license_file = open_source_license_file()
     if oss_license_file.exists():
         import webbrowser
         url = 'file:///' + str(oss_license_file)
@@ -128,162 +226,605 @@ def show_open_source_license():
 
 
 def is_exist_open_source_license() -> bool:
-    FILE_LICENCE = 'oss_license.html'
-    oss_license_file = resource_path() / FILE_LICENCE
-    return oss_license_file.exists()
+    """
+    The license file is one of the bundled resources, which do not change while
+    the application runs, so the file is checked only once.
+    """
+    global oss_license_exists
 
+    if oss_license_exists is None:
+        oss_license_exists = open_source_license_file().exists()
+    return oss_license_exists
 
-def load_settings() -> dict:
-    script_path = get_script_folder_path()
-    basename = get_script_basename()
 
-    # json file full path name
-    json_file_name = script_path / (basename + '.json')
+def build_tray_menu():
+    hMenu = CreatePopupMenu()
+    AppendMenu(hMenu, MF_STRING, ID_TRAY_SETTINGS, b'Settings')
+    AppendMenu(hMenu, MF_STRING, ID_PROCESS_NOW, b'Mute now')
+    AppendMenu(hMenu, MF_SEPARATOR, None, None)
+    if is_exist_open_source_license():
+        AppendMenu(hMenu, MF_STRING, ID_LICENSE, b'Open source licenses')
+        AppendMenu(hMenu, MF_SEPARATOR, None, None)
+    AppendMenu(hMenu, MF_STRING, ID_TRAY_EXIT, b'Exit win_auto_mute')
+    return hMenu
 
-    # Load settings
-    if json_file_name.exists():
-        with open(json_file_name, 'r') as f:
-            settings = json.load(f)
+
+def get_tray_menu():
+    """
+    Return the tray menu. It is built on the first call and kept until the window
+    is destroyed: its items depend only on the bundled license file, which does
+    not change while the application runs.
+    """
+    global tray_menu
+
+    if tray_menu is None:
+        tray_menu = build_tray_menu()
+    return tray_menu
+
+
+def destroy_tray_menu():
+    global tray_menu
+
+    if tray_menu is not None:
+        DestroyMenu(tray_menu)
+        tray_menu = None
+
+
+def apply_settings():
+    """
+    Apply the settings which are not read on each mute, and the check boxes.
+    The 'backend' setting takes effect on the next start.
+    """
+    try:
+        mute_log.configure(
+            settings.get('log_format', mute_log.FORMAT_TEXT),
+            settings.get('log_max_bytes', 1024 * 1024),
+            settings.get('log_backups', 3),
+        )
+    except ValueError as e:
+        # Keep the current format.
+        if settings['logging']:
+            mute_log.mute_log(f'Log format is ignored: {e}')
+    if settings.get('profile', False):
+        mute_profile.enable(json_file=settings.get('profile_file'))
     else:
-        # Default settings
-        settings = {
-            'mute': True,
-            'volume': False,
-            'target': True,
-            'logging': False
-        }
-
-    return settings
-
-
-def save_settings():
-    script_path = get_script_folder_path()
-    basename = get_script_basename()
-
-    # json file full path name
-    json_file_name = script_path / (basename + '.json')
-
-    # Load settings for checking if 'logging' is exist.
-    settings = load_settings()
-    if 'logging' in settings:
-        settings = {
-            'mute': val_mute,
-            'volume': val_volume,
-            'target': val_target,
-            'logging': settings['logging']
-        }
+        mute_profile.disable()
+
+    global device_rules, device_rules_value, session_rules
+    if settings.get('device_rules') != device_rules_value:
+        # Compile only when changed, to keep the memoized decisions and the mute plan.
+        device_rules_value = settings.get('device_rules')
+        try:
+            device_rules = DeviceRules.from_setting(device_rules_value)
+        except ValueError as e:
+            device_rules = DeviceRules()
+            if settings['logging']:
+                mute_log.mute_log(f'Device rules are ignored: {e}')
+
+    try:
+        session_rules = SessionRules.from_setting(settings.get('apps'))
+    except ValueError as e:
+        session_rules = SessionRules()
+        if settings['logging']:
+            mute_log.mute_log(f'Apps are ignored: {e}')
+    if registry is not None or sessions is not None:
+        # Otherwise, the sessions are tracked when the audio backend is loaded.
+        refresh_sessions()
+
+    rules = []
+    for value in settings.get('schedule', []):
+        try:
+            rules.append(parse_rule(value))
+        except ValueError as e:
+            if settings['logging']:
+                mute_log.mute_log(f'Schedule is ignored: {e}')
+    scheduler.set_rules(rules)
+    forget_snapshot()
+
+    mute_triggers.enabled = set(settings.get('triggers', []))
+    if len(mute_triggers.enabled) > 0:
+        arm_standby_plan()
+    else:
+        disarm_mute_plan()
+        KillTimer(hmain, ID_TIMER_PLAN)
+
+    if IsWindowVisible(hmain) == 0:
+        # Do not overwrite the check boxes which are being edited.
+        SendMessage(hchk_mute,   BM_SETCHECK, (BST_CHECKED if settings['mute']   else BST_UNCHECKED), 0)
+        SendMessage(hchk_volume, BM_SETCHECK, (BST_CHECKED if settings['volume'] else BST_UNCHECKED), 0)
+        SendMessage(hchk_target, BM_SETCHECK, (BST_CHECKED if settings['target'] else BST_UNCHECKED), 0)
+
+
+def prewarm_audio():
+    """
+    Import the audio backend (comtypes, pycaw) on a background thread shortly after
+    the tray icon is shown, then post WM_AUDIO_READY to start the device registry
+    on the UI thread.
+    """
+    def run():
+        time.sleep(PREWARM_DELAY)
+        try:
+            audio_backend.preload()
+        except Exception:
+            # start_registry() fails too, and each mute enumerates the devices.
+            pass
+        PostMessage(hmain, WM_AUDIO_READY, 0, 0)
+
+    threading.Thread(target=run, name='prewarm', daemon=True).start()
+
+
+def start_registry():
+    """
+    Start the device registry. It must be stopped on the same (UI) thread.
+    """
+    global registry
+
+    if registry is not None:
+        return
+
+    registry = DeviceRegistry(on_change=on_registry_changed)
+    try:
+        registry.start(audio_backend.create_notification_source())
+    except Exception:
+        # Without notifications, the registry would go stale. Enumerate every time.
+        registry = None
+
+
+def on_registry_changed():
+    """
+    Called on the thread of a device change. Re-arm the mute plan kept for the
+    event triggers on the UI thread. A burst of changes (e.g. a device plugged in
+    changes its state and the default devices) posts one message.
+    """
+    global arm_plan_posted
+
+    if len(mute_triggers.enabled) > 0 and not arm_plan_posted:
+        arm_plan_posted = True
+        PostMessage(hmain, WM_ARM_PLAN, 0, 0)
+
+
+def on_arm_plan(hwnd, wParam, lParam):
+    global arm_plan_posted
+
+    arm_plan_posted = False
+    arm_standby_plan()
+
+
+def refresh_sessions():
+    """
+    Start, update or stop tracking the application sessions for the 'apps' rules.
+    Sessions belong to a device, so the tracking follows the active devices of the
+    device registry, device by device, and is restarted only when the 'devices'
+    setting has changed. It must be called on the UI thread.
+    """
+    global sessions, sessions_tracked_for
+
+    if not session_rules:
+        stop_sessions()
+        return
+
+    flows = mute_flows()
+    if sessions is not None and sessions_tracked_for == flows:
+        if sessions.rules != session_rules:
+            sessions.set_rules(session_rules)
+        if registry is not None:
+            update_sessions(flows)
+        return
+
+    stop_sessions()
+    sessions = SessionRegistry(session_rules)
+    try:
+        sessions.start(audio_backend.create_session_source(flows))
+        sessions_tracked_for = flows
+    except Exception as e:
+        sessions = None
+        if settings['logging']:
+            mute_log.mute_log(f'Apps cannot be tracked: {e}')
+
+
+def update_sessions(flows: tuple):
+    """
+    Pass the active devices of the registry to the session tracking. The backend
+    makes no COM call unless the registry has to be primed again.
+    """
+    try:
+        ca = audio_backend.create_backend(registry)
+        try:
+            device_ids = ca.audio_device_id_list(flows)
+        finally:
+            ca.close()
+        sessions.update(device_ids)
+    except Exception as e:
+        if settings['logging']:
+            mute_log.mute_log(f'Apps cannot be tracked: {e}')
+
+
+def stop_sessions():
+    global sessions, sessions_tracked_for
+
+    if sessions is not None:
+        sessions.stop()
+        sessions = None
+        sessions_tracked_for = None
+
+
+def mute_settings() -> tuple:
+    """
+    Return (mute, volume, target, logging) from the in-memory settings.
+    """
+    return (settings['mute'], settings['volume'], settings['target'], settings['logging'])
+
+
+def mute_flows() -> tuple:
+    """
+    Return the data flows of the devices to mute, from the 'devices' setting.
+    """
+    return mute_speakers.device_flows(settings.get('devices', 'speakers'))
+
+
+def recorded_snapshot() -> VolumeSnapshot | None:
+    """
+    Return the volume snapshot to record the mute to, or None if it is not recorded.
+    """
+    return volume_snapshot if is_recorded(settings.get('restore', False)) else None
+
+
+def forget_snapshot():
+    """
+    Clear the volume snapshot when the 'restore' setting is off, so that entries of
+    an old mute are not restored once it is turned on again.
+    """
+    if settings.get('restore', False) or len(volume_snapshot) == 0:
+        return
+    volume_snapshot.forget()
+    try:
+        volume_snapshot.save()
+    except OSError as e:
+        if settings['logging']:
+            mute_log.mute_log(f'Volume snapshot cannot be saved: {e}')
+
+
+def run_request(request: MuteRequest):
+    global registry
+
+    report = mute_speakers.process(
+        request.mute, request.vol, request.target, request.log,
+        request.workers, request.deadline, registry, request.trigger, request.flows,
+        sessions if session_rules else None, device_rules, recorded_snapshot()
+    )
+    dump_profile()
+    return report
+
+
+def dump_profile():
+    """
+    Write the phase timings of the pass, if profiling is on.
+    A profile file which cannot be written does not fail the mute, nor stop the
+    shutdown before the log and the settings are flushed.
+    """
+    if not mute_profile.enabled:
+        return
+    try:
+        mute_profile.dump()
+    except OSError as e:
+        mute_profile.clear()
+        mute_log.mute_log(f'Profile cannot be written: {e}')
+
+
+def process(workers: int = 0, deadline: float | None = None, trigger: str = 'mute_now'):
+    """
+    Run the mute on the calling thread.
+    """
+    return run_request(MuteRequest(*mute_settings(), trigger, workers, deadline, mute_flows()))
+
+
+def request_process(trigger: str = 'mute_now'):
+    """
+    Queue the mute to the mute worker, and return at once.
+    The worker posts WM_MUTE_DONE when it has finished.
+    """
+    if session_rules:
+        refresh_sessions()
+    if mute_worker is None:
+        process(trigger=trigger)
+        return
+    mute_worker.submit(MuteRequest(*mute_settings(), trigger, flows=mute_flows()))
+
+
+def on_mute_done(request: MuteRequest, report, error):
+    """
+    Called on the mute worker thread. Hand the result to the UI thread.
+    """
+    mute_results.append((request, report, error))
+    PostMessage(hmain, WM_MUTE_DONE, 0, 0)
+
+
+def mute_done():
+    """
+    Take the results of the finished passes on the UI thread.
+    """
+    while len(mute_results) > 0:
+        request, report, error = mute_results.pop(0)
+        if error is not None and request.log:
+            mute_log.mute_log(f'{request.trigger} - Error({error})')
+
+
+def arm_mute_plan():
+    """
+    Build the mute plan for a coming shutdown or trigger, unless a valid one is
+    already armed.
+    """
+    global mute_plan, registry
+
+    if session_rules:
+        # The application sessions are muted without a plan.
+        disarm_mute_plan()
+        return
+
+    values = mute_settings()
+    flows = mute_flows()
+    if mute_plan is not None and mute_plan.is_valid(*values, flows, device_rules):
+        return
+
+    disarm_mute_plan()
+    try:
+        mute_plan = MutePlan(*values, registry=registry, flows=flows, device_rules=device_rules, workers=SHUTDOWN_WORKERS)
+    except Exception:
+        # The backend failed, or a driver did not answer in time (TimeoutError).
+        # Fall back to the full process when the plan is needed.
+        mute_plan = None
+
+
+def arm_standby_plan(refresh: bool = False):
+    """
+    Keep the mute plan armed while an event trigger is enabled. The plan is armed
+    again on device changes (see on_registry_changed), and rebuilt every
+    STANDBY_PLAN_REFRESH seconds, or now if refresh is True.
+    Without the device registry, the plan would not notice device changes.
+    """
+    if len(mute_triggers.enabled) == 0 or registry is None:
+        KillTimer(hmain, ID_TIMER_PLAN)
+        return
+
+    if refresh:
+        disarm_mute_plan()
+    armed = mute_plan
+    arm_mute_plan()
+    if mute_plan is not armed and mute_plan is not None:
+        # Count the interval from the build of the plan.
+        SetTimer(hmain, ID_TIMER_PLAN, int(STANDBY_PLAN_REFRESH * 1000), None)
+
+
+def disarm_mute_plan():
+    global mute_plan
+
+    if mute_plan is not None:
+        mute_plan.close()
+        mute_plan = None
+
+
+def idle_seconds() -> float:
+    """
+    Return the time (sec) since the last keyboard or mouse input.
+    """
+    info = LASTINPUTINFO()
+    info.cbSize = sizeof(LASTINPUTINFO)
+    GetLastInputInfo(byref(info))
+    # Both are 32 bit tick counts, which wrap around after 49.7 days.
+    return ((GetTickCount() - info.dwTime) & 0xFFFFFFFF) / 1000
+
+
+def set_schedule_timer(seconds: float | None):
+    if seconds is None:
+        KillTimer(hmain, ID_TIMER_SCHEDULE)
     else:
-        settings = {
-            'mute': val_mute,
-            'volume': val_volume,
-            'target': val_target
-        }
+        # A timer longer than USER_TIMER_MAXIMUM fires early, and is armed again.
+        ms = min(max(int(seconds * 1000), USER_TIMER_MINIMUM), USER_TIMER_MAXIMUM)
+        SetTimer(hmain, ID_TIMER_SCHEDULE, ms, None)
+
+
+def on_timer(hwnd, wParam, lParam):
+    if wParam == ID_TIMER_SCHEDULE:
+        scheduler.on_timer()
+    elif wParam == ID_TIMER_RESTORE:
+        on_restore_timer()
+    elif wParam == ID_TIMER_PLAN:
+        arm_standby_plan(refresh=True)
+
+
+def schedule_restore():
+    """
+    Restore the volumes of the snapshot once the device registry has settled, if
+    the 'restore' setting is on. The devices are still arriving shortly after the
+    logon, so the restore waits until the registry has not changed for
+    RESTORE_SETTLE seconds, or RESTORE_MAX_WAIT seconds at most.
+    """
+    global restore_wait
+
+    if not settings.get('restore', False) or len(volume_snapshot) == 0:
+        return
+    restore_wait = (None if registry is None else registry.generation, time.monotonic())
+    SetTimer(hmain, ID_TIMER_RESTORE, int(RESTORE_SETTLE * 1000), None)
+
+
+def on_restore_timer():
+    global restore_wait
+
+    if restore_wait is None:
+        KillTimer(hmain, ID_TIMER_RESTORE)
+        return
+    generation, started = restore_wait
+    current = None if registry is None else registry.generation
+    if current != generation and time.monotonic() - started < RESTORE_MAX_WAIT:
+        # A device has changed since the last check. Wait for the next one.
+        restore_wait = (current, started)
+        return
+
+    KillTimer(hmain, ID_TIMER_RESTORE)
+    restore_wait = None
+    mute_speakers.restore_snapshot(volume_snapshot, settings['logging'], registry)
+    dump_profile()
+
+
+def run_mute_plan(trigger: str, deadline: float) -> bool:
+    """
+    Run the armed mute plan, or the full process if the plan is missing or stale.
+    Return True if the plan was run.
+    """
+    if mute_worker is not None:
+        # A "Mute now" waiting in the queue is covered by this pass.
+        mute_worker.cancel_pending()
+    if session_rules:
+        refresh_sessions()
+
+    if mute_plan is not None and not session_rules and mute_plan.is_valid(*mute_settings(), mute_flows(), device_rules):
+        mute_plan.run(deadline, trigger, recorded_snapshot())
+        dump_profile()
+        return True
+
+    process(SHUTDOWN_WORKERS, deadline, trigger)
+    return False
+
+
+def save_device_info():
+    """
+    Save the device info cache for the next start, if it has changed.
+    """
+    try:
+        device_info.shared_cache().save()
+    except OSError:
+        # The names are read from the devices again next time.
+        pass
+
 
-    # Save settings
-    with open(json_file_name, 'w') as f:
-        json.dump(settings, f)
+def process_shutdown():
+    run_mute_plan('shutdown', SHUTDOWN_DEADLINE)
+    disarm_mute_plan()
+    mute_log.flush(LOG_FLUSH_TIMEOUT)
+    settings.flush()
+    save_device_info()
 
 
-def process():
-    global val_mute, val_volume, val_target, val_logging
+def process_trigger(trigger: str, deadline: float):
+    """
+    Mute on a power or session event (see mute_triggers).
+    """
+    if not run_mute_plan(trigger, deadline):
+        # Arm the plan for the next event, after this message.
+        PostMessage(hmain, WM_ARM_PLAN, 0, 0)
 
-    if val_target:
-        mute_all_speakers(val_mute, val_volume, val_logging)
+
+def on_create(hwnd, wParam, lParam):
+    return 0
+
+
+def on_close(hwnd, wParam, lParam):
+    if IsWindowVisible(hmain) != 0:
+        # Setting window is been operating.
+        pass
     else:
-        mute_current_speaker(val_mute, val_volume, val_logging)
+        Shell_NotifyIcon(NIM_DELETE, pointer(nid))
+        DestroyWindow(hwnd)
 
 
-def WindowProc(hwnd, uMsg, wParam, lParam):
-    global nid
-    global val_mute, val_volume, val_target
-    global hmain, hchk_mute, hchk_volume, hchk_target, hbtn_ok, hbtn_cancel
+def on_destroy(hwnd, wParam, lParam):
+    if settings_watcher is not None:
+        settings_watcher.stop()
+    settings.flush()
+    if mute_worker is not None:
+        mute_worker.stop()
+    save_device_info()
+    destroy_tray_menu()
+    disarm_mute_plan()
+    stop_sessions()
+    if registry is not None:
+        registry.stop()
+    WTSUnRegisterSessionNotification(hwnd)
+    if power_notify is not None:
+        UnregisterPowerSettingNotification(power_notify)
+    PostQuitMessage(0)
 
-    if uMsg == WM_CREATE:
-        return 0
 
-    elif uMsg == WM_CLOSE:
-        if IsWindowVisible(hmain) != 0:
-            # Setting window is been operating.
-            pass
-        else:
-            Shell_NotifyIcon(NIM_DELETE, pointer(nid))
-            DestroyWindow(hwnd)
-        return 0
-
-    elif uMsg == WM_DESTROY:
-        PostQuitMessage(0)
-        return 0
-
-    elif uMsg == WM_TRAYICON:
-        lbytes = bytes(lParam)
-        action = int.from_bytes(lbytes, 'little')
-        if action == WM_RBUTTONDOWN or action == WM_LBUTTONDOWN:
-            # Get current cursor position
-            cursor = POINT()
-            GetCursorPos(byref(cursor))
-            # Create popup menu
-            hMenu = CreatePopupMenu()
-            AppendMenu(hMenu, MF_STRING, ID_TRAY_SETTINGS, b'Settings')
-            AppendMenu(hMenu, MF_STRING, ID_PROCESS_NOW, b'Mute now')
-            AppendMenu(hMenu, MF_SEPARATOR, None, None)
-            if is_exist_open_source_license():
-                AppendMenu(hMenu, MF_STRING, ID_LICENSE, b'Open source licenses')
-                AppendMenu(hMenu, MF_SEPARATOR, None, None)
-            AppendMenu(hMenu, MF_STRING, ID_TRAY_EXIT, b'Exit win_auto_mute')
-            # Show popup menu
-            SetForegroundWindow(hwnd)
-            TrackPopupMenu(hMenu, TPM_RIGHTBUTTON, cursor.x, cursor.y, 0, hwnd, None)
-            DestroyMenu(hMenu)
-        return 0
-
-    elif uMsg == WM_COMMAND:
-        if wParam == ID_TRAY_SETTINGS:
-            ShowWindow(hwnd, SW_SHOWNORMAL)
-            pass
-        elif wParam == ID_PROCESS_NOW:
-            process()
-            pass
-        elif wParam == ID_LICENSE:
-            show_open_source_license()
-            pass
-        elif wParam == ID_TRAY_EXIT:
-            PostMessage(hwnd, WM_CLOSE, 0, 0)
-            pass
-        else:
-            b = bytes(lParam)
-            h = int.from_bytes(b, 'little')
-            if h == hchk_mute:
-                pass
-            elif h == hchk_volume:
-                pass
-            elif h == hchk_target:
-                pass
-            elif h == hbtn_ok:
-                state_mute   = SendMessage(hchk_mute, BM_GETCHECK, 0, 0)
-                state_volume = SendMessage(hchk_volume, BM_GETCHECK, 0, 0)
-                state_target = SendMessage(hchk_target, BM_GETCHECK, 0, 0)
-                val_mute   = (state_mute   == BST_CHECKED)
-                val_volume = (state_volume == BST_CHECKED)
-                val_target = (state_target == BST_CHECKED)
-                save_settings()
-                ShowWindow(hmain, SW_HIDE)
-                pass
-            elif h == hbtn_cancel:
-                ShowWindow(hmain, SW_HIDE)
-                pass
-        return 0
-
-    elif uMsg == WM_ENDSESSION:
-        process()
-        return 0
-
-    return DefWindowProc(hwnd, uMsg, wParam, lParam)
+def on_tray_icon(hwnd, wParam, lParam):
+    if lParam == WM_RBUTTONDOWN or lParam == WM_LBUTTONDOWN:
+        # Get current cursor position
+        cursor = POINT()
+        GetCursorPos(byref(cursor))
+        # Show popup menu
+        SetForegroundWindow(hwnd)
+        TrackPopupMenu(get_tray_menu(), TPM_RIGHTBUTTON, cursor.x, cursor.y, 0, hwnd, None)
+
+
+def on_audio_ready(hwnd, wParam, lParam):
+    start_registry()
+    refresh_sessions()
+    arm_standby_plan()
+    schedule_restore()
+
+
+def on_query_end_session(hwnd, wParam, lParam):
+    arm_mute_plan()
+    # Allow the session to end.
+    return 1
+
+
+def on_end_session(hwnd, wParam, lParam):
+    process_shutdown()
+
+
+def on_ok(hwnd, wParam, lParam):
+    state_mute   = SendMessage(hchk_mute, BM_GETCHECK, 0, 0)
+    state_volume = SendMessage(hchk_volume, BM_GETCHECK, 0, 0)
+    state_target = SendMessage(hchk_target, BM_GETCHECK, 0, 0)
+    settings.update(
+        mute   = (state_mute   == BST_CHECKED),
+        volume = (state_volume == BST_CHECKED),
+        target = (state_target == BST_CHECKED),
+    )
+    ShowWindow(hmain, SW_HIDE)
+
+
+def on_cancel(hwnd, wParam, lParam):
+    ShowWindow(hmain, SW_HIDE)
+
+
+# Message handlers. The handlers of the controls are added in WinMain.
+dispatcher = MessageDispatcher()
+dispatcher.on_message(WM_CREATE,           on_create)
+dispatcher.on_message(WM_CLOSE,            on_close)
+dispatcher.on_message(WM_DESTROY,          on_destroy)
+dispatcher.on_message(WM_TRAYICON,         on_tray_icon)
+dispatcher.on_message(WM_SETTINGS_CHANGED, lambda hwnd, wParam, lParam: apply_settings())
+dispatcher.on_message(WM_AUDIO_READY,      on_audio_ready)
+dispatcher.on_message(WM_ARM_PLAN,         on_arm_plan)
+dispatcher.on_message(WM_MUTE_DONE,        lambda hwnd, wParam, lParam: mute_done())
+dispatcher.on_message(WM_QUERYENDSESSION,  on_query_end_session)
+dispatcher.on_message(WM_ENDSESSION,       on_end_session)
+dispatcher.on_command(ID_TRAY_SETTINGS,    lambda hwnd, wParam, lParam: ShowWindow(hwnd, SW_SHOWNORMAL))
+dispatcher.on_command(ID_PROCESS_NOW,      lambda hwnd, wParam, lParam: request_process())
+dispatcher.on_command(ID_LICENSE,          lambda hwnd, wParam, lParam: show_open_source_license())
+dispatcher.on_command(ID_TRAY_EXIT,        lambda hwnd, wParam, lParam: PostMessage(hwnd, WM_CLOSE, 0, 0))
+# Power and session events. The enabled triggers are set by apply_settings().
+mute_triggers = MuteTriggers(process_trigger, on_resume=lambda: scheduler.reschedule())
+mute_triggers.register(dispatcher)
+# Mute schedule. The rules are set by apply_settings().
+scheduler = MuteScheduler(request_process, set_schedule_timer, idle_seconds=idle_seconds)
+dispatcher.on_message(WM_TIMER,            on_timer)
+dispatcher.on_message(WM_TIMECHANGE,       lambda hwnd, wParam, lParam: scheduler.reschedule())
+
+
+def WindowProc(hwnd, uMsg, wParam, lParam):
+    # lParam is a pointer. Pass its value to the handlers.
+    result = dispatcher.dispatch(hwnd, uMsg, wParam, int.from_bytes(bytes(lParam), 'little'))
+    if result is None:
+        return DefWindowProc(hwnd, uMsg, wParam, lParam)
+    return result
 
 
 def WinMain(class_name, title_name):
     global nid
-    global val_mute, val_volume, val_target, val_logging
     global hmain, hchk_mute, hchk_volume, hchk_target, hbtn_ok, hbtn_cancel
+    global settings_watcher, mute_worker, power_notify
 
     hInstance = GetModuleHandle(None)
 
@@ -413,6 +954,13 @@ def WinMain(class_name, title_name):
         hInstance,
         None
     )
+    dispatcher.on_control(hbtn_ok,     on_ok)
+    dispatcher.on_control(hbtn_cancel, on_cancel)
+
+    # Power and session events of the triggers
+    WTSRegisterSessionNotification(hmain, NOTIFY_FOR_THIS_SESSION)
+    display_state = (c_char * 16).from_buffer_copy(GUID_CONSOLE_DISPLAY_STATE.bytes_le)
+    power_notify = RegisterPowerSettingNotification(hmain, byref(display_state), DEVICE_NOTIFY_WINDOW_HANDLE)
 
     # Task tray icon file
     icon_file = resource_path() / 'mute_t.ico'
@@ -428,21 +976,40 @@ def WinMain(class_name, title_name):
     nid.hIcon = LoadImage(None, icon_file, IMAGE_ICON, 0, 0, LR_LOADFROMFILE)
     nid.szTip = b'win_auto_mute'
     Shell_NotifyIcon(NIM_ADD, pointer(nid))
+    # Build the tray menu before the first click.
+    get_tray_menu()
 
     # Load settings
-    settings = load_settings()
-    if 'mute' in settings:
-        val_mute = settings['mute']
-    if 'volume' in settings:
-        val_volume = settings['volume']
-    if 'target' in settings:
-        val_target = settings['target']
-    SendMessage(hchk_mute,   BM_SETCHECK, (BST_CHECKED if val_mute   else BST_UNCHECKED), 0)
-    SendMessage(hchk_volume, BM_SETCHECK, (BST_CHECKED if val_volume else BST_UNCHECKED), 0)
-    SendMessage(hchk_target, BM_SETCHECK, (BST_CHECKED if val_target else BST_UNCHECKED), 0)
-    if 'logging' in settings:
-        val_logging = settings['logging']
-    pass
+    settings.load()
+    if 'backend' in settings:
+        audio_backend.set_backend(settings['backend'])
+    # Names of the devices known from the last run
+    device_info.shared_cache().load()
+    # Volumes of the devices before the last mute
+    volume_snapshot.load()
+    apply_settings()
+    if settings['logging']:
+        for error in settings.errors:
+            mute_log.mute_log(f'Setting is ignored: {error}')
+
+    # Reload the settings when the file is changed.
+    # The values are swapped on the watcher thread, and applied on this thread.
+    settings_watcher = SettingsWatcher(
+        settings,
+        lambda _: PostMessage(hmain, WM_SETTINGS_CHANGED, 0, 0)
+    )
+    settings_watcher.start()
+
+    # Mute worker
+    mute_worker = MuteWorker(run_request, on_mute_done)
+    mute_worker.start()
+
+    # Load the audio backend and start the device registry after the message loop
+    # has started, so that the tray icon does not wait for them.
+    # Without the pre-warm, they are loaded by the first mute, and each mute
+    # enumerates the devices. The restore of the volumes needs them at the start.
+    if settings.get('prewarm', True) or settings.get('restore', False):
+        prewarm_audio()
 
     # Window Message Structure
     msg = MSG()
@@ -52,14 +52,29 @@ COLOR_WINDOW = 5
 CS_VREDRAW   = 0x0001
 CS_HREDRAW   = 0x0002
 
-WM_CREATE      = 0x0001
-WM_CLOSE       = 0x0010
-WM_DESTROY     = 0x0002
-WM_LBUTTONDOWN = 0x0201
-WM_RBUTTONDOWN = 0x0204
-WM_COMMAND     = 0x0111
-WM_ENDSESSION  = 0x0016
-WM_APP         = 0x8000
+WM_CREATE            = 0x0001
+WM_CLOSE             = 0x0010
+WM_DESTROY           = 0x0002
+WM_LBUTTONDOWN       = 0x0201
+WM_RBUTTONDOWN       = 0x0204
+WM_COMMAND           = 0x0111
+WM_TIMER             = 0x0113
+WM_TIMECHANGE        = 0x001E
+WM_QUERYENDSESSION   = 0x0011
+WM_ENDSESSION        = 0x0016
+WM_POWERBROADCAST    = 0x0218
+WM_WTSSESSION_CHANGE = 0x02B1
+WM_APP               = 0x8000
+
+PBT_APMSUSPEND              = 0x0004
+PBT_APMRESUMEAUTOMATIC      = 0x0012
+PBT_POWERSETTINGCHANGE      = 0x8013
+DEVICE_NOTIFY_WINDOW_HANDLE = 0x00000000
+
+WTS_CONSOLE_DISCONNECT  = 0x2
+WTS_REMOTE_DISCONNECT   = 0x4
+WTS_SESSION_LOCK        = 0x7
+NOTIFY_FOR_THIS_SESSION = 0
 
 NIF_MESSAGE     = 0x00000001
 NIF_ICON        = 0x00000002
@@ -74,3 +89,20 @@ MF_STRING       = 0x0000
 MF_SEPARATOR    = 0x0800
 TPM_RIGHTBUTTON = 0x0002
 
+
+FILE_LIST_DIRECTORY           = 0x00000001
+FILE_SHARE_READ               = 0x00000001
+FILE_SHARE_WRITE              = 0x00000002
+FILE_SHARE_DELETE             = 0x00000004
+OPEN_EXISTING                 = 3
+FILE_FLAG_BACKUP_SEMANTICS    = 0x02000000
+FILE_FLAG_OVERLAPPED          = 0x40000000
+FILE_NOTIFY_CHANGE_FILE_NAME  = 0x00000001
+FILE_NOTIFY_CHANGE_SIZE       = 0x00000008
+FILE_NOTIFY_CHANGE_LAST_WRITE = 0x00000010
+INVALID_HANDLE_VALUE          = -1
+WAIT_OBJECT_0                 = 0x00000000
+INFINITE                      = 0xFFFFFFFF
+
+USER_TIMER_MINIMUM = 0x0000000A
+USER_TIMER_MAXIMUM = 0x7FFFFFFF